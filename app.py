@@ -1,11 +1,21 @@
 import streamlit as st
+import streamlit.components.v1 as components
 from dotenv import load_dotenv
 load_dotenv()
-from granite_utils import load_granite_model, process_text_with_granite
-from tts_utils import text_to_mp3_gtts
-from PyPDF2 import PdfReader
-import tempfile
+from granite_utils import load_default_granite_model, start_model_warmup, model_status
+from pipeline_utils import stream_audiobook, extract_stage, normalize_stage, rewrite_stage, synthesize_stage
+from mp3_utils import Mp3ConcatWriter
+from job_utils import JobQueue
+from metrics_utils import snapshot, profile_request, start_metrics_server
+from model_server import MODEL_SOCKET, RemoteGranite
+from media_utils import MediaServer, new_media_path, MEDIA_DIR
+from chapter_utils import split_into_chapters, render_chapters
+from pdf_utils import pdf_outline_titles
+from cache_utils import make_cache_key
+from document_utils import text_preview, PREVIEW_CHARS
 import os
+import uuid
+from contextlib import nullcontext
 
 st.set_page_config(page_title="EchoVerse", page_icon="📖", layout="centered")
 
@@ -138,6 +148,35 @@ hr {
 # ---------- UI ----------
 st.markdown('<div class="main-title">📖 EchoVerse</div>', unsafe_allow_html=True)
 st.markdown('<div class="subtitle">Transform your words into stunning, expressive audiobooks with AI & TTS magic.</div>', unsafe_allow_html=True)
+
+@st.cache_resource
+def get_granite_model():
+    # With a model server on this host, every app process shares its single model copy
+    if MODEL_SOCKET:
+        return RemoteGranite(MODEL_SOCKET)
+    # The same cached copy the background warm-up loads
+    return load_default_granite_model()
+
+# Load the model in the background so the page renders straight away
+if not MODEL_SOCKET:
+    start_model_warmup()
+# Expose stage metrics as JSON when ECHOVERSE_METRICS_PORT is set
+start_metrics_server()
+
+@st.fragment(run_every=2)
+def show_model_status():
+    status = model_status()
+    if status["status"] == "ready":
+        st.caption(f"🟢 IBM Granite ready (loaded in {status['load_seconds']:.0f}s)")
+    elif status["status"] == "failed":
+        st.caption("🔴 IBM Granite unavailable, basic narration formatting will be used")
+    else:
+        st.caption("🟡 Warming up IBM Granite... you can prepare your text meanwhile")
+
+if MODEL_SOCKET:
+    st.caption(f"🟢 Using the shared IBM Granite server at {MODEL_SOCKET}")
+else:
+    show_model_status()
 st.markdown('<hr>', unsafe_allow_html=True)
 
 st.markdown('<div class="block">', unsafe_allow_html=True)
@@ -164,22 +203,118 @@ with col_voice:
         ["Lisa", "Michael", "Allison", "Kate"],
         key="voice_select"
     )
+stream_audio = st.toggle(
+    "Start playback while the rest is still rendering",
+    value=True,
+    key="stream_toggle"
+)
+background_job = st.toggle(
+    "Render in the background (safe to close this tab)",
+    value=False,
+    key="job_toggle"
+)
+split_chapters = st.toggle(
+    "One audio file per chapter",
+    value=False,
+    key="chapter_toggle"
+)
 st.caption(f"Active Tone: {tone} | Active Voice: {voice_style}")
 st.markdown('</div>', unsafe_allow_html=True)
 
+# ---------- Background jobs ----------
+@st.cache_resource
+def get_job_queue():
+    return JobQueue(granite_loader=get_granite_model)
+
+@st.fragment(run_every=2)
+def show_job_progress(job_id):
+    status = get_job_queue().status(job_id)
+    if status["status"] in ("done", "failed"):
+        st.rerun()
+    total = status["segments_total"]
+    if total:
+        st.progress(status["segments_done"] / total, text=f"🎵 Segment {status['segments_done']} of {total} ready")
+    elif status["status"] == "running":
+        st.progress(0.0, text="📖 Preparing the text...")
+    else:
+        st.progress(0.0, text="⏳ Waiting for a worker...")
+
+# Starting the queue also resumes jobs left unfinished by a restart
+job_queue = get_job_queue()
+
+@st.cache_resource
+def get_media_server():
+    # Always started: Streamlit would otherwise load each whole MP3 into memory to serve it
+    try:
+        return MediaServer()
+    except OSError:
+        return None
+
+# Finished audiobooks are served from disk with range requests instead of from session memory
+media_server = get_media_server()
+if media_server is None:
+    st.warning("⚠️ The media server could not start, so audio is served by Streamlit and held in memory instead.")
+
+# Without the media server each streamed segment gets its own player. This chains them: when one
+# ends, the next plays, and a segment that arrives after the previous one ended starts on arrival.
+CHAIN_SEGMENTS_SCRIPT = """
+<script>
+const doc = window.parent.document;
+if (!doc.echoverseSegmentChain) {
+    doc.echoverseSegmentChain = true;
+    const selector = ".st-key-echoverse-segments audio";
+    let waiting = null;
+    const playNext = (player) => {
+        const players = Array.from(doc.querySelectorAll(selector));
+        const next = players[players.indexOf(player) + 1];
+        if (players.includes(player) && next) {
+            next.play();
+            return true;
+        }
+        return false;
+    };
+    doc.addEventListener("ended", (event) => {
+        if (event.target.matches && event.target.matches(selector)) {
+            waiting = playNext(event.target) ? null : event.target;
+        }
+    }, true);
+    new MutationObserver(() => {
+        if (waiting && (!doc.contains(waiting) || playNext(waiting))) {
+            waiting = null;
+        }
+    }).observe(doc.body, {childList: true, subtree: true});
+}
+</script>
+"""
+
+def audio_player(path, **kwargs):
+    """
+    Show a player for the audio file at path, from the media server when there is one
+    """
+    st.audio(media_server.url(path) if media_server else path, format="audio/mp3", **kwargs)
+
+def download_link(path, download_name, label="⬇️ Download Audiobook (MP3)"):
+    """
+    Offer the audio file at path for download, from the media server when there is one
+    """
+    if media_server:
+        st.link_button(label, media_server.url(path, download_name=download_name))
+    else:
+        with open(path, "rb") as f:
+            st.download_button(label, f, file_name=download_name, mime="audio/mpeg")
+
 # ---------- Functionality (unchanged) ----------
 text = ""
 if uploaded_file:
     file_type = uploaded_file.name.split('.')[-1]
     if file_type == "pdf":
         try:
-            pdf = PdfReader(uploaded_file)
-            text = "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
+            text = extract_stage(uploaded_file, "pdf")
         except Exception as e:
             st.error(f"❌ Error reading PDF file: {str(e)}")
     elif file_type == "txt":
         try:
-            text = uploaded_file.read().decode('utf-8')
+            text = extract_stage(uploaded_file, "txt")
         except Exception as e:
             st.error(f"❌ Error reading text file: {str(e)}")
 elif text_input:
@@ -189,52 +324,164 @@ if st.button("✨ Generate Audiobook"):
     if not text.strip():
         st.error("❌ Please provide some text or upload a file first.")
     else:
-        try:
-            with st.spinner("🔄 Processing your story with IBM Granite..."):
-                granite_pipe = load_granite_model()
-                processed_text = process_text_with_granite(
-                    text,
-                    tone=tone.lower(),
-                    style=voice_style,
-                    granite_pipe=granite_pipe
-                )
-            with st.spinner("🎵 Generating your audiobook..."):
+        watson_voice_map = {
+            "Lisa": "en-US_LisaV3Voice",
+            "Michael": "en-US_MichaelV3Voice",
+            "Allison": "en-US_AllisonV3Voice",
+            "Kate": "en-GB_KateV3Voice"
+        }
+        watson_voice = watson_voice_map.get(voice_style, "en-US_AllisonV3Voice")
+        if background_job:
+            job_id = job_queue.submit(text, tone=tone.lower(), style=voice_style, voice=watson_voice)
+            st.query_params["job"] = job_id
+            st.success(f"✅ Audiobook job {job_id[:8]} queued. Keep this link to check on it later.")
+        elif split_chapters:
+            titles = pdf_outline_titles(uploaded_file) if uploaded_file and file_type == "pdf" else None
+            chapters = split_into_chapters(text, titles)
+            # The folder follows the book, not its text, so an edited upload re-renders only the chapters
+            # that changed. The session keeps two users' books with the same file name apart.
+            session_id = st.session_state.setdefault("session_id", uuid.uuid4().hex)
+            source = uploaded_file.name if uploaded_file else "typed text"
+            try:
+                with st.spinner(f"🎵 Rendering {len(chapters)} chapters..."):
+                    book = render_chapters(
+                        chapters,
+                        os.path.join(MEDIA_DIR, make_cache_key(session_id, source, tone, voice_style)[:16]),
+                        tone=tone.lower(),
+                        style=voice_style,
+                        voice=watson_voice,
+                        granite_pipe=get_granite_model()
+                    )
                 st.markdown('<div class="block">', unsafe_allow_html=True)
-                st.write("#### Original vs Generated Text")
-                col_orig, col_gen = st.columns(2)
-                with col_orig:
-                    st.markdown("**Original Text**")
-                    st.write(text)
-                with col_gen:
-                    st.markdown("**Generated Text**")
-                    st.write(processed_text)
-                st.markdown('</div>', unsafe_allow_html=True)
-
-                watson_voice_map = {
-                    "Lisa": "en-US_LisaV3Voice",
-                    "Michael": "en-US_MichaelV3Voice",
-                    "Allison": "en-US_AllisonV3Voice",
-                    "Kate": "en-GB_KateV3Voice"
-                }
-                watson_voice = watson_voice_map.get(voice_style, "en-US_AllisonV3Voice")
-                from tts_utils import text_to_mp3_watson
-                tmp_mp3 = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-                text_to_mp3_watson(processed_text, voice=watson_voice, filename=tmp_mp3.name)
-                with open(tmp_mp3.name, "rb") as f:
-                    audio_bytes = f.read()
-                st.success("✅ Audiobook ready! Listen or download below.")
-                st.audio(audio_bytes, format="audio/mp3")
+                st.write("#### Chapters")
+                for chapter in book["chapters"]:
+                    if chapter["status"] == "failed":
+                        st.error(f"❌ {chapter['title']} failed: {chapter['error']}")
+                        continue
+                    minutes, seconds = divmod(round(chapter["duration"]), 60)
+                    st.markdown(f"**{chapter['title']}** ({minutes}:{seconds:02d})")
+                    audio_player(chapter["path"])
+                    download_link(chapter["path"], chapter["file"], label="⬇️ Download chapter")
+                with open(book["index"], encoding="utf-8") as f:
+                    playlist = f.read()
+                st.write("#### Playlist")
+                st.caption("Save the playlist next to the downloaded chapters to play the book in order.")
+                st.code(playlist, language=None)
                 st.download_button(
-                    label="⬇️ Download Audiobook (MP3)",
-                    data=audio_bytes,
-                    file_name="EchoVerse_Audiobook.mp3",
-                    mime="audio/mp3"
+                    "⬇️ Download playlist (M3U)",
+                    playlist,
+                    file_name=os.path.basename(book["index"]),
+                    mime="audio/x-mpegurl"
                 )
+                st.markdown('</div>', unsafe_allow_html=True)
+            except Exception as e:
+                st.error("Please check your internet connection and try again.")
+        else:
+            # Dumps a flame graph of this request when ECHOVERSE_PROFILE_DIR is set
+            with profile_request("generate") as profile_path:
                 try:
-                    os.unlink(tmp_mp3.name)
-                except Exception:
-                    pass
-        except Exception as e:
-            st.error("Please check your internet connection and try again.")
+                    with st.spinner("🔄 Processing your story with IBM Granite..."):
+                        granite_pipe = get_granite_model()
+                        # Each stage is memoized on its own inputs, so changing only the voice skips the rewrite
+                        normalized_text = normalize_stage(text)
+                        if not stream_audio:
+                            processed_text = rewrite_stage(
+                                normalized_text,
+                                tone=tone.lower(),
+                                style=voice_style,
+                                granite_pipe=granite_pipe
+                            )
+                    # The finished book stays on disk and is streamed to the player from there
+                    audio_path = new_media_path()
+                    if stream_audio:
+                        # Play each segment as soon as it is synthesized
+                        st.markdown('<div class="block">', unsafe_allow_html=True)
+                        st.write("#### Now playing")
+                        progress = st.progress(0.0, text="🎵 Rendering the first segment...")
+                        generated_parts = []
+                        # The media server streams the growing file to one player; without it each
+                        # segment gets its own Streamlit player and the players are chained
+                        live = media_server.live(audio_path) if media_server else nullcontext()
+                        if not media_server:
+                            components.html(CHAIN_SEGMENTS_SCRIPT, height=0)
+                            segments = st.container(key="echoverse-segments")
+                        with live, open(audio_path, "wb") as audio_file, Mp3ConcatWriter(audio_file) as writer:
+                            for segment in stream_audiobook(
+                                normalized_text,
+                                tone=tone.lower(),
+                                style=voice_style,
+                                voice=watson_voice,
+                                granite_pipe=granite_pipe
+                            ):
+                                writer.append(segment["audio"])
+                                audio_file.flush()
+                                generated_parts.append(segment["text"])
+                                progress.progress(
+                                    (segment["index"] + 1) / segment["total"],
+                                    text=f"🎵 Segment {segment['index'] + 1} of {segment['total']} ready"
+                                )
+                                if not media_server:
+                                    segments.audio(segment["audio"], format="audio/mp3", autoplay=segment["index"] == 0)
+                                elif segment["index"] == 0:
+                                    audio_player(audio_path, autoplay=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
+                        processed_text = "\n\n".join(generated_parts)
+                    with st.spinner("🎵 Generating your audiobook..."):
+                        st.markdown('<div class="block">', unsafe_allow_html=True)
+                        st.write("#### Original vs Generated Text")
+                        col_orig, col_gen = st.columns(2)
+                        # Only the opening of a long book is sent to the page
+                        with col_orig:
+                            st.markdown("**Original Text**")
+                            st.write(text_preview(text))
+                            if len(text) > PREVIEW_CHARS:
+                                st.caption(f"Showing the opening of {len(text):,} characters")
+                        with col_gen:
+                            st.markdown("**Generated Text**")
+                            st.write(text_preview(processed_text))
+                            if len(processed_text) > PREVIEW_CHARS:
+                                st.caption(f"Showing the opening of {len(processed_text):,} characters")
+                        st.markdown('</div>', unsafe_allow_html=True)
+
+                        if not stream_audio:
+                            synthesize_stage(processed_text, voice=watson_voice, filename=audio_path)
+                        st.success("✅ Audiobook ready! Listen or download below.")
+                        if not stream_audio:
+                            audio_player(audio_path)
+                        download_link(audio_path, "EchoVerse_Audiobook.mp3")
+                except Exception as e:
+                    st.error("Please check your internet connection and try again.")
+            with st.expander("⏱️ Performance breakdown (since server start)"):
+                stages = snapshot()["stages"]
+                st.table([
+                    {
+                        "Stage": name,
+                        "Calls": stage["count"],
+                        "Total (s)": round(stage["seconds"], 2),
+                        "Mean (ms)": round(stage["mean_ms"], 1),
+                        **{rate: round(value, 1) for rate, value in stage["rates"].items()}
+                    }
+                    for name, stage in stages.items()
+                ])
+                if profile_path:
+                    st.caption(f"Flame graph written to {profile_path}")
 else:
     st.caption("⚡ Tip: Try different tones and voice styles for more expressive results!")
+
+job_id = st.query_params.get("job")
+if job_id:
+    job_status = job_queue.status(job_id)
+    if job_status is None:
+        st.warning("⚠️ That audiobook job could not be found.")
+    else:
+        st.markdown('<div class="block">', unsafe_allow_html=True)
+        st.write(f"#### Audiobook job {job_id[:8]}")
+        if job_status["status"] == "done":
+            st.success("✅ Audiobook ready! Listen or download below.")
+            audio_player(job_status["output_path"])
+            download_link(job_status["output_path"], "EchoVerse_Audiobook.mp3")
+        elif job_status["status"] == "failed":
+            st.error(f"❌ Audiobook job failed: {job_status['error']}")
+        else:
+            show_job_progress(job_id)
+        st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,300 @@
+"""
+Headless batch conversion of a directory of books into audiobooks
+
+Convert every TXT and PDF file under a directory with:
+    python batch.py <input_dir> <output_dir> [options]
+
+Output mirrors the input tree with one MP3 per book. Each MP3 gets a small
+JSON manifest next to it recording the source hash and settings, so files
+whose output is already up to date are skipped on the next run.
+
+With --chapters each book becomes a directory of per-chapter MP3s with an
+M3U playlist index, and only chapters whose text changed are re-rendered.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cache_utils import make_cache_key
+from mp3_utils import Mp3ConcatWriter
+from tts_utils import (
+    get_watson_client, split_text_for_tts, iter_synthesized_chunks_watson, text_to_mp3_gtts,
+    TTS_MAX_WORKERS, WATSON_MAX_CHUNK_CHARS
+)
+
+BOOK_EXTENSIONS = (".txt", ".pdf")
+REPORT_NAME = "report.json"
+
+def find_books(input_dir):
+    """
+    Walk a directory for convertible books
+
+    Returns:
+        list[str]: Paths relative to input_dir, sorted
+    """
+    books = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith(BOOK_EXTENSIONS):
+                books.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(books)
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _settings_key(source_hash, args):
+    return make_cache_key(
+        source_hash, args.engine, args.backend, args.voice, args.language, args.tone, args.style,
+        "rewrite" if args.rewrite else "format", "chapters" if args.chapters else "book"
+    )
+
+def _manifest_path(output_path):
+    return output_path + ".json"
+
+def is_up_to_date(output_path, key):
+    """
+    Whether output_path exists and was rendered from the same source and settings
+    """
+    if not os.path.exists(output_path):
+        return False
+    try:
+        with open(_manifest_path(output_path), encoding="utf-8") as f:
+            return json.load(f).get("key") == key
+    except (OSError, ValueError):
+        return False
+
+def _write_manifest(book, args):
+    with open(_manifest_path(book["output"]), "w", encoding="utf-8") as f:
+        json.dump({"key": book["key"], "source": book["source"], "voice": args.voice}, f)
+
+def read_book(path):
+    """
+    Return the text of a TXT or PDF book
+    """
+    if path.lower().endswith(".pdf"):
+        from pdf_utils import extract_pdf_text
+
+        return extract_pdf_text(path)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+def rewrite_book(book, args, granite_pipe):
+    """
+    LLM stage: read the book and rewrite it for narration
+    """
+    from granite_utils import process_text_with_granite
+
+    start = time.perf_counter()
+    text = read_book(book["source"])
+    if not text.strip():
+        raise ValueError("No text could be extracted")
+    book["chars"] = len(text)
+    if args.chapters:
+        # Chapters are rewritten one by one as they are rendered
+        book["rewrite_seconds"] = time.perf_counter() - start
+        return text
+    enhanced = process_text_with_granite(
+        text, tone=args.tone, language=args.language, style=args.style,
+        granite_pipe=granite_pipe, batch_size=args.batch_size
+    )
+    book["rewrite_seconds"] = time.perf_counter() - start
+    return enhanced
+
+def synthesize_chapters(book, text, args, granite_pipe):
+    """
+    TTS stage for --chapters: render each chapter of the book into its output directory
+
+    Raises:
+        RuntimeError: If any chapter still failed after its retries
+    """
+    from chapter_utils import split_into_chapters, render_chapters
+
+    titles = None
+    if book["source"].lower().endswith(".pdf"):
+        from pdf_utils import pdf_outline_titles
+
+        titles = pdf_outline_titles(book["source"])
+    result = render_chapters(
+        split_into_chapters(text, titles), book["output"], tone=args.tone, style=args.style,
+        voice=args.voice, granite_pipe=granite_pipe, workers=args.chapter_workers
+    )
+    book["chapters"] = len(result["chapters"])
+    book["audio_bytes"] = sum(
+        os.path.getsize(chapter["path"]) for chapter in result["chapters"] if chapter["status"] != "failed"
+    )
+    if result["failed"]:
+        raise RuntimeError(f"{result['failed']} of {book['chapters']} chapters failed")
+
+def synthesize_book(book, text, args, granite_pipe=None):
+    """
+    TTS stage: render text to the book's MP3 and record its manifest
+    """
+    start = time.perf_counter()
+    output_path = book["output"]
+    if args.chapters:
+        synthesize_chapters(book, text, args, granite_pipe)
+        _write_manifest(book, args)
+        book["tts_seconds"] = time.perf_counter() - start
+        return
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    # Render next to the target and rename, so a crash never leaves a half-written book behind
+    partial_path = output_path + ".partial"
+    try:
+        if args.engine == "gtts":
+            text_to_mp3_gtts(text, language=args.gtts_language, filename=partial_path)
+        else:
+            chunks = split_text_for_tts(text, WATSON_MAX_CHUNK_CHARS)
+            if not chunks:
+                raise ValueError("No valid text provided for TTS conversion")
+            with open(partial_path, "wb") as audio_file, Mp3ConcatWriter(audio_file) as writer:
+                for audio in iter_synthesized_chunks_watson(
+                    get_watson_client(), chunks, args.voice, max_workers=args.tts_requests
+                ):
+                    writer.append(audio)
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    _write_manifest(book, args)
+    book["audio_bytes"] = os.path.getsize(output_path)
+    book["tts_seconds"] = time.perf_counter() - start
+
+def convert_directory(args):
+    """
+    Convert every out-of-date book under args.input_dir
+
+    The LLM and TTS stages run on separate pools, so one book is synthesized
+    while the next is still being rewritten.
+
+    Returns:
+        dict: Summary report with per-book results and throughput
+    """
+    started = time.perf_counter()
+    books = []
+    for relative in find_books(args.input_dir):
+        source = os.path.join(args.input_dir, relative)
+        output = os.path.join(args.output_dir, os.path.splitext(relative)[0] + ("" if args.chapters else ".mp3"))
+        book = {"source": source, "output": output, "status": "pending"}
+        book["key"] = _settings_key(_file_sha256(source), args)
+        if not args.force and is_up_to_date(output, book["key"]):
+            book["status"] = "skipped"
+        books.append(book)
+
+    pending = [book for book in books if book["status"] == "pending"]
+    granite_pipe = None
+    if pending and args.rewrite and args.model_socket:
+        from model_server import RemoteGranite
+
+        granite_pipe = RemoteGranite(args.model_socket)
+    elif pending and args.rewrite:
+        from granite_utils import load_granite_model
+
+        granite_pipe = load_granite_model(args.backend)
+
+    def fail(book, error):
+        book["status"] = "failed"
+        book["error"] = f"{type(error).__name__}: {error}"
+        if args.verbose:
+            traceback.print_exception(type(error), error, error.__traceback__)
+        print(f"FAILED {book['source']}: {book['error']}", file=sys.stderr)
+
+    with ThreadPoolExecutor(max_workers=args.llm_workers) as llm_pool, \
+            ThreadPoolExecutor(max_workers=args.tts_workers) as tts_pool:
+        rewrites = {llm_pool.submit(rewrite_book, book, args, granite_pipe): book for book in pending}
+        syntheses = {}
+        for future in as_completed(rewrites):
+            book = rewrites[future]
+            try:
+                text = future.result()
+            except Exception as e:
+                fail(book, e)
+                continue
+            syntheses[tts_pool.submit(synthesize_book, book, text, args, granite_pipe)] = book
+        for future in as_completed(syntheses):
+            book = syntheses[future]
+            try:
+                future.result()
+            except Exception as e:
+                fail(book, e)
+                continue
+            book["status"] = "converted"
+            print(f"converted {book['source']} -> {book['output']}")
+
+    elapsed = time.perf_counter() - started
+    converted = [book for book in books if book["status"] == "converted"]
+    chars = sum(book["chars"] for book in converted)
+    for book in books:
+        del book["key"]
+    return {
+        "input_dir": args.input_dir,
+        "output_dir": args.output_dir,
+        "files": len(books),
+        "converted": len(converted),
+        "skipped": sum(book["status"] == "skipped" for book in books),
+        "failed": sum(book["status"] == "failed" for book in books),
+        "wall_seconds": elapsed,
+        "input_chars": chars,
+        "chars_per_second": chars / elapsed if elapsed else 0.0,
+        "books_per_minute": len(converted) * 60 / elapsed if elapsed else 0.0,
+        "audio_bytes": sum(book["audio_bytes"] for book in converted),
+        "books": books
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a directory of TXT and PDF books into MP3 audiobooks")
+    parser.add_argument("input_dir", help="Directory searched recursively for .txt and .pdf files")
+    parser.add_argument("output_dir", help="Directory receiving one .mp3 per book and the report")
+    parser.add_argument("--engine", choices=("watson", "gtts"), default="watson")
+    parser.add_argument("--voice", default="en-US_AllisonV3Voice", help="IBM Watson voice name")
+    parser.add_argument("--gtts-language", default="en", help="Language code for gTTS")
+    parser.add_argument("--language", default="English", help="Narration language for the rewrite")
+    parser.add_argument("--tone", default="neutral")
+    parser.add_argument("--style", default="neutral")
+    parser.add_argument("--no-rewrite", dest="rewrite", action="store_false",
+                        help="Skip the Granite rewrite and only apply basic narration formatting")
+    parser.add_argument("--backend", default=None, help="Granite backend (fp32 or int8)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Rewrite windows generated per model call")
+    parser.add_argument("--model-socket", default=os.getenv("ECHOVERSE_MODEL_SOCKET"),
+                        help="Use the shared model server on this Unix socket instead of loading the model")
+    parser.add_argument("--llm-workers", type=int, default=1, help="Books rewritten concurrently")
+    parser.add_argument("--tts-workers", type=int, default=2, help="Books synthesized concurrently")
+    parser.add_argument("--tts-requests", type=int, default=TTS_MAX_WORKERS,
+                        help="Concurrent Watson requests per book, within the process-wide adaptive limit")
+    parser.add_argument("--chapters", action="store_true",
+                        help="Render each chapter to its own MP3 with a playlist index, in a directory per book")
+    parser.add_argument("--chapter-workers", type=int, default=None,
+                        help="Chapters of one book rendered concurrently (with --chapters)")
+    parser.add_argument("--force", action="store_true", help="Convert books even if their output is up to date")
+    parser.add_argument("--report", default=None, help=f"Report path (defaults to <output_dir>/{REPORT_NAME})")
+    parser.add_argument("--verbose", action="store_true", help="Print tracebacks for failed books")
+    args = parser.parse_args()
+    if args.chapters and args.engine != "watson":
+        parser.error("--chapters requires the watson engine")
+    if args.backend is None:
+        from granite_utils import GRANITE_BACKEND
+
+        args.backend = GRANITE_BACKEND
+
+    report = convert_directory(args)
+    report_path = args.report or os.path.join(args.output_dir, REPORT_NAME)
+    os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{report['files']} books: {report['converted']} converted, {report['skipped']} up to date, "
+          f"{report['failed']} failed in {report['wall_seconds']:.1f}s "
+          f"({report['chars_per_second']:.0f} chars/sec, {report['books_per_minute']:.1f} books/min)")
+    print(f"report written to {report_path}")
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
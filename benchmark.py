@@ -0,0 +1,1152 @@
+"""
+Benchmarks for the EchoVerse pipeline
+
+Run a single benchmark with:
+    python benchmark.py <name> [options]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def _synthetic_text(paragraphs=40, sentences=6):
+    """
+    Build a deterministic multi-paragraph document
+    """
+    sentence = "The lighthouse keeper watched the storm roll in across the grey water."
+    return "\n\n".join(" ".join([sentence] * sentences) for _ in range(paragraphs))
+
+def benchmark_granite_batching(args):
+    """
+    Compare generated tokens/sec of one-at-a-time and batched Granite rewriting
+    """
+    from granite_utils import (
+        load_default_granite_model, split_text_into_windows, create_enhancement_prompt,
+        generate_batch, _generate_rewrite, _max_new_tokens
+    )
+
+    granite_pipe = load_default_granite_model()
+    tokenizer = granite_pipe.tokenizer
+    windows = split_text_into_windows(_synthetic_text(args.paragraphs), tokenizer)
+    prompts = [create_enhancement_prompt(w["text"], "neutral", "English", "neutral") for w in windows]
+    budgets = [min(_max_new_tokens(w["tokens"]), args.max_new_tokens) for w in windows]
+
+    def count(outputs):
+        return sum(len(tokenizer.encode(o, add_special_tokens=False)) for o in outputs)
+
+    start = time.perf_counter()
+    sequential = [_generate_rewrite(granite_pipe, p, b) for p, b in zip(prompts, budgets)]
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = generate_batch(granite_pipe, prompts, budgets, batch_size=args.batch_size)
+    batched_time = time.perf_counter() - start
+
+    print(f"windows: {len(windows)}")
+    print(f"sequential: {count(sequential) / sequential_time:.1f} tokens/sec ({sequential_time:.1f}s)")
+    print(f"batched (batch_size={args.batch_size}): {count(batched) / batched_time:.1f} tokens/sec ({batched_time:.1f}s)")
+
+# A valid silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz) used as fake audio
+_SILENT_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+def _fake_iam_token(lifetime=3600):
+    """
+    Build an unsigned JWT response shaped like an IBM Cloud IAM token exchange
+    """
+    import base64
+
+    def encode(part):
+        return base64.urlsafe_b64encode(json.dumps(part).encode()).rstrip(b"=").decode()
+
+    now = int(time.time())
+    access_token = ".".join([
+        encode({"alg": "HS256", "typ": "JWT"}),
+        encode({"iat": now, "exp": now + lifetime}),
+        "c2lnbmF0dXJl"
+    ])
+    return {
+        "access_token": access_token,
+        "refresh_token": "fake-refresh-token",
+        "token_type": "Bearer",
+        "expires_in": lifetime,
+        "expiration": now + lifetime
+    }
+
+class FakeTTSServer:
+    """
+    Local stand-in for the Watson synthesize endpoint with injected latency and errors
+
+    Latency follows a curve: a fixed part plus a part per character, and
+    beyond `capacity` concurrent requests every request slows down in
+    proportion, so throughput stops growing there. More than
+    `max_concurrent` requests at once are rejected with a 429.
+    """
+
+    def __init__(self, latency=0.05, error_rate=0.0, rate_limit_rate=0.0, frames_per_char=0.1,
+                 latency_per_char=0.0, capacity=None, max_concurrent=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.frames_per_char = frames_per_char
+        self.latency_per_char = latency_per_char
+        self.capacity = capacity
+        self.max_concurrent = max_concurrent
+        self.counts = {"ok": 0, "error": 0, "rate_limited": 0, "token": 0}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def _record(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so client-side connection reuse is measurable
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.startswith("/identity/token"):
+                    fake._record("token")
+                    time.sleep(fake.latency)
+                    self._reply(200, json.dumps(_fake_iam_token()).encode(), "application/json")
+                    return
+                text = json.loads(body or b"{}").get("text", "")
+                with fake._lock:
+                    fake.in_flight += 1
+                    in_flight = fake.in_flight
+                    fake.peak_in_flight = max(fake.peak_in_flight, in_flight)
+                try:
+                    self._synthesize(text, in_flight)
+                finally:
+                    with fake._lock:
+                        fake.in_flight -= 1
+
+            def _synthesize(self, text, in_flight):
+                if fake.max_concurrent and in_flight > fake.max_concurrent:
+                    fake._record("rate_limited")
+                    self._reply(429, b'{"error": "Too Many Requests", "code": 429}', "application/json",
+                                {"Retry-After": "0.2"})
+                    return
+                slowdown = max(1.0, in_flight / fake.capacity) if fake.capacity else 1.0
+                time.sleep((fake.latency + fake.latency_per_char * len(text)) * slowdown)
+                roll = random.random()
+                if roll < fake.rate_limit_rate:
+                    fake._record("rate_limited")
+                    self._reply(429, b'{"error": "Too Many Requests", "code": 429}', "application/json",
+                                {"Retry-After": "0.2"})
+                elif roll < fake.rate_limit_rate + fake.error_rate:
+                    fake._record("error")
+                    self._reply(503, b'{"error": "Service Unavailable", "code": 503}', "application/json")
+                else:
+                    fake._record("ok")
+                    frames = max(1, int(len(text) * fake.frames_per_char))
+                    self._reply(200, _SILENT_MP3_FRAME * frames, "audio/mp3")
+
+            def _reply(self, status, payload, content_type, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+def _fake_watson_client(url):
+    """
+    Build a Watson client that talks to a local fake without IAM authentication
+    """
+    from ibm_watson import TextToSpeechV1
+    from ibm_cloud_sdk_core.authenticators import NoAuthAuthenticator
+
+    tts = TextToSpeechV1(authenticator=NoAuthAuthenticator())
+    tts.set_service_url(url)
+    return tts
+
+def _fixed_scheduler(workers):
+    """
+    A scheduler pinned to a worker count, for measuring fixed concurrency through the shared slot path
+    """
+    from scheduler_utils import AdaptiveScheduler
+
+    return AdaptiveScheduler("fixed", concurrency=workers, min_concurrency=workers, max_concurrency=workers)
+
+def benchmark_tts_pool(args):
+    """
+    Drive the bounded TTS worker pool against a fake server with latency and errors
+    """
+    from tts_utils import synthesize_chunks_watson
+
+    chunks = [f"Chunk {i}. " + "The tide turned slowly against the harbour wall. " * 6 for i in range(args.chunks)]
+    with FakeTTSServer(args.latency, args.error_rate, args.rate_limit_rate) as server:
+        tts = _fake_watson_client(server.url)
+        start = time.perf_counter()
+        try:
+            audio = synthesize_chunks_watson(tts, chunks, "en-US_AllisonV3Voice", max_workers=args.workers,
+                                             max_retries=args.retries, scheduler=_fixed_scheduler(args.workers))
+            outcome = f"all {len(audio)} chunks synthesized"
+        except RuntimeError as e:
+            outcome = f"failed: {e}"
+        elapsed = time.perf_counter() - start
+
+    chars = sum(len(c) for c in chunks)
+    print(outcome)
+    print(f"server responses: {server.counts}")
+    print(f"wall time: {elapsed:.2f}s, {chars / elapsed:.0f} chars/sec with {args.workers} workers")
+
+def _timed_audio(audio_chunks, start, seconds_mark):
+    """
+    Drain synthesized chunks, timing the first chunk and the first seconds_mark of audio
+
+    Returns:
+        tuple[float, float, float]: Seconds to the first chunk, to seconds_mark of audio, and audio seconds
+    """
+    first_chunk = mark = None
+    audio_seconds = 0.0
+    for audio in audio_chunks:
+        # Every fake frame is 1152 samples at 44.1 kHz
+        audio_seconds += len(audio) // len(_SILENT_MP3_FRAME) * 1152 / 44100
+        now = time.perf_counter() - start
+        first_chunk = first_chunk if first_chunk is not None else now
+        if mark is None and audio_seconds >= seconds_mark:
+            mark = now
+    return first_chunk, mark, audio_seconds
+
+def benchmark_scheduler(args):
+    """
+    Fixed chunking and concurrency vs the adaptive scheduler against a backend with a latency curve
+    """
+    import cache_utils
+    import tts_utils
+    from scheduler_utils import AdaptiveScheduler
+
+    text = _synthetic_corpus(args.kilobytes * 1024, seed=args.seed)
+    voice = "en-US_AllisonV3Voice"
+    scheduler = AdaptiveScheduler(
+        "watson", concurrency=tts_utils.TTS_INITIAL_WORKERS, max_concurrency=args.max_workers,
+        size=tts_utils.TTS_INITIAL_CHUNK_CHARS, min_size=tts_utils.TTS_MIN_CHUNK_CHARS,
+        max_size=tts_utils.WATSON_MAX_CHUNK_CHARS, size_step=tts_utils.TTS_CHUNK_STEP_CHARS,
+        target_latency=tts_utils.TTS_TARGET_LATENCY, classify=tts_utils._classify_tts_error
+    )
+    with FakeTTSServer(args.latency, args.error_rate, frames_per_char=args.frames_per_char,
+                       latency_per_char=args.latency_per_char, capacity=args.capacity,
+                       max_concurrent=args.max_concurrent) as server:
+        tts = _fake_watson_client(server.url)
+        fixed_chunks = tts_utils.split_text_for_tts(text, args.chunk_size)
+        runs = {
+            f"fixed ({args.chunk_size} chars, {args.workers} workers)":
+                lambda: tts_utils.iter_synthesized_chunks_watson(
+                    tts, fixed_chunks, voice, max_workers=args.workers, scheduler=_fixed_scheduler(args.workers)
+                ),
+            "adaptive": lambda: tts_utils.iter_synthesized_text_watson(tts, text, voice, scheduler=scheduler)
+        }
+        for label, run in runs.items():
+            # Cold cache for every run, so neither benefits from the other
+            cache_utils._cache = cache_utils.ContentCache(directory=tempfile.mkdtemp(prefix="echoverse-sched-cache-"))
+            before = dict(server.counts)
+            start = time.perf_counter()
+            try:
+                first_chunk, mark, audio_seconds = _timed_audio(run(), start, args.first_minutes * 60)
+                outcome = "ok"
+            except RuntimeError as e:
+                first_chunk = mark = None
+                audio_seconds = 0.0
+                outcome = f"failed: {e}"
+            elapsed = time.perf_counter() - start
+            responses = {name: server.counts[name] - before[name] for name in ("ok", "rate_limited", "error")}
+            print(f"{label}: {outcome}, {elapsed:.2f}s for {audio_seconds / 60:.1f} min of audio "
+                  f"({len(text) / elapsed:.0f} chars/sec)")
+            if first_chunk is not None:
+                mark_text = f"{mark:.2f}s" if mark is not None else "n/a"
+                print(f"  first audio {first_chunk:.2f}s, first {args.first_minutes} min of audio {mark_text}")
+            print(f"  responses: {responses}")
+            if label == "adaptive":
+                stats = scheduler.stats()
+                print(f"  settled at {stats['concurrency']} concurrent requests of {stats['size']} chars, "
+                      f"error rate {stats['error_rate']:.2f}")
+
+def benchmark_tts_client(args):
+    """
+    Per-request latency with a fresh client per request vs the shared client
+    """
+    from ibm_watson import TextToSpeechV1
+    from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+    from tts_utils import get_watson_client
+
+    def timed(make_client):
+        latencies = []
+        for i in range(args.requests):
+            start = time.perf_counter()
+            make_client().synthesize(f"Request {i}.", voice="en-US_AllisonV3Voice", accept="audio/mp3").get_result()
+            latencies.append(time.perf_counter() - start)
+        latencies.sort()
+        return latencies
+
+    with FakeTTSServer(latency=args.latency) as server:
+        iam_url = f"{server.url}/identity/token"
+
+        def fresh_client():
+            tts = TextToSpeechV1(authenticator=IAMAuthenticator("fake-key", url=iam_url))
+            tts.set_service_url(server.url)
+            return tts
+
+        results = {
+            "per-request client": timed(fresh_client),
+            "shared client": timed(lambda: get_watson_client("fake-key", server.url, iam_url=iam_url))
+        }
+        tokens = server.counts["token"]
+
+    for name, latencies in results.items():
+        p50 = latencies[len(latencies) // 2] * 1000
+        p95 = latencies[int(len(latencies) * 0.95) - 1] * 1000
+        print(f"{name}: p50 {p50:.1f} ms, p95 {p95:.1f} ms")
+    print(f"IAM token exchanges: {tokens} for {2 * args.requests} requests")
+
+def _generate_pdf(path, pages, lines_per_page=40):
+    """
+    Write a plain multi-page text PDF without any PDF library
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    line = "The archivist catalogued every letter that arrived at the old station."
+    for page in range(pages):
+        body = "\n".join(f"({line} Page {page + 1}, line {i + 1}.) Tj T*" for i in range(lines_per_page))
+        content = f"BT /F1 10 Tf 12 TL 40 800 Td\n{body}\nET".encode()
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+        content_id = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id)
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, obj in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n%s\nendobj\n" % (number, obj))
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+def _peak_rss_mb():
+    """
+    Peak resident set size of this process and its waited-for children, in MB
+    """
+    import resource
+
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return usage / 1024
+
+def _run_isolated(target, *args):
+    """
+    Run target in a fresh process and return its (wall seconds, peak RSS MB, result)
+
+    Raises:
+        RuntimeError: If target raises in the child, or the child dies without reporting
+    """
+    import multiprocessing
+    import queue
+    import traceback
+
+    def child(results):
+        try:
+            start = time.perf_counter()
+            result = target(*args)
+            results.put((None, (time.perf_counter() - start, _peak_rss_mb(), result)))
+        except BaseException:
+            results.put((traceback.format_exc(), None))
+
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    process = context.Process(target=child, args=(results,))
+    process.start()
+    while True:
+        try:
+            error, outcome = results.get(timeout=1.0)
+            break
+        except queue.Empty:
+            if process.exitcode is None:
+                continue
+            # The child may have reported just before exiting
+            try:
+                error, outcome = results.get(timeout=1.0)
+                break
+            except queue.Empty:
+                raise RuntimeError(
+                    f"{target.__name__} exited with code {process.exitcode} without a result"
+                ) from None
+    process.join()
+    if error:
+        raise RuntimeError(f"{target.__name__} failed in its benchmark process:\n{error}")
+    return outcome
+
+def _pdf_baseline(path):
+    from PyPDF2 import PdfReader
+
+    pdf = PdfReader(path)
+    text = "\n".join([page.extract_text() for page in pdf.pages if page.extract_text()])
+    return len(text)
+
+def _pdf_streaming(path, processes):
+    import pdf_utils
+    from pdf_utils import iter_pdf_pages
+
+    # Runs in its own process, so the shared pool is sized for this variant alone
+    pdf_utils.PDF_POOL_WORKERS = processes
+    try:
+        return sum(len(page) for page in iter_pdf_pages(path, processes=processes))
+    finally:
+        # A multiprocessing child waits for its own children before it exits
+        pdf_utils.shutdown_pool()
+
+def benchmark_pdf(args):
+    """
+    Compare the old double-extracting PDF reader with streaming and page-parallel extraction
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "book.pdf")
+        _generate_pdf(path, args.pages)
+        print(f"{args.pages}-page PDF, {os.path.getsize(path) / 1e6:.1f} MB")
+        variants = [
+            ("baseline (extract twice, join)", _pdf_baseline, (path,)),
+            ("streaming, 1 process", _pdf_streaming, (path, 1)),
+            (f"streaming, {args.processes} processes", _pdf_streaming, (path, args.processes)),
+        ]
+        for name, target, target_args in variants:
+            elapsed, rss, chars = _run_isolated(target, *target_args)
+            print(f"{name}: {elapsed:.2f}s, peak RSS {rss:.0f} MB, {chars} chars")
+
+def _granite_backend_run(backend, prompt, max_new_tokens):
+    """
+    Load one Granite backend and time a fixed-length generation
+    """
+    from granite_utils import load_granite_model, _generate_rewrite
+
+    start = time.perf_counter()
+    granite_pipe = load_granite_model(backend)
+    load_time = time.perf_counter() - start
+    _generate_rewrite(granite_pipe, prompt, 8)
+    start = time.perf_counter()
+    output = _generate_rewrite(granite_pipe, prompt, max_new_tokens)
+    generate_time = time.perf_counter() - start
+    tokens = len(granite_pipe.tokenizer.encode(output, add_special_tokens=False))
+    return load_time, generate_time, tokens
+
+def benchmark_granite_backend(args):
+    """
+    Latency, memory and output parity of the int8 backend against the fp32 baseline
+    """
+    from granite_utils import create_enhancement_prompt, GRANITE_BACKENDS
+
+    text = _synthetic_text(paragraphs=1, sentences=8)
+    prompt = create_enhancement_prompt(text, "neutral", "English", "neutral")
+    for backend in GRANITE_BACKENDS:
+        elapsed, rss, (load_time, generate_time, tokens) = _run_isolated(
+            _granite_backend_run, backend, prompt, args.max_new_tokens
+        )
+        print(f"{backend}: load {load_time:.1f}s, {tokens} tokens in {generate_time:.1f}s "
+              f"({tokens / generate_time:.1f} tokens/sec), peak RSS {rss:.0f} MB")
+
+    if args.parity:
+        from granite_utils import load_granite_model, compare_backends
+
+        prompts = [
+            create_enhancement_prompt(_synthetic_text(paragraphs=1, sentences=n), tone, "English", "neutral")
+            for n, tone in ((2, "neutral"), (4, "formal"), (6, "emotional"))
+        ]
+        parity = compare_backends(load_granite_model("fp32"), load_granite_model("int8"), prompts)
+        print(f"parity: top-1 agreement {parity['top1_agreement']:.3f}, "
+              f"mean KL {parity['mean_kl']:.4f} nats, greedy text similarity {parity['text_similarity']:.3f}")
+
+def benchmark_prefix_cache(args):
+    """
+    Time-to-first-token per chunk with and without the prompt header KV cache
+    """
+    import granite_utils
+    from granite_utils import load_default_granite_model, stream_generation, _build_prompts
+
+    granite_pipe = load_default_granite_model()
+    windows, prompts = _build_prompts(_synthetic_text(args.paragraphs), "formal", "English", "narration", granite_pipe)
+    # Warm up kernels so the first measured chunk is not penalised
+    for _ in stream_generation(granite_pipe, prompts[0], 1):
+        pass
+
+    for enabled in (False, True):
+        granite_utils.PREFIX_CACHE_ENABLED = enabled
+        granite_utils._prefix_cache.clear()
+        first_token = []
+        for prompt in prompts:
+            start = time.perf_counter()
+            stream = stream_generation(granite_pipe, prompt, args.max_new_tokens)
+            next(stream, None)
+            first_token.append(time.perf_counter() - start)
+            for _ in stream:
+                pass
+        label = "prefix cache" if enabled else "full prefill"
+        mean = sum(first_token) / len(first_token)
+        print(f"{label}: mean TTFT {mean * 1000:.0f} ms over {len(prompts)} chunks "
+              f"(first chunk {first_token[0] * 1000:.0f} ms, later chunks "
+              f"{sum(first_token[1:]) / max(len(first_token) - 1, 1) * 1000:.0f} ms)")
+
+def _forward_counter(model):
+    """
+    Count forward passes of a model; returns the count holder and the hook handle
+    """
+    calls = [0]
+
+    def hook(module, inputs, output):
+        calls[0] += 1
+
+    return calls, model.register_forward_hook(hook)
+
+def benchmark_speculative(args):
+    """
+    Rewrite throughput of Granite alone and with a draft model, and the draft acceptance rate
+
+    Every Granite forward pass in assisted generation verifies one run of
+    drafted tokens and yields the accepted ones plus one of its own, so
+    accepted = generated - verification passes, and each draft forward pass
+    proposes one token.
+    """
+    import torch
+    from granite_utils import (
+        load_granite_model, _build_prompts, _generate_rewrite, _max_new_tokens,
+        GRANITE_DRAFT_MODEL, DEFAULT_DRAFT_MODEL
+    )
+
+    draft_model = args.draft_model or GRANITE_DRAFT_MODEL or DEFAULT_DRAFT_MODEL
+    granite_pipe = load_granite_model(args.backend, draft_model=draft_model)
+    draft = getattr(granite_pipe, "draft_model", None)
+    if draft is None:
+        raise SystemExit(f"Draft model '{draft_model}' could not be loaded")
+    tokenizer = granite_pipe.tokenizer
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = _synthetic_text(args.paragraphs)
+    windows, prompts = _build_prompts(text, "neutral", "English", "narration", granite_pipe)
+    budgets = [min(_max_new_tokens(w["tokens"]), args.max_new_tokens) for w in windows]
+    target_calls, target_hook = _forward_counter(granite_pipe.model)
+    draft_calls, draft_hook = _forward_counter(draft)
+
+    results = {}
+    for label, assistant in (("granite", None), ("speculative", draft)):
+        granite_pipe.draft_model = assistant
+        _generate_rewrite(granite_pipe, prompts[0], 8)
+        torch.manual_seed(args.seed)
+        target_calls[0] = draft_calls[0] = 0
+        tokens = 0
+        start = time.perf_counter()
+        for prompt, budget in zip(prompts, budgets):
+            output = _generate_rewrite(granite_pipe, prompt, budget)
+            tokens += len(tokenizer.encode(output, add_special_tokens=False))
+        elapsed = time.perf_counter() - start
+        results[label] = tokens / elapsed
+        line = f"{label}: {tokens} tokens in {elapsed:.1f}s ({tokens / elapsed:.1f} tokens/sec)"
+        if assistant is not None and draft_calls[0]:
+            accepted = max(tokens - target_calls[0], 0)
+            line += (f", acceptance rate {accepted / draft_calls[0]:.2f} "
+                     f"({tokens / target_calls[0]:.2f} tokens per Granite pass)")
+        print(line)
+    target_hook.remove()
+    draft_hook.remove()
+    granite_pipe.draft_model = draft
+    print(f"windows: {len(windows)}, speed-up {results['speculative'] / results['granite']:.2f}x")
+
+def _legacy_clean_text_for_tts(text):
+    """
+    The multi-pass cleaner this repo used before normalize_for_tts, minus its 4500-char cap
+    """
+    text = " ".join(text.split())
+    replacements = {
+        "\u201c": '"', "\u201d": '"', "\u2018": "'", "\u2019": "'",
+        "\u2014": "-", "\u2013": "-", "\u2026": "...",
+        "\n\n": ". ", "\n": " ", "\t": " "
+    }
+    for old, new in replacements.items():
+        text = text.replace(old, new)
+    text = text.strip()
+    if text and not text.endswith(('.', '!', '?')):
+        text += '.'
+    return text
+
+def benchmark_normalize(args):
+    """
+    Throughput of TTS text normalization on multi-megabyte input
+    """
+    from tts_utils import normalize_for_tts, TextNormalizer
+
+    paragraph = ("\u201cIt\u2019s late,\u201d she said \u2014 quietly.  The  train\u2026 was gone!\t"
+                 "Was it? Yes, it was.\n")
+    text = (paragraph + "\n") * (args.megabytes * 1024 * 1024 // (len(paragraph) + 1))
+    megabytes = len(text.encode("utf-8")) / 1e6
+
+    def measure(name, fn):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        print(f"{name}: {best * 1000:.0f} ms, {megabytes / best:.1f} MB/s")
+
+    def streamed():
+        normalizer = TextNormalizer()
+        for start in range(0, len(text), 64 * 1024):
+            normalizer.feed(text[start:start + 64 * 1024])
+        normalizer.close()
+
+    print(f"input: {megabytes:.1f} MB")
+    measure("clean (legacy multi-pass)", lambda: _legacy_clean_text_for_tts(text))
+    measure("normalize_for_tts (single pass + sentence offsets)", lambda: normalize_for_tts(text))
+    measure("TextNormalizer (64 KB chunks)", streamed)
+
+def _import_seconds(statement):
+    """
+    Time an import statement in a fresh interpreter
+    """
+    code = f"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def _first_request_latency(preload, think_time, prompt, max_new_tokens):
+    """
+    Seconds from a user's first request to its rewrite, with or without background preloading
+    """
+    from granite_utils import load_default_granite_model, start_model_warmup, _generate_rewrite
+
+    if preload:
+        start_model_warmup()
+    # The user spends some time entering text before asking for a rewrite
+    time.sleep(think_time)
+    start = time.perf_counter()
+    _generate_rewrite(load_default_granite_model(), prompt, max_new_tokens)
+    return time.perf_counter() - start
+
+def benchmark_startup(args):
+    """
+    Module import cost and first-request latency with and without model warm-up
+    """
+    from granite_utils import create_enhancement_prompt
+
+    for statement in ("import granite_utils", "import torch, transformers"):
+        best = min(_import_seconds(statement) for _ in range(args.repeat))
+        print(f"{statement}: {best * 1000:.0f} ms")
+
+    prompt = create_enhancement_prompt(_synthetic_text(paragraphs=1, sentences=4), "neutral", "English", "neutral")
+    for preload in (False, True):
+        _, _, latency = _run_isolated(_first_request_latency, preload, args.think_time, prompt, args.max_new_tokens)
+        label = "background warm-up" if preload else "load on first request"
+        print(f"{label}: first request after {args.think_time:.0f}s took {latency:.1f}s")
+
+# Stored results the end-to-end benchmark compares against
+E2E_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+_E2E_METRICS = ("wall_seconds", "time_to_first_audio", "peak_rss_mb")
+
+def _synthetic_corpus(size, seed=0):
+    """
+    Build a deterministic, varied book of about size bytes
+
+    Words, sentence lengths and paragraph lengths are drawn from a seeded
+    generator, and some sentences carry dialogue and typographic punctuation,
+    so tokenization, windowing and normalization see realistic input.
+    """
+    rng = random.Random(seed)
+    syllables = ["ka", "lo", "mi", "ren", "tha", "vor", "el", "an", "is", "dun", "sha", "por", "qui", "te"]
+    words = ["".join(rng.choice(syllables) for _ in range(rng.randint(1, 3))) for _ in range(2000)]
+    paragraphs = []
+    length = 0
+    while length < size:
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            sentence = " ".join(rng.choice(words) for _ in range(rng.randint(6, 20))).capitalize()
+            if rng.random() < 0.2:
+                sentence = f"\u201c{sentence},\u201d she said \u2014 quietly"
+            sentences.append(sentence + rng.choice([".", ".", ".", "!", "?", "\u2026"]))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph.encode("utf-8")) + 2
+    return "\n\n".join(paragraphs)
+
+def _tiny_causal_lm(seed=0):
+    """
+    Build a small randomly initialised GPT-2 with a BPE tokenizer trained on synthetic text
+
+    It stands in for Granite so the whole rewrite path (windowing, prefix
+    cache, batching, decoding) runs offline and reproducibly in seconds.
+    """
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast, pipeline
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=2048, special_tokens=["<|endoftext|>"], initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    )
+    tokenizer.train_from_iterator([_synthetic_corpus(256 * 1024, seed=seed + 1)], trainer=trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|endoftext|>")
+
+    torch.manual_seed(seed)
+    config = GPT2Config(
+        vocab_size=len(tokenizer), n_positions=2048, n_embd=64, n_layer=2, n_head=2,
+        bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id
+    )
+    model = GPT2LMHeadModel(config).eval()
+    return pipeline("text-generation", model=model, tokenizer=tokenizer)
+
+def _e2e_run(text, server_url, args):
+    """
+    Run the app's classic flow on one document: rewrite, clean, then chunked Watson TTS
+    """
+    import torch
+    import cache_utils
+    import granite_utils
+    import metrics_utils
+    import tts_utils
+
+    # Cold caches for every size, so no run benefits from an earlier one
+    cache_utils._cache = cache_utils.ContentCache(directory=tempfile.mkdtemp(prefix="echoverse-e2e-cache-"))
+    granite_utils.MAX_NEW_TOKENS_PER_CHUNK = args.max_new_tokens
+    granite_pipe = _tiny_causal_lm()
+    client = _fake_watson_client(server_url)
+    tts_utils.get_watson_client = lambda *a, **k: client
+    first_audio = []
+
+    class FirstAudioWriter(tts_utils.Mp3ConcatWriter):
+        def append(self, data):
+            if not first_audio:
+                first_audio.append(time.perf_counter())
+            super().append(data)
+
+    tts_utils.Mp3ConcatWriter = FirstAudioWriter
+    output = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
+    output.close()
+    torch.manual_seed(args.seed)
+    metrics_utils.reset_metrics()
+
+    start = time.perf_counter()
+    with metrics_utils.span("e2e.rewrite"):
+        processed = granite_utils.process_text_with_granite(
+            text, "neutral", "English", "neutral", granite_pipe, batch_size=args.batch_size, use_cache=False
+        )
+    with metrics_utils.span("e2e.clean"):
+        cleaned = tts_utils.clean_text_for_tts(processed)
+    with metrics_utils.span("e2e.tts"):
+        tts_utils.text_to_mp3_watson_fast(cleaned, filename=output.name, chunk_size=args.chunk_size,
+                                          max_workers=args.workers)
+    wall = time.perf_counter() - start
+
+    audio_bytes = os.path.getsize(output.name)
+    os.unlink(output.name)
+    stages = metrics_utils.snapshot()["stages"]
+    return {
+        "input_bytes": len(text.encode("utf-8")),
+        "wall_seconds": wall,
+        "time_to_first_audio": first_audio[0] - start if first_audio else None,
+        "audio_bytes": audio_bytes,
+        "stages": {name: round(stage["seconds"], 4) for name, stage in stages.items()}
+    }
+
+def _parse_size(value):
+    units = {"KB": 1024, "MB": 1024 * 1024}
+    value = value.strip().upper()
+    for suffix, factor in units.items():
+        if value.endswith(suffix):
+            return int(float(value[:-len(suffix)]) * factor)
+    return int(value)
+
+def _compare_to_baseline(results, baseline, tolerance):
+    """
+    Return regression messages for metrics that grew beyond the tolerance
+    """
+    regressions = []
+    for size, result in results.items():
+        reference = baseline.get("results", {}).get(size)
+        if reference is None:
+            continue
+        for metric in _E2E_METRICS:
+            new, old = result.get(metric), reference.get(metric)
+            if new is None or not old:
+                continue
+            change = new / old - 1
+            marker = "REGRESSION" if change > tolerance else "ok"
+            print(f"  {size} {metric}: {old:.3f} -> {new:.3f} ({change:+.1%}) {marker}")
+            if change > tolerance:
+                regressions.append(f"{size} {metric} {change:+.1%}")
+    return regressions
+
+def benchmark_e2e(args):
+    """
+    Full rewrite, clean and TTS flow on synthetic books, checked against a stored baseline
+    """
+    import platform
+
+    results = {}
+    with FakeTTSServer(latency=args.latency, frames_per_char=args.frames_per_char) as server:
+        for size_name in args.sizes.split(","):
+            text = _synthetic_corpus(_parse_size(size_name), seed=args.seed)
+            _, rss, result = _run_isolated(_e2e_run, text, server.url, args)
+            result["peak_rss_mb"] = rss
+            results[size_name.strip()] = result
+            breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in result["stages"].items())
+            first_audio = result["time_to_first_audio"]
+            print(f"{size_name.strip()}: wall {result['wall_seconds']:.2f}s, "
+                  f"first audio {first_audio if first_audio is None else f'{first_audio:.2f}s'}, "
+                  f"peak RSS {rss:.0f} MB")
+            print(f"  stages: {breakdown}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "settings": {key: getattr(args, key) for key in (
+                    "latency", "frames_per_char", "max_new_tokens", "batch_size", "chunk_size", "workers", "seed"
+                )},
+                "results": results
+            }, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"compared with baseline from {baseline.get('created')}:")
+    regressions = _compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regressions beyond {args.tolerance:.0%}: {'; '.join(regressions)}")
+        sys.exit(1)
+
+def _write_corpus(path, megabytes):
+    with open(path, "wb") as f:
+        f.write(_synthetic_corpus(megabytes * 1024 * 1024).encode("utf-8"))
+
+def _memory_text(path, decode):
+    """
+    Decode a text upload held in memory the way Streamlit holds it
+    """
+    import io
+
+    with open(path, "rb") as f:
+        upload = io.BytesIO(f.read())
+    baseline = _peak_rss_mb()
+    text = decode(upload)
+    return len(text), baseline
+
+def _memory_text_file(path):
+    from pipeline_utils import decode_text_source
+
+    return len(decode_text_source(path)), _peak_rss_mb()
+
+def _legacy_decode(upload):
+    return upload.read().decode("utf-8")
+
+def _copying_decode(upload):
+    # Any access that exports or slices the buffer forces a full copy first
+    return bytes(upload.getbuffer()).decode("utf-8")
+
+def _memory_audio_legacy(path):
+    baseline = _peak_rss_mb()
+    with open(path, "rb") as f:
+        audio_bytes = f.read()
+    # st.audio and st.download_button each keep their own copy in the media file manager
+    copies = [bytes(audio_bytes), bytes(audio_bytes)]
+    return sum(len(c) for c in copies), baseline
+
+def _memory_audio_streaming(path):
+    import urllib.request
+    from media_utils import MediaServer
+
+    baseline = _peak_rss_mb()
+    server = MediaServer(port=0)
+    port = server._server.server_address[1]
+    url = server.url(path).replace(server.base_url, f"http://127.0.0.1:{port}")
+    received = 0
+    # A full download, then the player seeking to the middle
+    for headers in ({}, {"Range": f"bytes={os.path.getsize(path) // 2}-"}):
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+            for block in iter(lambda: response.read(1024 * 1024), b""):
+                received += len(block)
+    server.close()
+    return received, baseline
+
+def benchmark_memory(args):
+    """
+    Peak RSS of decoding a large text upload and serving a large audiobook
+    """
+    from pipeline_utils import decode_text_source
+
+    print(f"input size: {args.megabytes} MB")
+    with tempfile.NamedTemporaryFile(suffix=".txt", delete=False) as f:
+        pass
+    # Build the corpus in its own process so this one stays small for the forked measurements
+    _run_isolated(_write_corpus, f.name, args.megabytes)
+    try:
+        for name, decode in (("text upload, read().decode", _legacy_decode),
+                             ("text upload, getbuffer copy", _copying_decode),
+                             ("text upload, decode_text_source", decode_text_source)):
+            _, rss, (chars, baseline) = _run_isolated(_memory_text, f.name, decode)
+            print(f"{name}: peak RSS {rss:.0f} MB ({rss - baseline:+.0f} MB over the upload buffer)")
+        _, rss, (chars, baseline) = _run_isolated(_memory_text_file, f.name)
+        print(f"text file, decode_text_source by path: peak RSS {rss:.0f} MB")
+    finally:
+        os.unlink(f.name)
+
+    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
+        frames = args.megabytes * 1024 * 1024 // len(_SILENT_MP3_FRAME)
+        for _ in range(0, frames, 1024):
+            f.write(_SILENT_MP3_FRAME * 1024)
+    try:
+        for name, target in (("audio, bytes to st.audio + download", _memory_audio_legacy),
+                             ("audio, MediaServer range streaming", _memory_audio_streaming)):
+            _, rss, (served, baseline) = _run_isolated(target, f.name)
+            print(f"{name}: {served / 1e6:.0f} MB handed out, peak RSS {rss:.0f} MB ({rss - baseline:+.0f} MB)")
+    finally:
+        os.unlink(f.name)
+
+_LEGACY_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_LEGACY_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+
+def _write_book(path, size):
+    """
+    Write a synthetic book of about size bytes, hard-wrapped at 72 columns like a plain-text ebook
+    """
+    wrap = re.compile(r"(.{1,72})(?: |$)")
+    with open(path, "w", encoding="utf-8") as f:
+        for paragraph in _synthetic_corpus(size).split("\n\n"):
+            f.write(wrap.sub(lambda match: match.group(1) + "\n", paragraph) + "\n")
+
+def _legacy_sentences(text):
+    paragraphs = []
+    for paragraph in _LEGACY_PARAGRAPH_SPLIT.split(text):
+        paragraph = " ".join(paragraph.split())
+        if paragraph:
+            paragraphs.append([s for s in _LEGACY_SENTENCE_SPLIT.split(paragraph) if s])
+    return paragraphs
+
+def _legacy_text_chain(text, max_tokens, context_tokens):
+    """
+    The string-copy chain this repo used before Document: normalize, sentence lists,
+    joined windows and context tails, replace-chain formatting, and the full texts sent to the page
+    """
+    paragraphs = (" ".join(p.split()) for p in _LEGACY_PARAGRAPH_SPLIT.split(text.replace("\r\n", "\n")))
+    normalized = "\n\n".join(p for p in paragraphs if p)
+    windows = []
+    current, current_tokens = [], 0
+    for paragraph in _legacy_sentences(normalized):
+        for index, sentence in enumerate(paragraph):
+            sentence_tokens = len(sentence.split())
+            if current and current_tokens + sentence_tokens > max_tokens:
+                windows.append("".join(current).strip())
+                current, current_tokens = [], 0
+            separator = "\n\n" if index == 0 and current else " "
+            current.append(separator + sentence if current else sentence)
+            current_tokens += sentence_tokens
+    if current:
+        windows.append("".join(current).strip())
+    contexts = []
+    for window in windows:
+        tail, used = [], 0
+        for sentence in reversed([s for paragraph in _legacy_sentences(window) for s in paragraph]):
+            used += len(sentence.split())
+            if used > context_tokens:
+                break
+            tail.insert(0, sentence)
+        contexts.append(" ".join(tail))
+    formatted = "\n\n".join(windows)
+    for old, new in ((". ", ". ... "), ("! ", "! ... "), ("? ", "? ... "), (", ", ", . ")):
+        formatted = formatted.replace(old, new)
+    page = [text.encode("utf-8"), formatted.encode("utf-8")]
+    return len(windows), sum(len(item) for item in page), sum(len(context) for context in contexts)
+
+def _document_chain(text, max_tokens, context_tokens):
+    """
+    The same steps on one Document: offset tables, slice windows, page previews
+    """
+    from document_utils import Document, text_preview
+    from granite_utils import split_text_into_windows, format_text_for_narration
+
+    document = Document(text)
+    windows = split_text_into_windows(document, max_tokens=max_tokens, context_tokens=context_tokens)
+    contexts = [window["tail"] for window in windows]
+    formatted = format_text_for_narration("\n\n".join(window["text"] for window in windows))
+    page = [text_preview(text).encode("utf-8"), text_preview(formatted).encode("utf-8")]
+    return len(windows), sum(len(item) for item in page), sum(len(context) for context in contexts)
+
+def _measure_text_chain(path, chain, max_tokens, context_tokens):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    baseline = _peak_rss_mb()
+    return chain(text, max_tokens, context_tokens), baseline
+
+def benchmark_document(args):
+    """
+    Memory and throughput of the text path on book-sized input: string-copy chain vs Document
+    """
+    from granite_utils import CHUNK_TOKEN_BUDGET, CONTEXT_OVERLAP_TOKENS
+
+    for size in [_parse_size(value) for value in args.sizes.split(",")]:
+        with tempfile.NamedTemporaryFile(suffix=".txt", delete=False) as f:
+            pass
+        # Build the book in its own process so this one stays small for the forked measurements
+        _run_isolated(_write_book, f.name, size)
+        megabytes = os.path.getsize(f.name) / 1e6
+        try:
+            print(f"book: {megabytes:.1f} MB")
+            for name, chain in (("string copies", _legacy_text_chain), ("document", _document_chain)):
+                best = None
+                for _ in range(args.repeat):
+                    elapsed, rss, ((windows, page_bytes, context_chars), baseline) = _run_isolated(
+                        _measure_text_chain, f.name, chain, CHUNK_TOKEN_BUDGET, CONTEXT_OVERLAP_TOKENS
+                    )
+                    if best is None or elapsed < best[0]:
+                        best = (elapsed, rss - baseline)
+                elapsed, extra = best
+                print(f"  {name}: {elapsed:.2f}s ({megabytes / elapsed:.1f} MB/s), peak RSS {extra:+.0f} MB over the "
+                      f"text, {windows} windows, {context_chars / 1e3:.0f}K context characters, "
+                      f"{page_bytes / 1e3:.0f} KB sent to the page")
+        finally:
+            os.unlink(f.name)
+
+def main():
+    parser = argparse.ArgumentParser(description="EchoVerse benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    granite_batch = subparsers.add_parser("granite-batch", help="Batched vs sequential Granite generation")
+    granite_batch.add_argument("--paragraphs", type=int, default=20)
+    granite_batch.add_argument("--batch-size", type=int, default=8)
+    granite_batch.add_argument("--max-new-tokens", type=int, default=128)
+    granite_batch.set_defaults(func=benchmark_granite_batching)
+
+    tts_pool = subparsers.add_parser("tts-pool", help="Bounded TTS pool against a faulty fake server")
+    tts_pool.add_argument("--chunks", type=int, default=200)
+    tts_pool.add_argument("--workers", type=int, default=8)
+    tts_pool.add_argument("--retries", type=int, default=4)
+    tts_pool.add_argument("--latency", type=float, default=0.05)
+    tts_pool.add_argument("--error-rate", type=float, default=0.1)
+    tts_pool.add_argument("--rate-limit-rate", type=float, default=0.05)
+    tts_pool.set_defaults(func=benchmark_tts_pool)
+
+    scheduler = subparsers.add_parser("scheduler", help="Fixed vs adaptive TTS chunking against a latency curve")
+    scheduler.add_argument("--kilobytes", type=int, default=32)
+    scheduler.add_argument("--latency", type=float, default=0.3, help="Fixed seconds per request")
+    scheduler.add_argument("--latency-per-char", type=float, default=0.0005, help="Extra seconds per character")
+    scheduler.add_argument("--capacity", type=int, default=6, help="Concurrent requests before latency grows")
+    scheduler.add_argument("--max-concurrent", type=int, default=10, help="Concurrent requests before 429s")
+    scheduler.add_argument("--error-rate", type=float, default=0.01)
+    scheduler.add_argument("--frames-per-char", type=float, default=2.5, help="About 15 characters per second")
+    scheduler.add_argument("--chunk-size", type=int, default=300, help="Chunk size of the fixed run")
+    scheduler.add_argument("--workers", type=int, default=8, help="Concurrency of the fixed run")
+    scheduler.add_argument("--max-workers", type=int, default=16, help="Concurrency ceiling of the adaptive run")
+    scheduler.add_argument("--first-minutes", type=float, default=2.0)
+    scheduler.add_argument("--seed", type=int, default=0)
+    scheduler.set_defaults(func=benchmark_scheduler)
+
+    tts_client = subparsers.add_parser("tts-client", help="Fresh vs shared Watson client latency")
+    tts_client.add_argument("--requests", type=int, default=100)
+    tts_client.add_argument("--latency", type=float, default=0.005)
+    tts_client.set_defaults(func=benchmark_tts_client)
+
+    pdf = subparsers.add_parser("pdf", help="PDF extraction wall time and peak RSS")
+    pdf.add_argument("--pages", type=int, default=500)
+    pdf.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    pdf.set_defaults(func=benchmark_pdf)
+
+    granite_backend = subparsers.add_parser("granite-backend", help="fp32 vs int8 Granite latency, memory and parity")
+    granite_backend.add_argument("--max-new-tokens", type=int, default=128)
+    granite_backend.add_argument("--parity", action="store_true", help="Also compare outputs (loads both models)")
+    granite_backend.set_defaults(func=benchmark_granite_backend)
+
+    prefix_cache = subparsers.add_parser("prefix-cache", help="Time-to-first-token with the header KV cache")
+    prefix_cache.add_argument("--paragraphs", type=int, default=12)
+    prefix_cache.add_argument("--max-new-tokens", type=int, default=16)
+    prefix_cache.set_defaults(func=benchmark_prefix_cache)
+
+    speculative = subparsers.add_parser("speculative", help="Granite throughput with a draft model and its acceptance rate")
+    speculative.add_argument("--draft-model", default=None,
+                             help="Draft model (defaults to ECHOVERSE_DRAFT_MODEL or a small Granite 3.1 model)")
+    speculative.add_argument("--backend", default="fp32", help="Granite backend (fp32 or int8)")
+    speculative.add_argument("--corpus", default=None, help="Text file to rewrite instead of the synthetic document")
+    speculative.add_argument("--paragraphs", type=int, default=8)
+    speculative.add_argument("--max-new-tokens", type=int, default=128)
+    speculative.add_argument("--seed", type=int, default=0)
+    speculative.set_defaults(func=benchmark_speculative)
+
+    normalize = subparsers.add_parser("normalize", help="Text normalization throughput on large inputs")
+    normalize.add_argument("--megabytes", type=int, default=8)
+    normalize.add_argument("--repeat", type=int, default=3)
+    normalize.set_defaults(func=benchmark_normalize)
+
+    startup = subparsers.add_parser("startup", help="Import time and first-request latency with model warm-up")
+    startup.add_argument("--think-time", type=float, default=30.0, help="Seconds before the first request")
+    startup.add_argument("--max-new-tokens", type=int, default=64)
+    startup.add_argument("--repeat", type=int, default=3)
+    startup.set_defaults(func=benchmark_startup)
+
+    e2e = subparsers.add_parser("e2e", help="End-to-end flow with a tiny LM and fake Watson, vs a stored baseline")
+    e2e.add_argument("--sizes", default="1KB,64KB,1MB,10MB", help="Comma-separated corpus sizes")
+    e2e.add_argument("--latency", type=float, default=0.05, help="Fake Watson latency per request in seconds")
+    e2e.add_argument("--frames-per-char", type=float, default=0.01, help="Fake audio frames returned per character")
+    e2e.add_argument("--max-new-tokens", type=int, default=32, help="Cap on tokens generated per window")
+    e2e.add_argument("--batch-size", type=int, default=8)
+    e2e.add_argument("--chunk-size", type=int, default=300, help="Characters per TTS request")
+    e2e.add_argument("--workers", type=int, default=8, help="Concurrent TTS requests")
+    e2e.add_argument("--seed", type=int, default=0)
+    e2e.add_argument("--baseline", default=E2E_BASELINE)
+    e2e.add_argument("--save-baseline", action="store_true", help="Record this run as the new baseline")
+    e2e.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing")
+    e2e.set_defaults(func=benchmark_e2e)
+
+    memory = subparsers.add_parser("memory", help="Peak RSS of large text uploads and audiobook serving")
+    memory.add_argument("--megabytes", type=int, default=200)
+    memory.set_defaults(func=benchmark_memory)
+
+    document = subparsers.add_parser("document", help="Text path memory and throughput, string copies vs Document")
+    document.add_argument("--sizes", default="1MB,10MB", help="Comma-separated book sizes")
+    document.add_argument("--repeat", type=int, default=3)
+    document.set_defaults(func=benchmark_document)
+
+    args = parser.parse_args()
+    # Keep benchmark runs out of the user's cache
+    os.environ.setdefault("ECHOVERSE_CACHE_DIR", tempfile.mkdtemp(prefix="echoverse-bench-"))
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+# Location and size bound of the on-disk cache
+CACHE_DIR = os.getenv("ECHOVERSE_CACHE_DIR", ".echoverse_cache")
+CACHE_MAX_BYTES = int(os.getenv("ECHOVERSE_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# Characters encoded per write when storing text
+TEXT_WRITE_CHARS = 1024 * 1024
+
+def make_cache_key(*parts):
+    """
+    Build a content-addressed key from the inputs that determine an output
+
+    Args:
+        *parts: Strings (or values convertible to str) such as the model name,
+            prompt, tone, style, voice and the chunk text itself
+
+    Returns:
+        str: Hex SHA-256 digest of the parts
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = str(part).encode("utf-8")
+        # Length prefix keeps ("ab", "c") and ("a", "bc") distinct
+        digest.update(len(encoded).to_bytes(8, "little"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+class ContentCache:
+    """
+    Size-bounded, least-recently-used cache of byte values stored on disk
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load_index(self):
+        """
+        Rebuild the LRU order from file modification times
+        """
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                found.append((stat.st_mtime, name, stat.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def get(self, key):
+        """
+        Return the cached bytes for key, or None on a miss
+        """
+        def read(path):
+            with open(path, "rb") as f:
+                return f.read()
+
+        return self._lookup(key, read, None)
+
+    def contains(self, key):
+        """
+        Whether key is cached, without reading it or counting a lookup
+        """
+        with self._lock:
+            return key in self._entries
+
+    def get_file(self, key, destination):
+        """
+        Copy the cached value for key to a file without loading it into memory
+
+        Returns:
+            bool: True on a hit, False on a miss
+        """
+        def copy(path):
+            shutil.copyfile(path, destination)
+            return True
+
+        return self._lookup(key, copy, False)
+
+    def _lookup(self, key, read, missing):
+        """
+        Read a cached value through read(path), holding the lock only for the index
+
+        Values are published with an atomic rename, so a read racing a write
+        sees either the old or the new file, never a partial one.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return missing
+        path = self._path(key)
+        try:
+            value = read(path)
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another thread or another process sharing the directory
+            with self._lock:
+                if key in self._entries:
+                    self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+            return missing
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def _write(self, key, write):
+        """
+        Write a value through write(file) to a temporary file, then publish it under key
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+            size = f.tell()
+        os.replace(tmp_path, path)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def put(self, key, data):
+        """
+        Store bytes under key and evict least recently used entries over the size bound
+        """
+        self._write(key, lambda f: f.write(data))
+
+    def put_file(self, key, source):
+        """
+        Store the content of a file under key, copying it in chunks
+        """
+        def write(f):
+            with open(source, "rb") as src:
+                shutil.copyfileobj(src, f)
+
+        self._write(key, write)
+
+    def get_text(self, key):
+        data = self.get(key)
+        return None if data is None else data.decode("utf-8")
+
+    def put_text(self, key, text):
+        # Encode in slices so a large text never has a full-size bytes copy alongside it
+        def write(f):
+            for start in range(0, len(text), TEXT_WRITE_CHARS):
+                f.write(text[start:start + TEXT_WRITE_CHARS].encode("utf-8"))
+
+        self._write(key, write)
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """
+        Return hit/miss counters and current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """
+    Return the process-wide content cache
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ContentCache()
+        return _cache
@@ -0,0 +1,194 @@
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cache_utils import make_cache_key
+from granite_utils import model_identity
+from metrics_utils import span
+from mp3_utils import mp3_duration
+from pipeline_utils import normalize_stage, rewrite_stage, synthesize_stage
+
+# Chapters rendered at the same time
+CHAPTER_WORKERS = int(os.getenv("ECHOVERSE_CHAPTER_WORKERS", "2"))
+# Attempts per chapter before it is reported as failed
+CHAPTER_MAX_ATTEMPTS = 3
+CHAPTER_RETRY_DELAY = 2.0
+CHAPTER_INDEX = "index.m3u8"
+CHAPTER_MANIFEST = "chapters.json"
+
+_NUMBER = (
+    r"(?:\d+|[ivxlcdm]+|one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|thirteen|"
+    r"fourteen|fifteen|sixteen|seventeen|eighteen|nineteen|(?:twenty|thirty|forty|fifty)(?:[- ]\w+)?)"
+)
+# A heading sits alone on its line: "Chapter 3", "PART IV: The Return", "Prologue", "# Title"
+_HEADING = re.compile(
+    r"^[ \t]*("
+    rf"(?:chapter|part|book|section)[ \t]+{_NUMBER}\b(?:[ \t]*[:.\-–—][^\n]{{0,60}})?"
+    r"|(?:prologue|epilogue|introduction|preface|foreword|afterword|interlude)(?:[ \t]*[:.\-–—][^\n]{0,60})?"
+    r"|#{1,3}[ \t]+[^\n]{1,80}"
+    r")[ \t]*$",
+    re.IGNORECASE | re.MULTILINE
+)
+_UNSAFE_FILENAME = re.compile(r"[^\w\- ]+")
+
+def _line_starts(text, titles):
+    """
+    Offsets of lines matching the given titles, found in order
+    """
+    starts = []
+    position = 0
+    for title in titles:
+        words = [re.escape(word) for word in title.split()]
+        if not words:
+            continue
+        match = re.compile(r"^[ \t]*" + r"\s+".join(words) + r"[ \t]*$", re.IGNORECASE | re.MULTILINE).search(
+            text, position
+        )
+        if match:
+            starts.append((match.start(), title.strip()))
+            position = match.end()
+    return starts
+
+def split_into_chapters(text, titles=None):
+    """
+    Split a book into chapters at its headings
+
+    Headings come from the given titles (e.g. a PDF's bookmarks) when at least
+    two of them are found in the text, otherwise from lines that look like
+    chapter, part or section headings. Text before the first heading becomes
+    an opening chapter. A book without headings is a single chapter.
+
+    Args:
+        text (str): Full book text
+        titles (list[str]): Known chapter titles in reading order
+
+    Returns:
+        list[dict]: Chapters with 'index', 'title' and 'text' (heading included)
+    """
+    starts = _line_starts(text, titles) if titles else []
+    if len(starts) < 2:
+        starts = [(m.start(), " ".join(m.group(1).lstrip("#").split())) for m in _HEADING.finditer(text)]
+
+    sections = []
+    if not starts or text[:starts[0][0]].strip():
+        sections.append(("Opening" if starts else "Full text", 0))
+    sections.extend((title, start) for start, title in starts)
+
+    chapters = []
+    for i, (title, start) in enumerate(sections):
+        end = sections[i + 1][1] if i + 1 < len(sections) else len(text)
+        body = text[start:end].strip()
+        if body:
+            chapters.append({"index": len(chapters), "title": title, "text": body})
+    return chapters
+
+def chapter_filename(chapter):
+    """
+    File name of a chapter's audio, sortable by reading order
+    """
+    title = " ".join(_UNSAFE_FILENAME.sub(" ", chapter["title"]).split())[:60] or "Chapter"
+    return f"{chapter['index'] + 1:03d} - {title}.mp3"
+
+def _render_chapter(chapter, path, tone, style, voice, granite_pipe, max_attempts):
+    """
+    Rewrite and synthesize one chapter into its own file, retrying failures
+    """
+    for attempt in range(max_attempts):
+        try:
+            with span("chapter.render", chars=len(chapter["text"])):
+                processed = rewrite_stage(normalize_stage(chapter["text"]), tone, style, granite_pipe)
+                partial_path = path + ".partial"
+                synthesize_stage(processed, voice=voice, filename=partial_path)
+                os.replace(partial_path, path)
+            return attempt + 1
+        except Exception:
+            if attempt + 1 >= max_attempts:
+                raise
+            time.sleep(CHAPTER_RETRY_DELAY * (2 ** attempt))
+
+def write_chapter_index(chapters, output_dir, name=CHAPTER_INDEX):
+    """
+    Write an extended M3U playlist listing the rendered chapters in order
+
+    Returns:
+        str: Path to the playlist
+    """
+    path = os.path.join(output_dir, name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+        for chapter in chapters:
+            if chapter.get("status") == "failed":
+                continue
+            f.write(f"#EXTINF:{round(chapter['duration'])},{chapter['title']}\n{chapter['file']}\n")
+    return path
+
+def render_chapters(chapters, output_dir, tone="neutral", style="neutral", voice="en-US_AllisonV3Voice",
+                    granite_pipe=None, workers=None, max_attempts=CHAPTER_MAX_ATTEMPTS):
+    """
+    Render each chapter to its own MP3 in parallel and write a playlist index
+
+    Every chapter is an independent unit of work with its own retries.
+    Chapters whose file was already rendered from the same text and settings
+    are kept as they are, so editing one chapter re-renders only that one.
+
+    Args:
+        chapters (list[dict]): Output of split_into_chapters
+        output_dir (str): Directory receiving the chapter files and index
+        tone (str): Desired tone
+        style (str): Voice style
+        voice (str): IBM Watson voice name
+        granite_pipe: Pre-loaded Granite pipeline (None skips rewriting)
+        workers (int): Chapters rendered at the same time (defaults to CHAPTER_WORKERS)
+        max_attempts (int): Attempts per chapter
+
+    Returns:
+        dict: 'chapters' (each with 'file', 'path', 'status', 'duration' and
+            'error'), 'index' path and 'failed' count
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, CHAPTER_MANIFEST)
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    model = model_identity(granite_pipe) if granite_pipe else "none"
+
+    results = []
+    for chapter in chapters:
+        result = {"index": chapter["index"], "title": chapter["title"], "file": chapter_filename(chapter)}
+        result["path"] = os.path.join(output_dir, result["file"])
+        result["key"] = make_cache_key(chapter["text"], tone, style, voice, model)
+        current = os.path.exists(result["path"]) and manifest.get(result["file"]) == result["key"]
+        result["status"] = "unchanged" if current else "pending"
+        results.append(result)
+
+    with ThreadPoolExecutor(max_workers=workers or CHAPTER_WORKERS) as pool:
+        futures = {
+            pool.submit(_render_chapter, chapter, result["path"], tone, style, voice, granite_pipe, max_attempts):
+                result
+            for chapter, result in zip(chapters, results) if result["status"] == "pending"
+        }
+        for future, result in futures.items():
+            try:
+                result["attempts"] = future.result()
+                result["status"] = "rendered"
+                manifest[result["file"]] = result["key"]
+            except Exception as e:
+                result["status"] = "failed"
+                result["error"] = str(e)
+
+    for result in results:
+        if result["status"] != "failed":
+            result["duration"] = mp3_duration(result["path"])
+        del result["key"]
+    # Only chapters of the current book belong in the manifest
+    files = {result["file"] for result in results}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({name: key for name, key in manifest.items() if name in files}, f, indent=2)
+    return {
+        "chapters": results,
+        "index": write_chapter_index(results, output_dir),
+        "failed": sum(result["status"] == "failed" for result in results)
+    }
@@ -0,0 +1,167 @@
+import re
+from array import array
+
+# Characters of a document shown on the page; the rest stays on the server
+PREVIEW_CHARS = 5000
+
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+# A sentence ends at terminal punctuation plus any closing quotes or brackets;
+# group 1 is the whitespace separating it from the next sentence
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])[\"')\]]*(\s+)")
+# Anything normalize_paragraphs would change: whitespace other than single spaces
+# and blank-line paragraph breaks, or spaces around line breaks
+_UNNORMALIZED = re.compile(r"[^\S \n]|  |\n\n\n|(?<!\n)\n(?!\n)| \n|\n ")
+
+def normalize_paragraphs(text):
+    """
+    Join lines inside paragraphs and collapse whitespace, keeping one blank line between paragraphs
+
+    Text already in this form is returned as it is, without a copy.
+
+    Returns:
+        str: Normalized text
+    """
+    if not _UNNORMALIZED.search(text) and not text[:1].isspace() and not text[-1:].isspace():
+        return text
+    paragraphs = (" ".join(p.split()) for p in _PARAGRAPH_SPLIT.split(text.replace("\r\n", "\n")))
+    return "\n\n".join(p for p in paragraphs if p)
+
+def iter_paragraphs(text):
+    """
+    Yield the paragraphs of text one at a time, split on blank lines
+
+    Yields the same pieces as re.split(r"\n\s*\n", text), but copies one
+    paragraph at a time instead of building the whole list up front.
+    """
+    start = 0
+    for match in _PARAGRAPH_SPLIT.finditer(text):
+        yield text[start:match.start()]
+        start = match.end()
+    yield text[start:]
+
+def text_preview(text, max_chars=PREVIEW_CHARS):
+    """
+    Return the opening of text up to max_chars, cut at a paragraph or sentence break when possible
+    """
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind("\n\n", 0, max_chars)
+    if cut <= 0:
+        cut = max(text.rfind(mark, 0, max_chars) for mark in ".!?") + 1
+    return text[:cut or max_chars]
+
+class Span:
+    """
+    A range of a Document, held as offsets into its backing string
+
+    Spans never copy text; str() materializes one when a string is needed,
+    such as for a tokenizer or an HTTP request.
+    """
+
+    __slots__ = ("document", "start", "end")
+
+    def __init__(self, document, start, end):
+        self.document = document
+        self.start = start
+        self.end = end
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __str__(self):
+        return self.document.text[self.start:self.end]
+
+    def __repr__(self):
+        return f"Span({self.start}, {self.end})"
+
+class Document:
+    """
+    One normalized backing string with array-backed paragraph and sentence offset tables
+
+    The text is normalized once (see normalize_paragraphs). Paragraphs and
+    sentences are recorded as machine-integer offsets rather than as lists
+    of strings, so indexing a book costs a few bytes per sentence on top of
+    the text itself, and downstream stages take Span views of it.
+    Sentences keep their closing quotes and brackets, so the text between
+    two sentence spans is exactly the separating space or paragraph break.
+    """
+
+    __slots__ = (
+        "text", "paragraph_starts", "paragraph_ends", "paragraph_sentences", "sentence_starts", "sentence_ends"
+    )
+
+    def __init__(self, text):
+        """
+        Args:
+            text (str): Document text, normalized first unless it already is
+        """
+        self.text = text = normalize_paragraphs(text)
+        self.paragraph_starts = array("q")
+        self.paragraph_ends = array("q")
+        # Index of each paragraph's first sentence, plus the sentence count at the end
+        self.paragraph_sentences = array("q")
+        self.sentence_starts = array("q")
+        self.sentence_ends = array("q")
+        position = 0
+        while position < len(text):
+            end = text.find("\n\n", position)
+            if end < 0:
+                end = len(text)
+            self.paragraph_starts.append(position)
+            self.paragraph_ends.append(end)
+            self.paragraph_sentences.append(len(self.sentence_starts))
+            start = position
+            for match in SENTENCE_BREAK.finditer(text, position, end):
+                self.sentence_starts.append(start)
+                self.sentence_ends.append(match.start(1))
+                start = match.end()
+            if start < end:
+                self.sentence_starts.append(start)
+                self.sentence_ends.append(end)
+            position = end + 2
+        self.paragraph_sentences.append(len(self.sentence_starts))
+
+    def __len__(self):
+        return len(self.text)
+
+    @property
+    def paragraph_count(self):
+        return len(self.paragraph_starts)
+
+    @property
+    def sentence_count(self):
+        return len(self.sentence_starts)
+
+    def span(self, start, end):
+        return Span(self, start, end)
+
+    def paragraphs(self):
+        """
+        Yield every paragraph as a Span
+        """
+        for start, end in zip(self.paragraph_starts, self.paragraph_ends):
+            yield Span(self, start, end)
+
+    def sentences(self, paragraph=None):
+        """
+        Yield the sentences of the whole document, or of one paragraph, as Spans
+
+        Args:
+            paragraph (int): Paragraph index, or None for every sentence
+        """
+        if paragraph is None:
+            first, last = 0, len(self.sentence_starts)
+        else:
+            first, last = self.paragraph_sentences[paragraph], self.paragraph_sentences[paragraph + 1]
+        for i in range(first, last):
+            yield Span(self, self.sentence_starts[i], self.sentence_ends[i])
+
+    def nbytes(self):
+        """
+        Bytes held by the offset tables, excluding the text
+        """
+        return sum(
+            table.itemsize * len(table)
+            for table in (self.paragraph_starts, self.paragraph_ends, self.paragraph_sentences,
+                          self.sentence_starts, self.sentence_ends)
+        )
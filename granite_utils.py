@@ -1,14 +1,104 @@
+import copy
+import math
 import os
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-import torch
+import threading
+import time
+import zlib
+from array import array
+from collections import OrderedDict, deque
 import streamlit as st
+from cache_utils import get_cache, make_cache_key
+from document_utils import Document, SENTENCE_BREAK
+from metrics_utils import span, observe, count
+from scheduler_utils import get_scheduler
+
+# CPU inference backend: "fp32" (full precision) or "int8" (dynamic quantization)
+GRANITE_BACKEND = os.getenv("ECHOVERSE_GRANITE_BACKEND", "fp32")
+GRANITE_BACKENDS = ("fp32", "int8")
+# Small model that drafts tokens for Granite to verify (speculative decoding); off when unset
+GRANITE_DRAFT_MODEL = os.getenv("ECHOVERSE_DRAFT_MODEL") or None
+# Granite 3.x models share one tokenizer, so a small sibling drafts without any token translation
+DEFAULT_DRAFT_MODEL = "ibm-granite/granite-3.1-1b-a400m-instruct"
+# First transformers release whose generate takes a draft with a different vocabulary (tokenizer/assistant_tokenizer)
+UNIVERSAL_ASSISTED_MIN_TRANSFORMERS = "4.46.0"
+
+def quantize_model_int8(model):
+    """
+    Apply int8 dynamic quantization to the Linear layers of a CPU model
+
+    Weights are stored as int8 and activations are quantized on the fly,
+    which roughly quarters the memory of the projection layers and uses the
+    int8 GEMM kernels on CPU.
+    """
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def _supports_universal_assisted_generation():
+    """
+    Whether model.generate accepts a draft model with a different tokenizer
+    """
+    import transformers
+    from packaging.version import Version
+
+    return Version(transformers.__version__) >= Version(UNIVERSAL_ASSISTED_MIN_TRANSFORMERS)
+
+def load_draft_model(model_name, tokenizer, backend=GRANITE_BACKEND):
+    """
+    Load a small causal LM that proposes tokens for Granite to verify
+
+    Args:
+        model_name (str): Hugging Face model identifier of the draft model
+        tokenizer: Granite's tokenizer
+        backend (str): CPU inference backend, one of GRANITE_BACKENDS
+
+    Returns:
+        tuple: (model, tokenizer), where the tokenizer is None when the draft
+            shares Granite's vocabulary, or (None, None) if loading failed
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    try:
+        hf_token = os.getenv("HF_TOKEN")
+        draft_tokenizer = AutoTokenizer.from_pretrained(model_name, token=hf_token, trust_remote_code=True)
+        draft = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            token=hf_token,
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            device_map="auto" if torch.cuda.is_available() else None,
+            trust_remote_code=True
+        ).eval()
+        if backend == "int8" and not torch.cuda.is_available():
+            draft = quantize_model_int8(draft)
+        if draft_tokenizer.get_vocab() == tokenizer.get_vocab():
+            draft_tokenizer = None
+        elif not _supports_universal_assisted_generation():
+            st.warning(f"Draft model {model_name} has its own vocabulary, which needs transformers "
+                       f"{UNIVERSAL_ASSISTED_MIN_TRANSFORMERS} or later; generating without it")
+            return None, None
+        return draft, draft_tokenizer
+    except Exception as e:
+        st.warning(f"Draft model could not be loaded, generating without it: {str(e)}")
+        return None, None
 
 @st.cache_resource
-def load_granite_model():
+def load_granite_model(backend=GRANITE_BACKEND, draft_model=GRANITE_DRAFT_MODEL):
     """
     Load IBM Granite model for text processing
     Returns a Hugging Face pipeline for text generation
+
+    Args:
+        backend (str): CPU inference backend, one of GRANITE_BACKENDS
+            (ignored when a GPU is available)
+        draft_model (str): Identifier of a small model that drafts tokens for
+            speculative decoding, or None to decode with Granite alone
     """
+    import torch
+    from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
+
+    if backend not in GRANITE_BACKENDS:
+        raise ValueError(f"Unknown Granite backend '{backend}', expected one of {GRANITE_BACKENDS}")
     try:
         # Get HF token from environment variables
         hf_token = os.getenv("HF_TOKEN")
@@ -30,6 +120,8 @@ def load_granite_model():
             device_map="auto" if torch.cuda.is_available() else None,
             trust_remote_code=True
         )
+        if backend == "int8" and not torch.cuda.is_available():
+            model = quantize_model_int8(model.eval())
         
         # Create text generation pipeline
         granite_pipe = pipeline(
@@ -42,6 +134,11 @@ def load_granite_model():
             top_p=0.9,
             pad_token_id=tokenizer.eos_token_id
         )
+        granite_pipe.draft_model, granite_pipe.draft_tokenizer = (
+            load_draft_model(draft_model, tokenizer, backend) if draft_model else (None, None)
+        )
+        granite_pipe.backend = backend if not torch.cuda.is_available() else "cuda"
+        granite_pipe.draft_model_name = draft_model if granite_pipe.draft_model is not None else None
         
         return granite_pipe
     
@@ -59,9 +156,828 @@ def load_granite_model():
         except:
             return None
 
-def process_text_with_granite(text, tone="neutral", language="English", style="neutral", granite_pipe=None):
+def load_default_granite_model():
+    """
+    Return the Granite pipeline for the configured backend and draft model
+
+    st.cache_resource keys on the arguments exactly as passed, without
+    filling in defaults, so every caller (the startup warm-up, the app, job
+    workers and benchmarks) goes through here to share one cached copy.
+    """
+    return load_granite_model(GRANITE_BACKEND, GRANITE_DRAFT_MODEL)
+
+_warmup_state = {"status": "idle", "error": None, "load_seconds": None, "warmup_seconds": None}
+_warmup_lock = threading.Lock()
+
+def warm_up_model(granite_pipe):
+    """
+    Run one short generation so kernels, allocator pools and the default
+    prompt header cache are ready before the first real request
+    """
+    prompt = create_enhancement_prompt("The story begins.", "neutral", "English", "neutral")
+    _generate_rewrite(granite_pipe, prompt, 4)
+
+def start_model_warmup():
+    """
+    Load and warm up the Granite model on a background thread
+
+    Safe to call on every script run: only the first call in a process
+    starts the thread. Progress is reported by model_status(). The model
+    is the one load_default_granite_model returns to every later caller.
+    """
+    with _warmup_lock:
+        if _warmup_state["status"] != "idle":
+            return
+        _warmup_state["status"] = "loading"
+
+    def run():
+        try:
+            start = time.perf_counter()
+            granite_pipe = load_default_granite_model()
+            _warmup_state["load_seconds"] = time.perf_counter() - start
+            if granite_pipe is None:
+                raise RuntimeError("No text generation model could be loaded")
+            _warmup_state["status"] = "warming"
+            start = time.perf_counter()
+            warm_up_model(granite_pipe)
+            _warmup_state["warmup_seconds"] = time.perf_counter() - start
+            _warmup_state["status"] = "ready"
+        except Exception as e:
+            _warmup_state["error"] = str(e)
+            _warmup_state["status"] = "failed"
+
+    threading.Thread(target=run, name="echoverse-model-warmup", daemon=True).start()
+
+def model_status():
+    """
+    Return the background model loading state
+
+    Returns:
+        dict: 'status' (idle, loading, warming, ready or failed), 'error',
+            'load_seconds' and 'warmup_seconds'
+    """
+    return dict(_warmup_state)
+
+# Token budget for the source text placed in a single rewrite prompt
+CHUNK_TOKEN_BUDGET = 400
+# One paragraph in this many (by a hash of its text) starts a new window once the
+# current one holds WINDOW_ANCHOR_MIN_FILL of the budget
+WINDOW_ANCHOR_INTERVAL = 4
+WINDOW_ANCHOR_MIN_FILL = 0.25
+# Tokens of the previous window repeated in the next prompt as context
+CONTEXT_OVERLAP_TOKENS = 64
+# Sentences encoded per tokenizer call when measuring a document
+TOKENIZE_BATCH_SENTENCES = 256
+# Upper bound on tokens generated for a single window
+MAX_NEW_TOKENS_PER_CHUNK = 1024
+# Prompts per model.generate call in batched mode
+DEFAULT_BATCH_SIZE = 8
+# A batch taking longer than this delays the first audio too much; the batch size backs off
+GRANITE_TARGET_BATCH_SECONDS = 60.0
+# Generation budgets follow the measured output/input token ratio of recent windows,
+# with headroom, between these bounds (the upper one until enough windows were seen)
+BUDGET_RATIO_MIN = 1.25
+BUDGET_RATIO_MAX = 2.0
+BUDGET_HEADROOM = 1.25
+BUDGET_MIN_SAMPLES = 8
+# Reuse precomputed key/values of the instruction header across chunks
+PREFIX_CACHE_ENABLED = os.getenv("ECHOVERSE_PREFIX_CACHE", "1") == "1"
+PREFIX_CACHE_SIZE = 16
+
+_prefix_cache = OrderedDict()
+_prefix_cache_lock = threading.Lock()
+_output_ratios = deque(maxlen=200)
+_output_ratios_lock = threading.Lock()
+
+def count_tokens(text, tokenizer=None):
+    """
+    Count tokens in text with the Granite tokenizer, falling back to words
+    """
+    if tokenizer is None:
+        return len(text.split())
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+def _split_long_sentence(sentence, tokenizer, budget):
+    """
+    Break a single sentence that exceeds the budget on word boundaries
+    """
+    pieces = []
+    current = []
+    current_tokens = 0
+    for word in sentence.split():
+        word_tokens = count_tokens(" " + word, tokenizer)
+        if current and current_tokens + word_tokens > budget:
+            pieces.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(word)
+        current_tokens += word_tokens
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+def _is_window_anchor(paragraph):
+    """
+    Whether a paragraph always starts a new window, decided by its content alone
+    """
+    return zlib.crc32(paragraph.encode("utf-8")) % WINDOW_ANCHOR_INTERVAL == 0
+
+def sentence_token_counts(document, tokenizer=None):
+    """
+    Count the tokens of every sentence of a Document
+
+    Without a tokenizer, words are counted from the offsets alone: normalized
+    text has exactly one space between words, so no sentence is copied. With
+    one, sentences are encoded in batches rather than one call each.
+
+    Returns:
+        array: Token count per sentence, in document order
+    """
+    text = document.text
+    starts, ends = document.sentence_starts, document.sentence_ends
+    if tokenizer is None:
+        return array("q", (text.count(" ", start, end) + 1 for start, end in zip(starts, ends)))
+    counts = array("q")
+    for first in range(0, len(starts), TOKENIZE_BATCH_SENTENCES):
+        last = first + TOKENIZE_BATCH_SENTENCES
+        batch = [text[start:end] for start, end in zip(starts[first:last], ends[first:last])]
+        counts.extend(len(ids) for ids in tokenizer(batch, add_special_tokens=False)["input_ids"])
+    return counts
+
+def split_text_into_windows(text, tokenizer=None, max_tokens=CHUNK_TOKEN_BUDGET,
+                            context_tokens=CONTEXT_OVERLAP_TOKENS):
+    """
+    Split a document into token-budgeted windows on paragraph and sentence boundaries
+
+    Windows hold whole paragraphs; only a paragraph over the budget is split,
+    on sentence boundaries. A window ends before a paragraph that no longer
+    fits, and before an anchor paragraph (one in WINDOW_ANCHOR_INTERVAL,
+    chosen by a hash of its text) once it holds WINDOW_ANCHOR_MIN_FILL of
+    the budget. Boundaries
+    therefore follow the content rather than everything before them: after
+    an edit they fall back into step at the next anchor, so only the windows
+    around the edited paragraph change, not every window after it.
+    Sentences are measured once into a token count array, and each window's
+    text and tail are slices of the normalized document taken at its
+    sentence offsets, never joins of per-sentence strings.
+
+    Args:
+        text (str | Document): Full document text, or an already indexed Document
+        tokenizer: Tokenizer used to measure windows (word count if None)
+        max_tokens (int): Maximum number of tokens per window
+        context_tokens (int): Maximum number of tokens in a window's tail
+
+    Returns:
+        list[dict]: Windows in document order, each with 'text', 'tokens' and
+            'tail' (its trailing sentences within context_tokens, the context
+            for the next window's prompt)
+    """
+    document = text if isinstance(text, Document) else Document(text)
+    text = document.text
+    starts, ends = document.sentence_starts, document.sentence_ends
+    counts = sentence_token_counts(document, tokenizer)
+    windows = []
+    # Sentences first to last - 1 make up the current window
+    first = None
+    last = 0
+    current_tokens = 0
+
+    def flush():
+        nonlocal first, current_tokens
+        if first is None:
+            return
+        tail_start = ends[last - 1]
+        used = 0
+        for i in range(last - 1, first - 1, -1):
+            if used + counts[i] > context_tokens:
+                break
+            tail_start = starts[i]
+            used += counts[i]
+        windows.append({
+            "text": text[starts[first]:ends[last - 1]],
+            "tokens": current_tokens,
+            "tail": text[tail_start:ends[last - 1]]
+        })
+        first, current_tokens = None, 0
+
+    for paragraph in range(document.paragraph_count):
+        begin, end = document.paragraph_sentences[paragraph], document.paragraph_sentences[paragraph + 1]
+        paragraph_tokens = sum(counts[i] for i in range(begin, end))
+        anchored = current_tokens >= max_tokens * WINDOW_ANCHOR_MIN_FILL and _is_window_anchor(
+            text[document.paragraph_starts[paragraph]:document.paragraph_ends[paragraph]]
+        )
+        if anchored or current_tokens + paragraph_tokens > max_tokens:
+            flush()
+        for i in range(begin, end):
+            if counts[i] > max_tokens:
+                flush()
+                for piece in _split_long_sentence(text[starts[i]:ends[i]], tokenizer, max_tokens):
+                    piece_tokens = count_tokens(piece, tokenizer)
+                    windows.append({
+                        "text": piece,
+                        "tokens": piece_tokens,
+                        "tail": piece if piece_tokens <= context_tokens else ""
+                    })
+                continue
+            if current_tokens + counts[i] > max_tokens:
+                flush()
+            if first is None:
+                first = i
+            last = i + 1
+            current_tokens += counts[i]
+        if paragraph_tokens > max_tokens:
+            # The next paragraph starts on a boundary of its own, not wherever this one's split ended
+            flush()
+    flush()
+    return windows
+
+def _budget_ratio():
+    """
+    Generated tokens allowed per source token, from the 95th percentile of recent windows
+    """
+    with _output_ratios_lock:
+        ratios = sorted(_output_ratios)
+    if len(ratios) < BUDGET_MIN_SAMPLES:
+        return BUDGET_RATIO_MAX
+    high = ratios[min(int(len(ratios) * 0.95), len(ratios) - 1)]
+    return min(max(high * BUDGET_HEADROOM, BUDGET_RATIO_MIN), BUDGET_RATIO_MAX)
+
+def record_output_ratio(window_tokens, output_tokens):
+    """
+    Record how long a window's rewrite came out, to size future budgets
+    """
+    if window_tokens:
+        with _output_ratios_lock:
+            _output_ratios.append(output_tokens / window_tokens)
+
+def _max_new_tokens(window_tokens):
+    """
+    Generation budget for a window of the given size
+
+    A rewrite that hits its budget records the capped ratio, which still
+    raises the next budget by the headroom factor, so budgets recover from
+    being set too low.
+    """
+    return min(max(math.ceil(window_tokens * _budget_ratio()), 32), MAX_NEW_TOKENS_PER_CHUNK)
+
+def _prefix_state(granite_pipe, header):
+    """
+    Return the token ids and past key/values of a prompt header, computing them once
+    """
+    import torch
+
+    model = granite_pipe.model
+    key = (id(model), header)
+    with _prefix_cache_lock:
+        if key in _prefix_cache:
+            _prefix_cache.move_to_end(key)
+            return _prefix_cache[key]
+    header_ids = granite_pipe.tokenizer(header, return_tensors="pt")["input_ids"].to(model.device)
+    with torch.inference_mode():
+        past_key_values = model(header_ids, use_cache=True).past_key_values
+    with _prefix_cache_lock:
+        _prefix_cache[key] = (header_ids, past_key_values)
+        while len(_prefix_cache) > PREFIX_CACHE_SIZE:
+            _prefix_cache.popitem(last=False)
+    return header_ids, past_key_values
+
+def _assisted_kwargs(granite_pipe):
+    """
+    Extra model.generate arguments that turn on speculative decoding with the draft model
+
+    The draft proposes a few tokens, Granite scores them all in one forward
+    pass and keeps the longest accepted run. With sampling, rejected tokens
+    are resampled so the output follows Granite's own distribution.
+    """
+    draft = getattr(granite_pipe, "draft_model", None)
+    if draft is None:
+        return {}
+    kwargs = {"assistant_model": draft}
+    if granite_pipe.draft_tokenizer is not None:
+        # Different vocabularies: transformers translates drafted tokens through text
+        kwargs["tokenizer"] = granite_pipe.tokenizer
+        kwargs["assistant_tokenizer"] = granite_pipe.draft_tokenizer
+    return kwargs
+
+def prepare_generation_inputs(granite_pipe, prompt):
+    """
+    Tokenize a prompt for model.generate, reusing the cached KV state of its header
+
+    The instruction header (everything up to the first blank line) is the
+    same for every chunk with a given tone and style, so its key/values are
+    computed once and only the chunk-specific part of the prompt is prefilled.
+    With a draft model the full prompt is passed instead, since assisted
+    generation keeps the caches of both models in step itself.
+
+    Returns:
+        dict: Keyword arguments for model.generate
+    """
+    import torch
+
+    model = granite_pipe.model
+    tokenizer = granite_pipe.tokenizer
+    boundary = prompt.find("\n\n")
+    assisted = getattr(granite_pipe, "draft_model", None) is not None
+    if not PREFIX_CACHE_ENABLED or boundary < 0 or assisted:
+        return dict(tokenizer(prompt, return_tensors="pt").to(model.device))
+    header = prompt[:boundary + 2]
+    header_ids, past_key_values = _prefix_state(granite_pipe, header)
+    body_ids = tokenizer(
+        prompt[len(header):], return_tensors="pt", add_special_tokens=False
+    )["input_ids"].to(model.device)
+    input_ids = torch.cat([header_ids, body_ids], dim=1)
+    return {
+        "input_ids": input_ids,
+        "attention_mask": torch.ones_like(input_ids),
+        # generate extends the cache in place, so every call gets its own copy
+        "past_key_values": copy.deepcopy(past_key_values)
+    }
+
+def _generate_rewrite(granite_pipe, prompt, max_new_tokens):
+    """
+    Run a single rewrite prompt through the model and return only the new text
+    """
+    if getattr(granite_pipe, "is_remote", False):
+        return granite_pipe.generate([prompt], [max_new_tokens])[0]
+
+    import torch
+
+    model = granite_pipe.model
+    tokenizer = granite_pipe.tokenizer
+    inputs = prepare_generation_inputs(granite_pipe, prompt)
+    prompt_tokens = inputs["input_ids"].shape[1]
+    assisted = _assisted_kwargs(granite_pipe)
+    with span("granite.generate", prompt_tokens=prompt_tokens, assisted=bool(assisted)) as s, \
+            torch.inference_mode():
+        output = model.generate(
+            **inputs,
+            **assisted,
+            max_new_tokens=max_new_tokens,
+            do_sample=True,
+            temperature=0.7,
+            top_p=0.9,
+            pad_token_id=tokenizer.eos_token_id
+        )
+        s["tokens"] = output.shape[1] - prompt_tokens
+    return tokenizer.decode(output[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True).strip()
+
+def generate_batch(granite_pipe, prompts, max_new_tokens, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Generate completions for many prompts with length-bucketed, left-padded batches
+
+    Prompts are sorted by token length so each batch holds prompts of similar
+    size, which keeps padding waste low. Each batch goes through a single
+    model.generate call. The draft model is not used here: assisted
+    generation in transformers handles one sequence at a time.
+
+    Args:
+        granite_pipe: Pipeline returned by load_granite_model
+        prompts (list[str]): Prompts to complete
+        max_new_tokens (list[int]): Generation budget for each prompt
+        batch_size (int): Maximum number of prompts per generate call
+
+    Returns:
+        list[str]: Generated text (prompt excluded) in the order of prompts
+    """
+    if getattr(granite_pipe, "is_remote", False):
+        # The model server forms its own batches across all of its clients
+        return granite_pipe.generate(prompts, max_new_tokens)
+
+    import torch
+
+    model = granite_pipe.model
+    tokenizer = _left_padding(granite_pipe.tokenizer)
+    lengths = [len(tokenizer.encode(p)) for p in prompts]
+    order = sorted(range(len(prompts)), key=lambda i: lengths[i])
+    outputs = [""] * len(prompts)
+
+    for start in range(0, len(order), batch_size):
+        bucket = order[start:start + batch_size]
+        encoded = tokenizer(
+            [prompts[i] for i in bucket],
+            return_tensors="pt",
+            padding=True
+        ).to(model.device)
+        with span("granite.generate_batch", prompts=len(bucket)) as s, torch.inference_mode():
+            generated = model.generate(
+                **encoded,
+                max_new_tokens=max(max_new_tokens[i] for i in bucket),
+                do_sample=True,
+                temperature=0.7,
+                top_p=0.9,
+                pad_token_id=tokenizer.pad_token_id
+            )
+        # Left padding aligns every prompt to end at the same column
+        new_tokens = generated[:, encoded["input_ids"].shape[1]:]
+        s["tokens"] = int((new_tokens != tokenizer.pad_token_id).sum())
+        for row, i in enumerate(bucket):
+            outputs[i] = tokenizer.decode(new_tokens[row], skip_special_tokens=True).strip()
+    return outputs
+
+def _left_padding(tokenizer):
+    """
+    Set a tokenizer up for batched generation, where every prompt must end at the same column
+    """
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+class _RowStreamer:
+    """
+    Streamer for a batched model.generate call that decodes each row on its own
+
+    transformers hands a streamer the prompts once and then one new token
+    per row at every step. Each row's text is passed on in whole words as
+    it grows, and a row stops once it ends or uses up its own budget, even
+    while longer rows keep generating.
+    """
+
+    def __init__(self, tokenizer, budgets, on_piece):
+        self.tokenizer = tokenizer
+        self.budgets = budgets
+        self.on_piece = on_piece
+        self.tokens = [[] for _ in budgets]
+        self._sent = [0] * len(budgets)
+        self._finished = [False] * len(budgets)
+        self._prompt_seen = False
+
+    def put(self, value):
+        if not self._prompt_seen:
+            # The first call carries the prompts
+            self._prompt_seen = True
+            return
+        for row, token in enumerate(value.reshape(len(self.budgets), -1)[:, -1].tolist()):
+            if self._finished[row]:
+                continue
+            if token == self.tokenizer.eos_token_id:
+                self._finish(row)
+                continue
+            self.tokens[row].append(token)
+            text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+            # Hold back the last word, which may still be missing characters
+            ready = text.rfind(" ") + 1
+            if ready > self._sent[row]:
+                self.on_piece(row, text[self._sent[row]:ready])
+                self._sent[row] = ready
+            if len(self.tokens[row]) >= self.budgets[row]:
+                self._finish(row)
+
+    def end(self):
+        for row in range(len(self.budgets)):
+            if not self._finished[row]:
+                self._finish(row)
+
+    def _finish(self, row):
+        self._finished[row] = True
+        text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+        if len(text) > self._sent[row]:
+            self.on_piece(row, text[self._sent[row]:])
+            self._sent[row] = len(text)
+
+    def texts(self):
+        return [self.tokenizer.decode(tokens, skip_special_tokens=True).strip() for tokens in self.tokens]
+
+def generate_batch_streaming(granite_pipe, prompts, max_new_tokens, on_piece):
+    """
+    Generate completions for several prompts in one batch, streaming every row as it grows
+
+    All prompts share a single left-padded model.generate call, so several
+    token streams cost one decoding step per token rather than one each.
+
+    Args:
+        granite_pipe: Pipeline returned by load_granite_model
+        prompts (list[str]): Prompts to complete
+        max_new_tokens (list[int]): Generation budget for each prompt
+        on_piece (callable): Called as on_piece(row, text) with each new piece of a prompt's output
+
+    Returns:
+        list[str]: Generated text (prompt excluded) in the order of prompts
+    """
+    import torch
+
+    model = granite_pipe.model
+    tokenizer = _left_padding(granite_pipe.tokenizer)
+    encoded = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+    streamer = _RowStreamer(tokenizer, max_new_tokens, on_piece)
+    with span("granite.generate_batch", prompts=len(prompts), streamed=True) as s, torch.inference_mode():
+        model.generate(
+            **encoded,
+            streamer=streamer,
+            max_new_tokens=max(max_new_tokens),
+            do_sample=True,
+            temperature=0.7,
+            top_p=0.9,
+            pad_token_id=tokenizer.pad_token_id
+        )
+        s["tokens"] = sum(len(tokens) for tokens in streamer.tokens)
+    return streamer.texts()
+
+def _generate_adaptive_batches(granite_pipe, prompts, budgets, max_batch_size, on_batch=None):
+    """
+    Generate prompts in reading order, in batches sized by the Granite scheduler
+
+    The batch grows while generated tokens per second keep up and backs off
+    when a batch errors or takes longer than GRANITE_TARGET_BATCH_SECONDS.
+    Consecutive windows go together, so the opening of a document is
+    rewritten first. A batch that fails leaves only its own windows empty.
+
+    Args:
+        on_batch (callable): Called as on_batch(start, texts) as each batch finishes
+
+    Returns:
+        list[str]: Generated text in the order of prompts, empty where generation failed
+    """
+    scheduler = get_scheduler(
+        "granite", concurrency=2, max_concurrency=DEFAULT_BATCH_SIZE * 2,
+        target_latency=GRANITE_TARGET_BATCH_SECONDS
+    )
+    outputs = []
+    while len(outputs) < len(prompts):
+        start = len(outputs)
+        end = min(start + max(1, min(scheduler.concurrency, max_batch_size)), len(prompts))
+        try:
+            with scheduler.request(size=sum(budgets[start:end])):
+                if end - start == 1:
+                    # A lone window keeps the benefit of the prompt header KV cache
+                    texts = [_generate_rewrite(granite_pipe, prompts[start], budgets[start])]
+                else:
+                    texts = generate_batch(granite_pipe, prompts[start:end], budgets[start:end], end - start)
+        except Exception as e:
+            st.warning(f"Text enhancement failed for {end - start} passages, using original text: {str(e)}")
+            texts = [""] * (end - start)
+        outputs.extend(texts)
+        if on_batch:
+            on_batch(start, texts)
+    return outputs
+
+def _rewrite_prompts(granite_pipe, prompts, budgets, batch_size, on_batch=None):
+    """
+    Rewrite prompts either in batches or one at a time
+
+    A failed generation leaves only the prompts it covered empty.
+
+    Args:
+        on_batch (callable): Called as on_batch(start, texts) as each group of
+            outputs finishes, so finished work can be kept before the rest is done
+
+    Returns:
+        list[str]: Rewritten text per prompt, empty where generation failed
+    """
+    if getattr(granite_pipe, "is_remote", False) and len(prompts) > 1:
+        # Everything is sent at once so the model server can batch it; replies are taken one by one
+        rewritten = []
+        for text, error in granite_pipe.iter_generate(prompts, budgets):
+            if error:
+                st.warning(f"Text enhancement failed for one passage, using original text: {error}")
+                text = ""
+            if on_batch:
+                on_batch(len(rewritten), [text])
+            rewritten.append(text)
+        return rewritten
+    if batch_size > 1 and len(prompts) > 1:
+        return _generate_adaptive_batches(granite_pipe, prompts, budgets, batch_size, on_batch)
+    rewritten = []
+    for prompt, budget in zip(prompts, budgets):
+        try:
+            text = _generate_rewrite(granite_pipe, prompt, budget)
+        except Exception as e:
+            st.warning(f"Text enhancement failed for one passage, using original text: {str(e)}")
+            text = ""
+        if on_batch:
+            on_batch(len(rewritten), [text])
+        rewritten.append(text)
+    return rewritten
+
+def _build_prompts(text, tone, language, style, granite_pipe):
+    """
+    Split text into windows and build one rewrite prompt per window
+
+    Context comes from the original text, so every prompt can be built up front.
+
+    Returns:
+        tuple[list[dict], list[str]]: Windows and their prompts
+    """
+    tokenizer = getattr(granite_pipe, "tokenizer", None)
+    windows = split_text_into_windows(text, tokenizer)
+    prompts = []
+    context = ""
+    for window in windows:
+        prompts.append(create_enhancement_prompt(window["text"], tone, language, style, context=context))
+        context = window["tail"]
+    return windows, prompts
+
+def model_identity(granite_pipe):
+    """
+    Identify the model, backend and draft model behind a pipeline, for cache keys
+
+    Outputs of the fp32 and int8 backends, or with and without a draft
+    model, differ, so none of them may be served from another's cache.
+
+    Returns:
+        str: 'model|backend|draft'
+    """
+    model_name = getattr(granite_pipe, "model_name", None) or getattr(
+        getattr(granite_pipe, "model", None), "name_or_path", "unknown"
+    )
+    backend = getattr(granite_pipe, "backend", None) or "unknown"
+    draft = getattr(granite_pipe, "draft_model_name", None) or "none"
+    return f"{model_name}|{backend}|{draft}"
+
+def _rewrite_cache_key(granite_pipe, tone, style, language, prompt):
+    return make_cache_key("granite", model_identity(granite_pipe), tone, style, language, prompt)
+
+def iter_text_with_granite(text, tone="neutral", language="English", style="neutral", granite_pipe=None,
+                           use_cache=True):
+    """
+    Rewrite text window by window, yielding each window as soon as it is ready
+
+    Args:
+        text (str): Input text to process
+        tone (str): Desired tone (formal, casual, emotional)
+        language (str): Target language
+        style (str): Voice style (neutral, narration, animated)
+        granite_pipe: Pre-loaded Granite pipeline
+        use_cache (bool): Reuse rewrites of unchanged windows from the on-disk cache
+
+    Yields:
+        tuple[int, int, str]: Window index, window count and enhanced text
+    """
+    windows, prompts = _build_prompts(text, tone, language, style, granite_pipe)
+    yield from iter_rewritten_windows(windows, prompts, tone, language, style, granite_pipe, use_cache)
+
+def iter_rewritten_windows(windows, prompts, tone="neutral", language="English", style="neutral", granite_pipe=None,
+                           use_cache=True, skip=()):
+    """
+    Rewrite windows built by _build_prompts in order, yielding each as soon as it is ready
+
+    Args:
+        windows (list[dict]): Windows of the document
+        prompts (list[str]): Rewrite prompt of each window
+        tone (str): Desired tone (formal, casual, emotional)
+        language (str): Target language
+        style (str): Voice style (neutral, narration, animated)
+        granite_pipe: Pre-loaded Granite pipeline
+        use_cache (bool): Reuse rewrites of unchanged windows from the on-disk cache
+        skip (set[int]): Indices of windows already finished elsewhere; they are
+            neither generated nor yielded
+
+    Yields:
+        tuple[int, int, str]: Window index, window count and enhanced text
+    """
+    cache = get_cache() if use_cache else None
+    for i, (window, prompt) in enumerate(zip(windows, prompts)):
+        if i in skip:
+            continue
+        enhanced = None
+        if granite_pipe:
+            key = _rewrite_cache_key(granite_pipe, tone, style, language, prompt)
+            enhanced = cache.get_text(key) if cache else None
+            if enhanced is None:
+                enhanced = _rewrite_prompts(granite_pipe, [prompt], [_max_new_tokens(window["tokens"])], 1)[0]
+                if cache and enhanced:
+                    cache.put_text(key, enhanced)
+        # The narration opener belongs to the start of the book only
+        window_style = "neutral" if style == "narration" and i > 0 else style
+        yield i, len(windows), format_text_for_narration(enhanced or window["text"], tone, window_style)
+
+def stream_generation(granite_pipe, prompt, max_new_tokens):
+    """
+    Generate from a prompt, yielding decoded text pieces as tokens are produced
+
+    Generation runs on a background thread and hands text to the caller
+    through a TextIteratorStreamer.
+    """
+    if getattr(granite_pipe, "is_remote", False):
+        yield from granite_pipe.stream(prompt, max_new_tokens)
+        return
+
+    import torch
+    from transformers import TextIteratorStreamer
+
+    model = granite_pipe.model
+    tokenizer = granite_pipe.tokenizer
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    encoded = prepare_generation_inputs(granite_pipe, prompt)
+    errors = []
+
+    def generate():
+        try:
+            with torch.inference_mode():
+                model.generate(
+                    **encoded,
+                    **_assisted_kwargs(granite_pipe),
+                    streamer=streamer,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=True,
+                    temperature=0.7,
+                    top_p=0.9,
+                    pad_token_id=tokenizer.eos_token_id
+                )
+        except Exception as e:
+            errors.append(e)
+            # Unblock the consumer waiting on the streamer
+            streamer.end()
+
+    thread = threading.Thread(target=generate, daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    first_token_at = None
+    pieces = []
+    for piece in streamer:
+        if first_token_at is None:
+            # Time to the first token is dominated by the prompt prefill
+            first_token_at = time.perf_counter()
+            observe("granite.prefill", first_token_at - start, prompt_tokens=encoded["input_ids"].shape[1])
+        pieces.append(piece)
+        yield piece
+    thread.join()
+    if first_token_at is not None:
+        text = "".join(pieces)
+        observe("granite.decode", time.perf_counter() - first_token_at,
+                tokens=len(tokenizer.encode(text, add_special_tokens=False)), chars=len(text))
+    if errors:
+        raise errors[0]
+
+def _pop_sentences(buffer):
+    """
+    Split off the complete sentences at the front of a streaming buffer
+
+    A sentence is complete once the whitespace after its terminal punctuation
+    has arrived; it keeps its closing quotes and brackets, like the sentences
+    of a Document.
+
+    Returns:
+        tuple[list[str], str]: Complete sentences and the unfinished remainder
+    """
+    complete = []
+    start = 0
+    for match in SENTENCE_BREAK.finditer(buffer):
+        sentence = buffer[start:match.start(1)].strip()
+        if sentence:
+            complete.append(sentence)
+        start = match.end()
+    return complete, buffer[start:]
+
+def iter_sentences_with_granite(text, tone="neutral", language="English", style="neutral", granite_pipe=None,
+                                use_cache=True):
+    """
+    Rewrite text and yield each sentence as soon as the model has finished it
+
+    Windows are generated in order with token streaming, so downstream TTS can
+    start on the first sentence while the model is still decoding the rest.
+
+    Yields:
+        tuple[int, int, str]: Window index, window count and a formatted sentence
+    """
+    windows, prompts = _build_prompts(text, tone, language, style, granite_pipe)
+    cache = get_cache() if use_cache else None
+    first = True
+
+    def formatted(sentence):
+        nonlocal first
+        # The narration opener belongs to the start of the book only
+        sentence_style = "neutral" if style == "narration" and not first else style
+        first = False
+        return format_text_for_narration(sentence, tone, sentence_style)
+
+    for i, (window, prompt) in enumerate(zip(windows, prompts)):
+        key = _rewrite_cache_key(granite_pipe, tone, style, language, prompt) if granite_pipe else None
+        cached = cache.get_text(key) if cache and key else None
+        if cached is not None:
+            count("granite.cache_hits")
+        if not granite_pipe or cached is not None:
+            for sentence in Document(cached or window["text"]).sentences():
+                yield i, len(windows), formatted(str(sentence))
+            continue
+
+        generated = []
+        buffer = ""
+        failed = False
+        try:
+            for piece in stream_generation(granite_pipe, prompt, _max_new_tokens(window["tokens"])):
+                generated.append(piece)
+                buffer += piece
+                sentences, buffer = _pop_sentences(buffer)
+                for sentence in sentences:
+                    yield i, len(windows), formatted(sentence)
+        except Exception as e:
+            st.warning(f"Text enhancement failed for one passage, using original text: {str(e)}")
+            failed = True
+            if not generated:
+                buffer = window["text"]
+        if buffer.strip():
+            yield i, len(windows), formatted(buffer.strip())
+        if cache and generated and not failed:
+            cache.put_text(key, "".join(generated).strip())
+
+def process_text_with_granite(text, tone="neutral", language="English", style="neutral", granite_pipe=None,
+                              batch_size=1, use_cache=True):
     """
     Process input text using IBM Granite model to enhance it for audiobook narration
+
+    The document is split into token-budgeted windows which are rewritten in
+    order, each with the tail of the previous window as context, and stitched
+    back together so the whole text is covered.
     
     Args:
         text (str): Input text to process
@@ -69,6 +985,8 @@ def process_text_with_granite(text, tone="neutral", language="English", style="n
         language (str): Target language
         style (str): Voice style (neutral, narration, animated)
         granite_pipe: Pre-loaded Granite pipeline
+        batch_size (int): Windows generated together per model call (1 = one at a time)
+        use_cache (bool): Reuse rewrites of unchanged windows from the on-disk cache
     
     Returns:
         str: Enhanced text suitable for TTS conversion
@@ -78,37 +996,146 @@ def process_text_with_granite(text, tone="neutral", language="English", style="n
         return format_text_for_narration(text, tone, style)
     
     try:
-        # Create a prompt for text enhancement based on parameters
-        prompt = create_enhancement_prompt(text, tone, language, style)
-        
-        # Generate enhanced text using Granite
-        result = granite_pipe(
-            prompt,
-            max_new_tokens=min(len(text.split()) * 2, 512),
-            num_return_sequences=1,
-            temperature=0.7,
-            do_sample=True
-        )
-        
-        # Extract the generated text
-        enhanced_text = result[0]['generated_text']
-        
-        # Clean up the output (remove the prompt part)
-        if prompt in enhanced_text:
-            enhanced_text = enhanced_text.replace(prompt, "").strip()
-        
-        # Apply additional formatting for better TTS
-        enhanced_text = format_text_for_narration(enhanced_text, tone, style)
-        
-        return enhanced_text if enhanced_text.strip() else text
+        return rewrite_document(text, tone, language, style, granite_pipe, batch_size, use_cache)[0]
     
     except Exception as e:
         st.warning(f"Text enhancement failed, using original text: {str(e)}")
         return format_text_for_narration(text, tone, style)
 
-def create_enhancement_prompt(text, tone, language, style):
+def rewrite_document(text, tone, language, style, granite_pipe, batch_size=1, use_cache=True):
+    """
+    Rewrite a whole document window by window, reporting whether every window succeeded
+
+    Windows whose generation failed keep their original text. Errors outside
+    a single window's generation propagate to the caller.
+
+    Returns:
+        tuple[str, bool]: Enhanced text and whether every window was rewritten
+    """
+    windows, prompts = _build_prompts(text, tone, language, style, granite_pipe)
+    budgets = [_max_new_tokens(w["tokens"]) for w in windows]
+    rewritten = [None] * len(prompts)
+    keys = [None] * len(prompts)
+    if use_cache:
+        cache = get_cache()
+        for i, prompt in enumerate(prompts):
+            keys[i] = _rewrite_cache_key(granite_pipe, tone, style, language, prompt)
+            rewritten[i] = cache.get_text(keys[i])
+    
+    # Only windows that missed the cache go to the model
+    pending = [i for i, chunk in enumerate(rewritten) if chunk is None]
+    count("granite.cache_hits", len(prompts) - len(pending))
+    tokenizer = getattr(granite_pipe, "tokenizer", None)
+
+    def finished(start, chunks):
+        # Cached as soon as each batch is done, so a later failure or interruption keeps it
+        for i, chunk in zip(pending[start:start + len(chunks)], chunks):
+            rewritten[i] = chunk
+            if chunk:
+                record_output_ratio(windows[i]["tokens"], count_tokens(chunk, tokenizer))
+                if use_cache:
+                    cache.put_text(keys[i], chunk)
+
+    with span("granite.rewrite", windows=len(pending), chars=sum(len(windows[i]["text"]) for i in pending)):
+        _rewrite_prompts(
+            granite_pipe,
+            [prompts[i] for i in pending],
+            [budgets[i] for i in pending],
+            batch_size,
+            on_batch=finished
+        )
+    complete = all(rewritten)
+    rewritten = [chunk or window["text"] for chunk, window in zip(rewritten, windows)]
+    
+    # Apply additional formatting for better TTS
+    enhanced_text = format_text_for_narration("\n\n".join(rewritten), tone, style)
+    
+    if not enhanced_text.strip():
+        return text, False
+    return enhanced_text, complete
+
+def compare_backends(reference_pipe, candidate_pipe, prompts, max_new_tokens=64):
+    """
+    Measure how closely a candidate backend tracks the reference model
+
+    The reference continuation of each prompt is decoded greedily, then both
+    models score the same token sequence so their next-token distributions
+    can be compared position by position.
+
+    Args:
+        reference_pipe: Pipeline of the fp32 model
+        candidate_pipe: Pipeline of the backend under test
+        prompts (list[str]): Evaluation prompts
+        max_new_tokens (int): Continuation length per prompt
+
+    Returns:
+        dict: 'top1_agreement' (share of positions with the same argmax token),
+            'mean_kl' (KL divergence of candidate from reference, in nats) and
+            'text_similarity' (difflib ratio of the two greedy outputs)
+    """
+    import difflib
+    import torch
+
+    tokenizer = reference_pipe.tokenizer
+    agreements, kls, similarities = [], [], []
+    for prompt in prompts:
+        encoded = tokenizer(prompt, return_tensors="pt")
+        prompt_length = encoded["input_ids"].shape[1]
+        with torch.inference_mode():
+            reference_ids = reference_pipe.model.generate(
+                **encoded, max_new_tokens=max_new_tokens, do_sample=False,
+                pad_token_id=tokenizer.eos_token_id
+            )
+            candidate_ids = candidate_pipe.model.generate(
+                **encoded, max_new_tokens=max_new_tokens, do_sample=False,
+                pad_token_id=tokenizer.eos_token_id
+            )
+            reference_logits = reference_pipe.model(reference_ids).logits[0, prompt_length - 1:-1].float()
+            candidate_logits = candidate_pipe.model(reference_ids).logits[0, prompt_length - 1:-1].float()
+        reference_log_probs = torch.log_softmax(reference_logits, dim=-1)
+        candidate_log_probs = torch.log_softmax(candidate_logits, dim=-1)
+        agreements.append((reference_logits.argmax(-1) == candidate_logits.argmax(-1)).float().mean().item())
+        kls.append((reference_log_probs.exp() * (reference_log_probs - candidate_log_probs)).sum(-1).mean().item())
+        similarities.append(difflib.SequenceMatcher(
+            None,
+            tokenizer.decode(reference_ids[0, prompt_length:], skip_special_tokens=True),
+            tokenizer.decode(candidate_ids[0, prompt_length:], skip_special_tokens=True)
+        ).ratio())
+    return {
+        "top1_agreement": sum(agreements) / len(agreements),
+        "mean_kl": sum(kls) / len(kls),
+        "text_similarity": sum(similarities) / len(similarities)
+    }
+
+def create_enhancement_prompt(text, tone, language, style, context=""):
     """
     Create a prompt for the Granite model to enhance text for audiobook narration
+
+    Args:
+        text (str): Passage to rewrite
+        tone (str): Desired tone
+        language (str): Target language
+        style (str): Voice style
+        context (str): Preceding passage, shown to the model for continuity only
+    """
+    context_block = ""
+    if context:
+        context_block = f"""Previous passage (for continuity only, do not rewrite): {context}
+
+"""
+    
+    prompt = f"""{create_prompt_header(tone, language, style)}{context_block}Original text: {text}
+
+Enhanced text:"""
+    
+    return prompt
+
+def create_prompt_header(tone, language, style):
+    """
+    Create the instruction block shared by every prompt with the same tone, language and style
+
+    The header ends with the prompt's first blank line, which is how
+    prepare_generation_inputs finds it to reuse its cached key/values.
     """
     tone_descriptions = {
         "formal": "professional and authoritative",
@@ -125,16 +1152,12 @@ def create_enhancement_prompt(text, tone, language, style):
     tone_desc = tone_descriptions.get(tone, "clear and engaging")
     style_desc = style_descriptions.get(style, "clear and balanced")
     
-    prompt = f"""Enhance the following text for audiobook narration in {language}. 
+    return f"""Enhance the following text for audiobook narration in {language}. 
 Make it {tone_desc} in tone and {style_desc} in style. 
 Add appropriate pauses, emphasis, and flow for better audio delivery.
 Preserve the original meaning while making it more suitable for spoken word.
 
-Original text: {text[:500]}...
-
-Enhanced text:"""
-    
-    return prompt
+"""
 
 def format_text_for_narration(text, tone="neutral", style="neutral"):
     """
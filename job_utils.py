@@ -0,0 +1,204 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from granite_utils import iter_rewritten_windows, _build_prompts
+from metrics_utils import span, set_gauge
+from mp3_utils import Mp3ConcatWriter, concat_mp3_bytes
+from tts_utils import get_watson_client, split_text_for_tts, synthesize_chunks_watson, WATSON_MAX_CHUNK_CHARS
+
+# Where job state and rendered audio are kept
+JOBS_DIR = os.getenv("ECHOVERSE_JOBS_DIR", ".echoverse_jobs")
+JOBS_DB = os.path.join(JOBS_DIR, "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("ECHOVERSE_JOB_WORKERS", "1"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    text TEXT NOT NULL,
+    tone TEXT NOT NULL,
+    style TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    segments_total INTEGER,
+    segments_done INTEGER NOT NULL DEFAULT 0,
+    output_path TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    audio_path TEXT NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+class JobQueue:
+    """
+    Local audiobook job queue persisted in SQLite and drained by worker threads
+
+    Each rewritten and synthesized segment is stored as soon as it finishes,
+    so a job interrupted by a restart resumes from its last finished segment.
+    """
+
+    def __init__(self, granite_loader=None, db_path=JOBS_DB, workers=JOB_WORKERS):
+        self.granite_loader = granite_loader
+        self.db_path = db_path
+        self.jobs_dir = os.path.dirname(db_path) or "."
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # Jobs that were running when the process died go back to the queue
+            conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"echoverse-job-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, text, tone="neutral", style="neutral", voice="en-US_AllisonV3Voice"):
+        """
+        Queue a document for rendering
+
+        Returns:
+            str: Job ID
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, text, tone, style, voice, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, text, tone, style, voice, now, now)
+            )
+        self._wakeup.set()
+        return job_id
+
+    def status(self, job_id):
+        """
+        Return a job's status and progress, or None if unknown
+
+        Returns:
+            dict: 'status', 'segments_done', 'segments_total', 'output_path', 'error'
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, status, segments_done, segments_total, output_path, error, created_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def segments(self, job_id):
+        """
+        Return the finished segments of a job in order
+
+        Returns:
+            list[dict]: 'idx', 'text' and 'audio_path' per segment
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT idx, text, audio_path FROM segments WHERE job_id = ? ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    def _claim(self):
+        """
+        Atomically move the oldest queued job to running
+        """
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            set_gauge("jobs.queued", queued)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                    (time.time(), row["id"])
+                )
+            conn.execute("COMMIT")
+        return dict(row) if row else None
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            job = self._claim()
+            if job is None:
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+            try:
+                self._run(job)
+            except Exception as e:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                        (str(e), time.time(), job["id"])
+                    )
+
+    def _run(self, job):
+        job_dir = os.path.join(self.jobs_dir, job["id"])
+        os.makedirs(job_dir, exist_ok=True)
+        done = {segment["idx"] for segment in self.segments(job["id"])}
+        granite_pipe = self.granite_loader() if self.granite_loader else None
+        tts = get_watson_client()
+
+        windows, prompts = _build_prompts(job["text"], job["tone"], "English", job["style"], granite_pipe)
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET segments_total = ?, updated_at = ? WHERE id = ?",
+                (len(windows), time.time(), job["id"])
+            )
+
+        # Finished segments are skipped before their window is rewritten, not after
+        for index, _, enhanced in iter_rewritten_windows(
+            windows, prompts, job["tone"], "English", job["style"], granite_pipe, skip=done
+        ):
+            chunks = split_text_for_tts(enhanced, WATSON_MAX_CHUNK_CHARS)
+            audio_path = os.path.join(job_dir, f"{index:05d}.mp3")
+            with span("jobs.segment", chars=len(enhanced)), open(audio_path, "wb") as f:
+                f.write(concat_mp3_bytes(synthesize_chunks_watson(tts, chunks, job["voice"])))
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO segments (job_id, idx, text, audio_path) VALUES (?, ?, ?, ?)",
+                    (job["id"], index, enhanced, audio_path)
+                )
+                conn.execute(
+                    "UPDATE jobs SET segments_done = segments_done + 1, updated_at = ? WHERE id = ?",
+                    (time.time(), job["id"])
+                )
+
+        output_path = os.path.join(job_dir, "audiobook.mp3")
+        with open(output_path, "wb") as audio_file, Mp3ConcatWriter(audio_file) as writer:
+            for segment in self.segments(job["id"]):
+                with open(segment["audio_path"], "rb") as f:
+                    writer.append(f.read())
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', output_path = ?, updated_at = ? WHERE id = ?",
+                (output_path, time.time(), job["id"])
+            )
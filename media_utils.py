@@ -0,0 +1,209 @@
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+# Rendered audiobooks are kept here and served from disk
+MEDIA_DIR = os.getenv("ECHOVERSE_MEDIA_DIR", ".echoverse_media")
+# Port 0 lets the OS pick a free port, so several app processes can share a host
+MEDIA_PORT = int(os.getenv("ECHOVERSE_MEDIA_PORT", "0"))
+MEDIA_HOST = os.getenv("ECHOVERSE_MEDIA_HOST", "127.0.0.1")
+# Base URL the browser uses to reach the media server, e.g. a reverse-proxy path; "{port}" is
+# replaced with the bound port. When unset it is http://localhost:{port}, which a browser on the
+# same machine as the app reaches; set it when users connect from elsewhere.
+MEDIA_URL = os.getenv("ECHOVERSE_MEDIA_URL")
+# Rendered files older than this are removed
+MEDIA_MAX_AGE = 24 * 3600
+MEDIA_CHUNK_BYTES = 256 * 1024
+# How often a reader of a file that is still being written checks for new bytes
+MEDIA_POLL_SECONDS = 0.2
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+class MediaServer:
+    """
+    HTTP server that streams registered files from disk with Range support
+
+    Browsers seek in audio with range requests, so a multi-hour audiobook is
+    never held in memory by the app. Only files registered through url() are
+    served, each under an unguessable token. A file inside live() is still
+    being written; it is streamed from the start without a length and the
+    response follows the file until live() exits.
+    """
+
+    def __init__(self, host=MEDIA_HOST, port=MEDIA_PORT, base_url=MEDIA_URL):
+        self._files = {}
+        self._tokens = {}
+        self._live = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self.port = self._server.server_address[1]
+        self.base_url = (base_url or "http://localhost:{port}").format(port=self.port).rstrip("/")
+        threading.Thread(target=self._server.serve_forever, name="echoverse-media", daemon=True).start()
+
+    def url(self, path, download_name=None):
+        """
+        Return the URL serving the file at path, optionally as a download
+
+        Args:
+            path (str): File to serve
+            download_name (str): File name offered to the browser for saving
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            token = self._tokens.get(path)
+            if token is None:
+                token = uuid.uuid4().hex
+                self._tokens[path] = token
+                self._files[token] = path
+        url = f"{self.base_url}/media/{token}"
+        if download_name:
+            url += f"?download={quote(download_name)}"
+        return url
+
+    @contextmanager
+    def live(self, path):
+        """
+        Mark the file at path as still being written for the duration of the block
+
+        Args:
+            path (str): File that grows inside the block
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            self._live.add(path)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._live.discard(path)
+
+    def is_live(self, path):
+        with self._lock:
+            return path in self._live
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def _serve(self, send_body):
+                request = urlparse(self.path)
+                token = request.path.rsplit("/", 1)[-1]
+                with server._lock:
+                    path = server._files.get(token)
+                if path is None or not request.path.startswith("/media/") or not os.path.exists(path):
+                    self.send_error(404)
+                    return
+                if server.is_live(path):
+                    self._serve_live(path, send_body)
+                    return
+                size = os.path.getsize(path)
+                start, end = 0, size - 1
+                status = 200
+                match = _RANGE.match(self.headers.get("Range", ""))
+                if match and (match.group(1) or match.group(2)):
+                    if match.group(1):
+                        start = int(match.group(1))
+                        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+                    else:
+                        # Suffix range: the last N bytes
+                        start = max(size - int(match.group(2)), 0)
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{size}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    status = 206
+
+                self.send_response(status)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                download = parse_qs(request.query).get("download")
+                if download:
+                    self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quote(download[0])}")
+                self.end_headers()
+                if not send_body:
+                    return
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    remaining = end - start + 1
+                    try:
+                        while remaining > 0:
+                            chunk = f.read(min(MEDIA_CHUNK_BYTES, remaining))
+                            if not chunk:
+                                break
+                            self.wfile.write(chunk)
+                            remaining -= len(chunk)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The player seeked elsewhere and dropped this request
+                        pass
+
+            def _serve_live(self, path, send_body):
+                # The final length is unknown, so ranges are refused and the connection ends the body
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Accept-Ranges", "none")
+                self.send_header("Cache-Control", "no-store")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                if not send_body:
+                    return
+                with open(path, "rb") as f:
+                    try:
+                        while True:
+                            # Checked before reading, so once the file is complete the rest is read out
+                            growing = server.is_live(path)
+                            chunk = f.read(MEDIA_CHUNK_BYTES)
+                            if chunk:
+                                self.wfile.write(chunk)
+                            elif growing:
+                                time.sleep(MEDIA_POLL_SECONDS)
+                            else:
+                                break
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+        return Handler
+
+def new_media_path(suffix=".mp3", directory=MEDIA_DIR, max_age=MEDIA_MAX_AGE):
+    """
+    Return a fresh file path for rendered media, removing expired files first
+    """
+    os.makedirs(directory, exist_ok=True)
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        try:
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    return os.path.join(directory, f"{uuid.uuid4().hex}{suffix}")
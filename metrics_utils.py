@@ -0,0 +1,251 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Append one JSON line per finished span to this file when set
+TRACE_LOG = os.getenv("ECHOVERSE_TRACE_LOG")
+# Serve the metrics snapshot as JSON on this port when set
+METRICS_PORT = os.getenv("ECHOVERSE_METRICS_PORT")
+# Write a flame graph of each profiled request into this directory when set
+PROFILE_DIR = os.getenv("ECHOVERSE_PROFILE_DIR")
+PROFILE_INTERVAL = 0.005
+
+_lock = threading.Lock()
+_stages = {}
+_gauges = {}
+_counters = Counter()
+_trace_file = None
+_metrics_server = None
+
+def _record(name, seconds, attributes, started_at, error):
+    global _trace_file
+    with _lock:
+        stage = _stages.get(name)
+        if stage is None:
+            stage = _stages[name] = {
+                "count": 0, "errors": 0, "seconds": 0.0, "min": float("inf"), "max": 0.0, "totals": Counter()
+            }
+        stage["count"] += 1
+        stage["seconds"] += seconds
+        stage["min"] = min(stage["min"], seconds)
+        stage["max"] = max(stage["max"], seconds)
+        if error:
+            stage["errors"] += 1
+        for key, value in attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                stage["totals"][key] += value
+        if TRACE_LOG:
+            if _trace_file is None:
+                _trace_file = open(TRACE_LOG, "a", encoding="utf-8")
+            event = {
+                "span": name,
+                "start": started_at,
+                "seconds": seconds,
+                "thread": threading.current_thread().name,
+                "error": error,
+                **attributes
+            }
+            _trace_file.write(json.dumps(event, default=str) + "\n")
+            _trace_file.flush()
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block as one occurrence of the stage called name
+
+    The span yields a dict of attributes. Numeric values set on it, such as
+    'tokens' or 'chars', are summed per stage and reported as per-second rates.
+
+    Example:
+        with span("tts.request", chars=len(chunk)) as s:
+            s["bytes"] = len(audio)
+    """
+    started_at = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        _record(name, time.perf_counter() - start, attributes, started_at, error)
+
+def observe(name, seconds, **attributes):
+    """
+    Record a stage occurrence timed by the caller, for work that does not fit a with block
+    """
+    _record(name, seconds, attributes, time.time() - seconds, None)
+
+def count(name, value=1):
+    """
+    Add value to a monotonically increasing counter
+    """
+    with _lock:
+        _counters[name] += value
+
+def set_gauge(name, value):
+    """
+    Record the current value of a gauge such as a queue depth, keeping its peak
+    """
+    with _lock:
+        gauge = _gauges.setdefault(name, {"value": 0, "max": 0})
+        gauge["value"] = value
+        gauge["max"] = max(gauge["max"], value)
+
+def snapshot():
+    """
+    Return the metrics collected so far
+
+    Returns:
+        dict: 'stages' (count, errors, total/mean/min/max timings, totals and
+            rates per stage), 'gauges' and 'counters'
+    """
+    with _lock:
+        stages = {}
+        for name, stage in sorted(_stages.items()):
+            seconds = stage["seconds"]
+            stages[name] = {
+                "count": stage["count"],
+                "errors": stage["errors"],
+                "seconds": seconds,
+                "mean_ms": seconds * 1000 / stage["count"],
+                "min_ms": stage["min"] * 1000,
+                "max_ms": stage["max"] * 1000,
+                "totals": dict(stage["totals"]),
+                "rates": {f"{key}_per_sec": total / seconds for key, total in stage["totals"].items() if seconds}
+            }
+        return {
+            "stages": stages,
+            "gauges": {name: dict(gauge) for name, gauge in sorted(_gauges.items())},
+            "counters": dict(sorted(_counters.items()))
+        }
+
+def reset_metrics():
+    """
+    Clear all stages, gauges and counters
+    """
+    with _lock:
+        _stages.clear()
+        _gauges.clear()
+        _counters.clear()
+
+def write_metrics(path):
+    """
+    Write the current metrics snapshot to a JSON file
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, indent=2)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = json.dumps(snapshot()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_metrics_server(port=None, host="127.0.0.1"):
+    """
+    Serve the metrics snapshot as JSON at http://host:port/metrics
+
+    Only the first call in a process starts a server; later calls return it.
+
+    Returns:
+        ThreadingHTTPServer: The running server, or None if no port is configured
+    """
+    global _metrics_server
+    port = port or METRICS_PORT
+    if not port:
+        return None
+    with _lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(
+                target=_metrics_server.serve_forever, name="echoverse-metrics", daemon=True
+            ).start()
+    return _metrics_server
+
+class FlameProfiler:
+    """
+    Sampling profiler that records the stacks of every thread
+
+    Stacks are written in the folded format ("frame;frame;frame count" per
+    line) read by flamegraph.pl, speedscope and inferno. Each stack is rooted
+    at its thread's name, so worker pools show up as separate towers.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                # Pool workers are numbered; fold them into one tower per pool
+                root = names.get(thread_id, "thread").rstrip("0123456789").rstrip("_-")
+                stack.append(root)
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="echoverse-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._thread.join()
+
+    def write(self, path):
+        """
+        Write the collected samples as folded stacks
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, samples in sorted(self.samples.items()):
+                f.write(f"{stack} {samples}\n")
+
+@contextmanager
+def profile_request(name="request", directory=None):
+    """
+    Profile one request and dump a flame graph of it
+
+    Does nothing unless a directory is given or ECHOVERSE_PROFILE_DIR is set.
+
+    Yields:
+        str: Path the folded stacks will be written to, or None when disabled
+    """
+    directory = directory or PROFILE_DIR
+    if not directory:
+        yield None
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+    profiler = FlameProfiler()
+    profiler.start()
+    try:
+        yield path
+    finally:
+        profiler.stop()
+        profiler.write(path)
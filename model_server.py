@@ -0,0 +1,357 @@
+"""
+Shared Granite inference server reachable over a Unix socket
+
+One server process per host owns the model; every Streamlit process, job
+worker and batch run connects to it as a thin client, so the model's memory
+is paid once. Start it with:
+    python model_server.py [--socket PATH] [--backend fp32|int8]
+
+and point clients at it with ECHOVERSE_MODEL_SOCKET=PATH.
+
+The protocol is one JSON object per line in each direction. Requests carry
+an 'id' that is echoed on every reply, so a connection can have many
+requests in flight.
+"""
+import argparse
+import itertools
+import json
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+from metrics_utils import span, count, set_gauge
+
+# Clients use the server when this is set; otherwise they load the model themselves
+MODEL_SOCKET = os.getenv("ECHOVERSE_MODEL_SOCKET")
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "echoverse-model.sock")
+# Requests generated together per model call
+SERVER_MAX_BATCH_SIZE = 8
+# How long the batcher waits for more requests once one has arrived
+SERVER_BATCH_WAIT = 0.01
+
+class ModelServer:
+    """
+    Serve generation requests from many clients on one model
+
+    Queued requests from all connections are drained in batches: while one
+    batch is generating, new requests accumulate and form the next batch.
+    Token streams go through the same queue and share batches with plain
+    requests; each streamed row's pieces go out as the batch decodes, so
+    concurrent users never wait on each other's whole windows. Identical requests
+    (same prompt and budget) that are queued or running at the same time
+    are generated once and the result sent to every caller; a caller joining
+    a stream already under way first gets the pieces generated so far.
+    """
+
+    def __init__(self, granite_pipe, socket_path=DEFAULT_SOCKET, max_batch_size=SERVER_MAX_BATCH_SIZE,
+                 batch_wait=SERVER_BATCH_WAIT):
+        self.granite_pipe = granite_pipe
+        self.socket_path = socket_path
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait
+        self.model_name = getattr(granite_pipe.model, "name_or_path", "unknown")
+        self.backend = getattr(granite_pipe, "backend", None)
+        self.draft_model_name = getattr(granite_pipe, "draft_model_name", None)
+        self._queue = deque()
+        self._waiters = {}
+        self._streams = {}
+        self._ready = threading.Condition()
+        self._socket = None
+
+    def serve_forever(self):
+        """
+        Listen on the Unix socket and serve clients until interrupted
+        """
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.bind(self.socket_path)
+        self._socket.listen()
+        threading.Thread(target=self._batch_loop, name="echoverse-batcher", daemon=True).start()
+        try:
+            while True:
+                conn, _ = self._socket.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+        finally:
+            self._socket.close()
+            os.unlink(self.socket_path)
+
+    def _serve_connection(self, conn):
+        send_lock = threading.Lock()
+
+        def send(message):
+            data = (json.dumps(message) + "\n").encode("utf-8")
+            try:
+                with send_lock:
+                    conn.sendall(data)
+            except OSError:
+                # The client went away; its remaining replies are dropped
+                pass
+
+        def stream_reply(request_id):
+            def reply(piece, error):
+                if error:
+                    send({"id": request_id, "error": error})
+                elif piece is None:
+                    send({"id": request_id, "done": True})
+                else:
+                    send({"id": request_id, "piece": piece})
+
+            return reply
+
+        with conn, conn.makefile("rb") as reader:
+            for line in reader:
+                request = json.loads(line)
+                request_id = request.get("id")
+                op = request.get("op")
+                if op == "info":
+                    send({
+                        "id": request_id, "model_name": self.model_name, "backend": self.backend,
+                        "draft_model": self.draft_model_name
+                    })
+                elif op == "generate":
+                    self.submit(
+                        request["prompt"], request["max_new_tokens"],
+                        lambda text, error, request_id=request_id: send(
+                            {"id": request_id, "error": error} if error else {"id": request_id, "text": text}
+                        )
+                    )
+                elif op == "stream":
+                    self.submit_stream(request["prompt"], request["max_new_tokens"], stream_reply(request_id))
+                else:
+                    send({"id": request_id, "error": f"Unknown op '{op}'"})
+
+    def submit(self, prompt, max_new_tokens, callback):
+        """
+        Queue a generation, calling callback(text, error) once it finishes
+        """
+        key = ("generate", prompt, max_new_tokens)
+        with self._ready:
+            if key in self._waiters:
+                self._waiters[key].append(callback)
+                count("server.deduplicated")
+                return
+            self._waiters[key] = [callback]
+            self._queue.append(key)
+            set_gauge("server.queued", len(self._queue))
+            self._ready.notify()
+
+    def submit_stream(self, prompt, max_new_tokens, callback):
+        """
+        Queue a token stream, calling callback(piece, None) for every piece and
+        callback(None, error) once it ends (error is None on success)
+        """
+        key = ("stream", prompt, max_new_tokens)
+        with self._ready:
+            stream = self._streams.get(key)
+            if stream is not None:
+                count("server.deduplicated")
+                # Under the lock, so no piece is appended between the catch-up and joining
+                for piece in stream["pieces"]:
+                    callback(piece, None)
+                stream["callbacks"].append(callback)
+                return
+            self._streams[key] = {"pieces": [], "callbacks": [callback]}
+            self._queue.append(key)
+            set_gauge("server.queued", len(self._queue))
+            self._ready.notify()
+
+    def _next_batch(self):
+        with self._ready:
+            while not self._queue:
+                self._ready.wait()
+            # Give requests arriving together a moment to join the same batch
+            deadline = time.monotonic() + self.batch_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+            batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+            set_gauge("server.queued", len(self._queue))
+            return batch
+
+    def _batch_loop(self):
+        from granite_utils import _generate_rewrite, generate_batch, generate_batch_streaming, stream_generation
+
+        while True:
+            batch = self._next_batch()
+            prompts = [prompt for _, prompt, _ in batch]
+            budgets = [budget for _, _, budget in batch]
+            streamed = [row for row, key in enumerate(batch) if key[0] == "stream"]
+            try:
+                with span("server.batch", requests=len(batch), streams=len(streamed)):
+                    if len(batch) == 1 and streamed:
+                        # A lone request keeps the prompt header KV cache and the draft model
+                        pieces = []
+                        for piece in stream_generation(self.granite_pipe, prompts[0], budgets[0]):
+                            pieces.append(piece)
+                            self._publish(batch[0], piece)
+                        texts = ["".join(pieces).strip()]
+                    elif len(batch) == 1:
+                        texts = [_generate_rewrite(self.granite_pipe, prompts[0], budgets[0])]
+                    elif streamed:
+                        texts = generate_batch_streaming(
+                            self.granite_pipe, prompts, budgets,
+                            lambda row, piece: self._publish(batch[row], piece) if batch[row][0] == "stream" else None
+                        )
+                    else:
+                        texts = generate_batch(self.granite_pipe, prompts, budgets, batch_size=self.max_batch_size)
+                error = None
+            except Exception as e:
+                texts, error = [None] * len(batch), f"{type(e).__name__}: {e}"
+            for key, text in zip(batch, texts):
+                if key[0] == "stream":
+                    with self._ready:
+                        callbacks = self._streams.pop(key)["callbacks"]
+                    for callback in callbacks:
+                        callback(None, error)
+                else:
+                    with self._ready:
+                        callbacks = self._waiters.pop(key)
+                    for callback in callbacks:
+                        callback(text, error)
+
+    def _publish(self, key, piece):
+        """
+        Send one piece of a running stream to everyone following it
+        """
+        with self._ready:
+            stream = self._streams[key]
+            stream["pieces"].append(piece)
+            callbacks = list(stream["callbacks"])
+        for callback in callbacks:
+            callback(piece, None)
+
+class RemoteGranite:
+    """
+    Thin client for ModelServer that stands in for a local Granite pipeline
+
+    Only the tokenizer is loaded locally, for windowing and token counts;
+    generation goes to the server. One instance is safe to share between
+    threads and keeps a single connection with many requests in flight.
+    """
+
+    is_remote = True
+
+    def __init__(self, socket_path=None):
+        self.socket_path = socket_path or MODEL_SOCKET or DEFAULT_SOCKET
+        self.model = None
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(self.socket_path)
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._ids = itertools.count()
+        threading.Thread(target=self._read_replies, name="echoverse-model-client", daemon=True).start()
+        info = self._request({"op": "info"}).get()
+        self.model_name = info["model_name"]
+        self.backend = info.get("backend")
+        self.draft_model_name = info.get("draft_model")
+        self.tokenizer = self._load_tokenizer()
+
+    def _load_tokenizer(self):
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(self.model_name, token=os.getenv("HF_TOKEN"), trust_remote_code=True)
+
+    def _request(self, message):
+        """
+        Send a request and return the queue its replies will arrive on
+        """
+        replies = queue.Queue()
+        message["id"] = next(self._ids)
+        with self._pending_lock:
+            self._pending[message["id"]] = replies
+        data = (json.dumps(message) + "\n").encode("utf-8")
+        with self._send_lock:
+            self._socket.sendall(data)
+        return replies
+
+    def _read_replies(self):
+        with self._socket.makefile("rb") as reader:
+            for line in reader:
+                reply = json.loads(line)
+                with self._pending_lock:
+                    replies = self._pending.get(reply["id"])
+                    if "piece" not in reply:
+                        self._pending.pop(reply["id"], None)
+                if replies is not None:
+                    replies.put(reply)
+        # Connection closed: fail everything still waiting
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for replies in pending.values():
+            replies.put({"error": "ConnectionError: model server closed the connection"})
+
+    def generate(self, prompts, max_new_tokens):
+        """
+        Generate completions for prompts, all sent at once so the server can batch them
+
+        Returns:
+            list[str]: Generated text per prompt
+
+        Raises:
+            RuntimeError: If the server reports an error for any prompt
+        """
+        texts = []
+        for text, error in self.iter_generate(prompts, max_new_tokens):
+            if error:
+                raise RuntimeError(error)
+            texts.append(text)
+        return texts
+
+    def iter_generate(self, prompts, max_new_tokens):
+        """
+        Send every prompt at once and yield each reply in prompt order, without stopping at failures
+
+        Yields:
+            tuple[str, str]: Generated text and None, or None and the server's error
+        """
+        requests = [
+            self._request({"op": "generate", "prompt": prompt, "max_new_tokens": budget})
+            for prompt, budget in zip(prompts, max_new_tokens)
+        ]
+        for replies in requests:
+            reply = replies.get()
+            yield reply.get("text"), reply.get("error")
+
+    def stream(self, prompt, max_new_tokens):
+        """
+        Yield decoded text pieces as the server generates them
+        """
+        replies = self._request({"op": "stream", "prompt": prompt, "max_new_tokens": max_new_tokens})
+        while True:
+            reply = replies.get()
+            if "error" in reply:
+                raise RuntimeError(reply["error"])
+            if reply.get("done"):
+                return
+            yield reply["piece"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Granite model to EchoVerse clients over a Unix socket")
+    parser.add_argument("--socket", default=MODEL_SOCKET or DEFAULT_SOCKET)
+    parser.add_argument("--backend", default=None, help="Granite backend (fp32 or int8)")
+    parser.add_argument("--max-batch-size", type=int, default=SERVER_MAX_BATCH_SIZE)
+    parser.add_argument("--batch-wait", type=float, default=SERVER_BATCH_WAIT,
+                        help="Seconds to wait for more requests before starting a batch")
+    args = parser.parse_args()
+
+    from granite_utils import load_granite_model, warm_up_model, GRANITE_BACKEND
+    from metrics_utils import start_metrics_server
+
+    granite_pipe = load_granite_model(args.backend or GRANITE_BACKEND)
+    if granite_pipe is None:
+        raise SystemExit("No text generation model could be loaded")
+    warm_up_model(granite_pipe)
+    start_metrics_server()
+    server = ModelServer(granite_pipe, args.socket, args.max_batch_size, args.batch_wait)
+    print(f"serving {server.model_name} on {args.socket}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import io
+import mmap
+import os
+import struct
+from metrics_utils import span
+
+# Bitrates in kbps indexed by [version is MPEG-1][layer][bitrate index]
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sample rates indexed by version bits (3 = MPEG-1, 2 = MPEG-2, 0 = MPEG-2.5)
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+XING_FRAMES_FLAG = 0x1
+XING_BYTES_FLAG = 0x2
+XING_TOC_FLAG = 0x4
+
+def parse_frame_header(data, offset):
+    """
+    Parse the MPEG audio frame header at offset
+
+    Returns:
+        dict: Header fields including 'length' in bytes, or None if not a frame
+    """
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version_bits = (b1 >> 3) & 0x3
+    layer = 4 - ((b1 >> 1) & 0x3)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x3
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+    padding = (b2 >> 1) & 0x1
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and not mpeg1:
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        length = 144 * bitrate // sample_rate + padding
+    return {
+        "mpeg1": mpeg1,
+        "layer": layer,
+        "mono": (b3 >> 6) == 3,
+        "sample_rate": sample_rate,
+        "length": length
+    }
+
+def _id3v2_size(data):
+    """
+    Size of a leading ID3v2 tag, including its header and optional footer
+    """
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = 0
+    for byte in data[6:10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+def _vbr_tag_offset(data, offset, header):
+    """
+    Return the offset of a Xing/Info tag inside the frame, or None
+    """
+    if header["mpeg1"]:
+        side_info = 17 if header["mono"] else 32
+    else:
+        side_info = 9 if header["mono"] else 17
+    tag_offset = offset + 4 + side_info
+    if data[tag_offset:tag_offset + 4] in (b"Xing", b"Info"):
+        return tag_offset
+    return None
+
+def _is_vbri_frame(data, offset):
+    return data[offset + 36:offset + 40] == b"VBRI"
+
+def iter_audio_frames(data):
+    """
+    Yield (offset, length, header) for every audio frame in an MP3 byte string
+
+    ID3v2 and ID3v1 tags are skipped and a leading Xing/Info/VBRI frame is
+    reported with header['vbr_tag'] set, since it carries no audio.
+    """
+    offset = _id3v2_size(data)
+    end = len(data)
+    if end - offset >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    first = True
+    while offset + 4 <= end:
+        header = parse_frame_header(data, offset)
+        if header is None or offset + header["length"] > end:
+            # Resynchronise on the next frame sync word
+            offset = data.find(b"\xFF", offset + 1, end)
+            if offset < 0:
+                return
+            continue
+        if first:
+            header["vbr_tag"] = _vbr_tag_offset(data, offset, header) is not None or _is_vbri_frame(data, offset)
+            first = False
+        else:
+            header["vbr_tag"] = False
+        yield offset, header["length"], header
+        offset += header["length"]
+
+class Mp3ConcatWriter:
+    """
+    Join MP3 byte strings at frame level, writing incrementally to a file
+
+    Per-chunk ID3 tags and Xing/Info headers are dropped. The Xing/Info frame
+    of the first chunk, if any, is kept as the stream header. Its counts are
+    zero while the file grows, so players reading it early treat the length as
+    unknown, and it is patched with the total frame and byte counts when the
+    writer is closed.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.frames = 0
+        self.bytes_written = 0
+        self._xing_frame = None
+
+    def append(self, data):
+        """
+        Append the audio frames of one MP3 byte string
+        """
+        with span("mp3.concat", bytes=len(data)):
+            self._append(data)
+
+    def _append(self, data):
+        for offset, length, header in iter_audio_frames(data):
+            if header["vbr_tag"]:
+                if self.bytes_written == 0 and self._xing_frame is None and not _is_vbri_frame(data, offset):
+                    self._xing_frame = (self.fileobj.tell(), bytearray(data[offset:offset + length]), header)
+                    self.fileobj.write(self._xing_header(0, 0))
+                    self.bytes_written += length
+                continue
+            self.fileobj.write(data[offset:offset + length])
+            self.frames += 1
+            self.bytes_written += length
+
+    def close(self):
+        """
+        Patch the stream's Xing/Info header with the final counts
+        """
+        if self._xing_frame is None or not self.fileobj.seekable():
+            return
+        end = self.fileobj.tell()
+        self.fileobj.seek(self._xing_frame[0])
+        self.fileobj.write(self._xing_header(self.frames, self.bytes_written))
+        self.fileobj.seek(end)
+
+    def _xing_header(self, frames, bytes_written):
+        """
+        Return the kept Xing/Info frame with the given totals filled in
+        """
+        _, frame, header = self._xing_frame
+        frame = bytearray(frame)
+        tag = _vbr_tag_offset(frame, 0, header)
+        flags = struct.unpack(">I", frame[tag + 4:tag + 8])[0]
+        field = tag + 8
+        if flags & XING_FRAMES_FLAG:
+            frame[field:field + 4] = struct.pack(">I", frames)
+            field += 4
+        if flags & XING_BYTES_FLAG:
+            frame[field:field + 4] = struct.pack(">I", bytes_written)
+            field += 4
+        if flags & XING_TOC_FLAG:
+            # The original seek table describes the first chunk only; use a linear one
+            frame[field:field + 100] = bytes(i * 256 // 100 for i in range(100))
+        # Encoder gapless info is also per chunk, so blank it out
+        lame = frame.find(b"LAME", tag)
+        if lame >= 0:
+            frame[lame:] = bytes(len(frame) - lame)
+        return frame
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def mp3_duration(path):
+    """
+    Playing time of an MP3 file in seconds, counted from its audio frames
+
+    The file is memory-mapped rather than read, so this is cheap for long books.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0.0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            seconds = 0.0
+            for _, _, header in iter_audio_frames(data):
+                if header["vbr_tag"]:
+                    continue
+                if header["layer"] == 1:
+                    samples = 384
+                elif header["layer"] == 3 and not header["mpeg1"]:
+                    samples = 576
+                else:
+                    samples = 1152
+                seconds += samples / header["sample_rate"]
+            return seconds
+
+def concat_mp3_bytes(chunks):
+    """
+    Join MP3 byte strings in memory without decoding
+
+    Returns:
+        bytes: A single MP3 stream
+    """
+    buffer = io.BytesIO()
+    with Mp3ConcatWriter(buffer) as writer:
+        for chunk in chunks:
+            writer.append(chunk)
+    return buffer.getvalue()
@@ -0,0 +1,210 @@
+import io
+import mmap
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from PyPDF2 import PdfReader
+from metrics_utils import span
+
+# Below this many pages a process pool costs more than it saves
+PDF_POOL_MIN_PAGES = 64
+# Pages extracted per pool task
+PDF_PAGES_PER_TASK = 16
+# Worker processes shared by every extraction in this process
+PDF_POOL_WORKERS = int(os.getenv("ECHOVERSE_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Bytes copied per write when spooling an upload to disk
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+_worker_reader = None
+_worker_identity = None
+_pool = None
+_pool_lock = threading.Lock()
+
+@contextmanager
+def _source_path(source):
+    """
+    Yield a file path for a path, bytes or file-like PDF source
+
+    In-memory sources (e.g. a Streamlit upload) are spooled to a temporary
+    file in chunks and removed afterwards, so the PDF can be memory-mapped
+    by this process and every pool worker instead of copied to each.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        yield os.fspath(source)
+        return
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            f.write(source)
+        elif hasattr(source, "getvalue"):
+            # An unmodified BytesIO returns its own bytes here rather than a copy
+            f.write(source.getvalue())
+        else:
+            source.seek(0)
+            shutil.copyfileobj(source, f, SPOOL_CHUNK_BYTES)
+    try:
+        yield f.name
+    finally:
+        os.unlink(f.name)
+
+def _open_reader(path):
+    """
+    Open a PdfReader over a read-only memory map of the file
+
+    Pages are paged in by the OS on demand and shared between processes.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return PdfReader(io.BytesIO(b""))
+        return PdfReader(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def _get_pool():
+    """
+    Return the process-wide PDF extraction pool, starting it on first use
+
+    Workers are started by a fork server (or spawned where there is none)
+    rather than forked from this process: the app forks from a server with
+    running threads, such as the model warm-up, and a forked child can
+    deadlock on a lock one of them held.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=PDF_POOL_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+def shutdown_pool():
+    """
+    Stop the shared PDF extraction pool, if it was started
+    """
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+def _file_identity(path):
+    """
+    Identify a file by path, inode, modification time and size
+
+    A spooled upload is deleted after extraction and its temporary path can
+    be handed out again for the next one, so the path alone does not tell
+    two PDFs apart.
+    """
+    stat = os.stat(path)
+    return path, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+def _close_reader(reader):
+    stream = getattr(reader, "stream", None)
+    if isinstance(stream, mmap.mmap):
+        stream.close()
+
+def _extract_range(path, start, stop):
+    """
+    Extract a range of pages in a pool worker, which keeps the last PDF it parsed open
+
+    The open reader is replaced, and its memory map closed, as soon as a
+    task names a different file, so a deleted upload is not kept mapped and
+    a reused temporary path is never served from the old document.
+    """
+    global _worker_reader, _worker_identity
+    identity = _file_identity(path)
+    if identity != _worker_identity:
+        if _worker_reader is not None:
+            _close_reader(_worker_reader)
+        _worker_reader, _worker_identity = None, None
+        _worker_reader, _worker_identity = _open_reader(path), identity
+    return [_worker_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+def iter_pdf_pages(source, processes=None, min_pages_for_pool=PDF_POOL_MIN_PAGES):
+    """
+    Lazily yield the text of each PDF page in order, extracting every page once
+
+    Large documents are spread across the shared worker pool; each task
+    extracts a contiguous range of pages, and a worker parses the PDF once
+    for all the ranges it gets.
+
+    Args:
+        source: Path, bytes or file-like object holding the PDF
+        processes (int): Page ranges extracted at the same time (defaults to
+            PDF_POOL_WORKERS, 1 disables the pool)
+        min_pages_for_pool (int): Page count from which the pool is used
+
+    Yields:
+        str: Text of each page that has any, in page order
+    """
+    with _source_path(source) as path:
+        yield from _iter_pages(path, processes or PDF_POOL_WORKERS, min_pages_for_pool)
+
+def _iter_pages(path, processes, min_pages_for_pool):
+    reader = _open_reader(path)
+    page_count = len(reader.pages)
+
+    if processes <= 1 or page_count < min_pages_for_pool:
+        for page in reader.pages:
+            text = page.extract_text()
+            if text:
+                yield text
+        return
+
+    del reader
+    ranges = [(start, min(start + PDF_PAGES_PER_TASK, page_count))
+              for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+    pool = _get_pool()
+    # Keep a bounded window of ranges in flight so pages stream out in order
+    in_flight = deque()
+    pending = iter(ranges)
+    try:
+        for start, stop in pending:
+            in_flight.append(pool.submit(_extract_range, path, start, stop))
+            if len(in_flight) >= processes * 2:
+                break
+        while in_flight:
+            texts = in_flight.popleft().result()
+            next_range = next(pending, None)
+            if next_range is not None:
+                in_flight.append(pool.submit(_extract_range, path, *next_range))
+            for text in texts:
+                if text:
+                    yield text
+    finally:
+        # The pool outlives this extraction; drop work nobody will read
+        for future in in_flight:
+            future.cancel()
+
+def pdf_outline_titles(source):
+    """
+    Return the titles of a PDF's top-level bookmarks in order
+
+    Returns:
+        list[str]: Bookmark titles, empty if the PDF has no outline
+    """
+    with _source_path(source) as path:
+        reader = _open_reader(path)
+        try:
+            outline = reader.outline if hasattr(reader, "outline") else reader.outlines
+        except Exception:
+            # Malformed outlines are common and never worth failing an extraction over
+            return []
+        # Nested lists hold the children of the preceding entry
+        return [item.title for item in outline if not isinstance(item, list) and getattr(item, "title", None)]
+
+def extract_pdf_text(source, processes=None):
+    """
+    Extract the full text of a PDF, one page per line block
+
+    Returns:
+        str: Page texts joined by newlines
+    """
+    with span("pdf.extract") as s:
+        pages = list(iter_pdf_pages(source, processes=processes))
+        s["pages"] = len(pages)
+        text = "\n".join(pages)
+        s["chars"] = len(text)
+    return text
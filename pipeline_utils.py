@@ -0,0 +1,252 @@
+import codecs
+import hashlib
+import mmap
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from cache_utils import get_cache, make_cache_key
+from document_utils import normalize_paragraphs
+from granite_utils import iter_sentences_with_granite, rewrite_document, format_text_for_narration, model_identity
+from metrics_utils import count, set_gauge, span
+from mp3_utils import Mp3ConcatWriter, concat_mp3_bytes
+from tts_utils import (
+    get_watson_client, get_tts_scheduler, split_text_for_tts, synthesize_chunk_with_retry, text_to_mp3_watson,
+    _RateLimitGate,
+    TTS_MAX_WORKERS, WATSON_MAX_CHUNK_CHARS
+)
+
+# Bump a stage's version when its logic changes, so stale results are not reused
+STAGE_VERSIONS = {"extract": 1, "normalize": 1, "rewrite": 3, "synthesize": 2}
+
+# Bytes read per step when decoding text files
+READ_CHUNK_BYTES = 1024 * 1024
+
+def _stage_key(stage, *inputs):
+    """
+    Cache key of a stage result, built from only the inputs that stage depends on
+    """
+    return make_cache_key("stage", stage, STAGE_VERSIONS[stage], *inputs)
+
+def _cached_stage(stage, key):
+    value = get_cache().get_text(key)
+    if value is not None:
+        count(f"stage.{stage}.hits")
+    return value
+
+def _buffer(source):
+    """
+    Bytes of an in-memory source (bytes or a BytesIO such as a Streamlit upload)
+
+    BytesIO.getvalue() hands back the upload's own bytes object when the
+    buffer has not been written to, whereas getbuffer() or read() after a
+    seek would copy the whole file.
+    """
+    return source.getvalue() if hasattr(source, "getvalue") else source
+
+def decode_text_source(source):
+    """
+    Decode a UTF-8 text upload or file without intermediate copies
+
+    In-memory sources are decoded straight from their bytes. Files are
+    memory-mapped and decoded from the map, so the raw bytes are clean page
+    cache the OS can drop rather than a private copy; other streams go
+    through an incremental decoder in chunks.
+
+    Returns:
+        str: Decoded text
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)) or hasattr(source, "getvalue"):
+        return str(_buffer(source), "utf-8")
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return ""
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return str(mapped, "utf-8")
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pieces = [decoder.decode(block) for block in iter(lambda: source.read(READ_CHUNK_BYTES), b"")]
+    pieces.append(decoder.decode(b"", final=True))
+    return "".join(pieces)
+
+def extract_stage(source, file_type):
+    """
+    Extract the text of an uploaded document
+
+    PDF extraction is memoized on the file's content; decoding a TXT file is
+    cheaper than a cache read, so it is not.
+
+    Args:
+        source: Raw file content as bytes or a file-like upload
+        file_type (str): 'pdf' or 'txt'
+
+    Returns:
+        str: Document text
+    """
+    if file_type != "pdf":
+        with span("stage.extract"):
+            return decode_text_source(source)
+    key = _stage_key("extract", file_type, hashlib.sha256(_buffer(source)).hexdigest())
+    text = _cached_stage("extract", key)
+    if text is None:
+        from pdf_utils import extract_pdf_text
+
+        with span("stage.extract"):
+            text = extract_pdf_text(source)
+        get_cache().put_text(key, text)
+    return text
+
+def normalize_stage(text):
+    """
+    Tidy extracted text before it is rewritten, memoized on the text
+
+    Lines inside a paragraph (hard wraps from PDFs and plain text files) are
+    joined and runs of whitespace collapsed; blank lines between paragraphs
+    are kept as paragraph breaks.
+
+    Returns:
+        str: Normalized text
+    """
+    key = _stage_key("normalize", text)
+    normalized = _cached_stage("normalize", key)
+    if normalized is None:
+        with span("stage.normalize", chars=len(text)):
+            normalized = normalize_paragraphs(text)
+        get_cache().put_text(key, normalized)
+    return normalized
+
+def rewrite_stage(text, tone="neutral", style="neutral", granite_pipe=None, language="English", batch_size=1):
+    """
+    Rewrite normalized text for narration, memoized on text, tone, style, language and model
+
+    The model part of the key covers the backend and draft model as well (see model_identity).
+
+    Only complete rewrites are memoized; if any window fell back to its
+    original text, the next run tries the failed windows again.
+
+    Returns:
+        str: Enhanced text suitable for TTS conversion
+    """
+    if not granite_pipe:
+        return format_text_for_narration(text, tone, style)
+    key = _stage_key("rewrite", model_identity(granite_pipe), tone, style, language, text)
+    enhanced = _cached_stage("rewrite", key)
+    if enhanced is None:
+        try:
+            with span("stage.rewrite", chars=len(text)):
+                enhanced, complete = rewrite_document(text, tone, language, style, granite_pipe, batch_size)
+        except Exception as e:
+            st.warning(f"Text enhancement failed, using original text: {str(e)}")
+            return format_text_for_narration(text, tone, style)
+        if complete:
+            get_cache().put_text(key, enhanced)
+    return enhanced
+
+def _write_cached_audio(chunk_keys, filename):
+    """
+    Join cached chunk audio into an MP3 file, one chunk in memory at a time
+
+    Returns:
+        bool: False if any chunk is no longer cached
+    """
+    cache = get_cache()
+    with open(filename, "wb") as audio_file, Mp3ConcatWriter(audio_file) as writer:
+        for key in chunk_keys:
+            audio_bytes = cache.get(key)
+            if audio_bytes is None:
+                return False
+            writer.append(audio_bytes)
+    return True
+
+def synthesize_stage(text, voice="en-US_AllisonV3Voice", filename=None):
+    """
+    Synthesize rewritten text to an MP3 file with Watson, memoized on text and voice
+
+    The stage result is a manifest of the chunk audio keys rather than a
+    second copy of the audio, so a long book does not take the cache space
+    of (and evict) the chunks it is made of. A hit joins the cached chunks
+    into the output file one at a time; if any was evicted, the book is
+    synthesized again and the chunks still cached are reused.
+
+    Returns:
+        str: Path to the MP3 file
+    """
+    if filename is None:
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
+        filename = temp_file.name
+        temp_file.close()
+    key = _stage_key("synthesize", voice, text)
+    manifest = get_cache().get_text(key)
+    if manifest and _write_cached_audio(manifest.split(), filename):
+        count("stage.synthesize.hits")
+    else:
+        chunk_keys = []
+        with span("stage.synthesize", chars=len(text)):
+            text_to_mp3_watson(text, voice=voice, filename=filename, chunk_keys=chunk_keys)
+        get_cache().put_text(key, "\n".join(chunk_keys))
+    return filename
+
+def stream_audiobook(text, tone="neutral", style="neutral", voice="en-US_AllisonV3Voice", granite_pipe=None,
+                     language="English", chunk_size=WATSON_MAX_CHUNK_CHARS, max_workers=None):
+    """
+    Rewrite and synthesize text segment by segment, yielding audio as it finishes
+
+    Rewritten text is streamed from the model token by token and every
+    completed sentence goes to TTS straight away, so LLM decoding and TTS
+    network time overlap. Audio is regrouped into one segment per rewrite
+    window and yielded in order as soon as a segment's sentences are all
+    synthesized, so the first audio is ready long before the whole book.
+
+    Args:
+        text (str): Input text to narrate
+        tone (str): Desired tone
+        style (str): Voice style
+        voice (str): IBM Watson voice name
+        granite_pipe: Pre-loaded Granite pipeline (None skips rewriting)
+        language (str): Target language
+        chunk_size (int): Maximum characters per TTS request
+        max_workers (int): Concurrent TTS requests of this book at most (defaults to TTS_MAX_WORKERS);
+            every request also takes a slot from the shared Watson scheduler
+
+    Yields:
+        dict: Segment with 'index', 'total', 'text' and MP3 'audio' bytes
+    """
+    tts = get_watson_client()
+    scheduler = get_tts_scheduler()
+    gate = _RateLimitGate()
+    segments = deque()
+    submitted = 0
+
+    def finish(segment):
+        return {
+            "index": segment["index"],
+            "total": segment["total"],
+            "text": " ".join(segment["sentences"]),
+            "audio": concat_mp3_bytes(future.result() for future in segment["futures"])
+        }
+
+    def ready(segment):
+        return segment["closed"] and all(future.done() for future in segment["futures"])
+
+    with ThreadPoolExecutor(max_workers=max_workers or TTS_MAX_WORKERS) as pool:
+        for index, total, sentence in iter_sentences_with_granite(text, tone, language, style, granite_pipe):
+            if not segments or segments[-1]["index"] != index:
+                if segments:
+                    segments[-1]["closed"] = True
+                segments.append({"index": index, "total": total, "sentences": [], "futures": [], "closed": False})
+            segment = segments[-1]
+            segment["sentences"].append(sentence)
+            for chunk in split_text_for_tts(sentence, chunk_size):
+                # Reading order is the slot priority, so the next segment to play is served first
+                segment["futures"].append(pool.submit(
+                    synthesize_chunk_with_retry, tts, chunk, voice, gate=gate, scheduler=scheduler, priority=submitted
+                ))
+                submitted += 1
+            set_gauge("pipeline.pending_segments", len(segments))
+            while segments and ready(segments[0]):
+                yield finish(segments.popleft())
+        if segments:
+            segments[-1]["closed"] = True
+        while segments:
+            yield finish(segments.popleft())
@@ -0,0 +1,200 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from metrics_utils import set_gauge
+
+# Weight of the newest request in the latency averages
+LATENCY_SMOOTHING = 0.2
+
+class AdaptiveScheduler:
+    """
+    AIMD control of request size and concurrency for one backend
+
+    Every request reports its size, latency and outcome. While the backend
+    keeps up, concurrency grows by one slot per round of successful requests
+    (doubling each round until the first decrease, like TCP slow start) and
+    the request size by size_step per round. A rate limit or error halves
+    the concurrency (an error also halves the size), and so does latency per
+    unit of work rising past latency_tolerance times the best seen: the
+    backend is saturated and extra requests would only queue. Requests slower
+    than target_latency shrink the size, or the concurrency when the size is
+    not adaptive, so each result stays quick to arrive. After a decrease,
+    requests already in flight get one round trip to report before the next.
+
+    Slots are granted lowest priority first, so giving chunks their reading
+    position as priority makes the start of a book finish first.
+    """
+
+    def __init__(self, name, concurrency=2, min_concurrency=1, max_concurrency=16, size=None, min_size=None,
+                 max_size=None, size_step=None, target_latency=10.0, latency_tolerance=2.0, window=50,
+                 classify=None):
+        """
+        Args:
+            name (str): Backend name, used in metrics
+            concurrency (int): Initial concurrent requests
+            min_concurrency (int): Lower bound on concurrency
+            max_concurrency (int): Upper bound on concurrency
+            size (int): Initial request size, or None to leave sizing to the caller
+            min_size (int): Lower bound on request size
+            max_size (int): Upper bound on request size
+            size_step (int): Size added per round of successful requests
+            target_latency (float): Seconds a single request should take at most
+            latency_tolerance (float): Growth of latency per unit over the best seen that counts as saturation
+            window (int): Requests the error rate is measured over
+            classify (callable): Maps an exception to "rate_limited", "error", or None
+                when it is not the backend's doing (defaults to "error")
+        """
+        self.name = name
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.min_size = min_size
+        self.max_size = max_size
+        self.size_step = size_step
+        self.target_latency = target_latency
+        self.latency_tolerance = latency_tolerance
+        self._classify = classify or (lambda error: "error")
+        self._limit = float(min(max(concurrency, min_concurrency), max_concurrency))
+        self._size = float(size) if size is not None else None
+        self._in_flight = 0
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._outcomes = deque(maxlen=window)
+        self._latency = None
+        self._unit_latency = None
+        self._best_unit_latency = None
+        self._hold_until = 0.0
+        self._slow_start = True
+        self._cond = threading.Condition()
+
+    @property
+    def concurrency(self):
+        return int(self._limit)
+
+    @property
+    def size(self):
+        return int(self._size) if self._size is not None else None
+
+    @contextmanager
+    def request(self, priority=0, size=1):
+        """
+        Hold one request slot around a call to the backend and record how it went
+
+        Waits until fewer than `concurrency` requests are running and no
+        lower-priority request is waiting.
+
+        Args:
+            priority (int): Lower values are served first
+            size (int): Units of work in the request, such as characters or tokens
+        """
+        with self._cond:
+            entry = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, entry)
+            while self._in_flight >= self.concurrency or self._waiting[0] != entry:
+                self._cond.wait()
+            heapq.heappop(self._waiting)
+            self._in_flight += 1
+            set_gauge(f"scheduler.{self.name}.in_flight", self._in_flight)
+            # The next waiter may fit as well
+            self._cond.notify_all()
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except BaseException as e:
+            # Cancellation and interrupts say nothing about the backend
+            outcome = self._classify(e) if isinstance(e, Exception) else None
+            raise
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+            if outcome:
+                self.record(size, time.perf_counter() - start, outcome)
+
+    def record(self, size, seconds, outcome="ok"):
+        """
+        Feed one finished request into the control loop
+
+        Args:
+            size (int): Units of work in the request
+            seconds (float): Request latency
+            outcome (str): "ok", "rate_limited" or "error"
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._outcomes.append(outcome == "ok")
+            if outcome != "ok":
+                self._decrease(now, shrink_size=outcome == "error")
+            else:
+                self._latency = self._smooth(self._latency, seconds)
+                self._unit_latency = self._smooth(self._unit_latency, seconds / max(size, 1))
+                if self._best_unit_latency is None or self._unit_latency < self._best_unit_latency:
+                    self._best_unit_latency = self._unit_latency
+                if self._unit_latency > self._best_unit_latency * self.latency_tolerance:
+                    self._decrease(now)
+                elif seconds > self.target_latency:
+                    self._decrease(now, shrink_size=True, keep_concurrency=self._size is not None)
+                else:
+                    # Additive increase: about one step per round of `concurrency` requests
+                    step = 1 if self._slow_start else 1 / self._limit
+                    self._limit = min(self._limit + step, self.max_concurrency)
+                    if self._size is not None:
+                        self._size = min(self._size + self.size_step / self._limit, self.max_size)
+            self._publish()
+            self._cond.notify_all()
+
+    def _smooth(self, average, value):
+        return value if average is None else average + LATENCY_SMOOTHING * (value - average)
+
+    def _decrease(self, now, shrink_size=False, keep_concurrency=False):
+        if now < self._hold_until:
+            return
+        self._slow_start = False
+        if not keep_concurrency:
+            self._limit = max(self._limit / 2, self.min_concurrency)
+        if shrink_size and self._size is not None:
+            self._size = max(self._size / 2, self.min_size)
+            # Smaller requests have more overhead per unit; measure the new baseline afresh
+            self._unit_latency = self._best_unit_latency = None
+        self._hold_until = now + (self._latency or 0.0)
+
+    def _publish(self):
+        set_gauge(f"scheduler.{self.name}.concurrency", self.concurrency)
+        if self._size is not None:
+            set_gauge(f"scheduler.{self.name}.size", self.size)
+
+    def stats(self):
+        """
+        Return the live state of the control loop
+
+        Returns:
+            dict: 'concurrency', 'size', 'in_flight', 'latency' (smoothed
+                seconds per request) and 'error_rate' over the recent window
+        """
+        with self._cond:
+            return {
+                "concurrency": self.concurrency,
+                "size": self.size,
+                "in_flight": self._in_flight,
+                "latency": self._latency,
+                "error_rate": 1 - sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+            }
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(name, **settings):
+    """
+    Return the process-wide scheduler of a backend, creating it from settings on first use
+
+    Sharing one scheduler per backend keeps what it learned between requests
+    and makes concurrent conversions share the backend's limits.
+    """
+    with _schedulers_lock:
+        scheduler = _schedulers.get(name)
+        if scheduler is None:
+            scheduler = _schedulers[name] = AdaptiveScheduler(name, **settings)
+        return scheduler
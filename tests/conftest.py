@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_utils
+import scheduler_utils
+
+@pytest.fixture(autouse=True)
+def content_cache(tmp_path, monkeypatch):
+    """
+    Give every test its own empty content cache instead of the one in the working directory
+    """
+    cache = cache_utils.ContentCache(directory=str(tmp_path / "cache"))
+    monkeypatch.setattr(cache_utils, "_cache", cache)
+    return cache
+
+@pytest.fixture(autouse=True)
+def schedulers(monkeypatch):
+    """
+    Start every test with no shared schedulers, so what one test's scheduler learned never carries over
+    """
+    monkeypatch.setattr(scheduler_utils, "_schedulers", {})
@@ -0,0 +1,53 @@
+import threading
+
+import cache_utils
+import pipeline_utils
+from benchmark import FakeTTSServer, _fake_watson_client, _synthetic_corpus
+
+VOICE = "en-US_AllisonV3Voice"
+
+def test_a_slow_read_does_not_hold_up_other_keys(content_cache, tmp_path, monkeypatch):
+    content_cache.put("slow", b"a" * 1024)
+    content_cache.put("fast", b"b")
+    copying = threading.Event()
+    release = threading.Event()
+    copyfile = cache_utils.shutil.copyfile
+
+    def slow_copyfile(source, destination):
+        copying.set()
+        release.wait(5)
+        return copyfile(source, destination)
+
+    monkeypatch.setattr(cache_utils.shutil, "copyfile", slow_copyfile)
+    reader = threading.Thread(target=content_cache.get_file, args=("slow", str(tmp_path / "out")))
+    reader.start()
+    results = []
+    try:
+        assert copying.wait(5)
+        # Both only need the index, which the copy in progress must not be holding
+        def other_keys():
+            results.append((content_cache.get("fast"), content_cache.put("c", b"c")))
+
+        other = threading.Thread(target=other_keys)
+        other.start()
+        other.join(1)
+        assert results == [(b"b", None)]
+    finally:
+        release.set()
+        reader.join()
+    assert (tmp_path / "out").read_bytes() == b"a" * 1024
+
+def test_book_audio_is_stored_once_as_its_chunks(content_cache, tmp_path, monkeypatch):
+    text = _synthetic_corpus(8 * 1024)
+    with FakeTTSServer(latency=0.0) as server:
+        tts = _fake_watson_client(server.url)
+        monkeypatch.setattr(pipeline_utils, "get_watson_client", lambda: tts)
+        monkeypatch.setattr("tts_utils.get_watson_client", lambda: tts)
+        first = pipeline_utils.synthesize_stage(text, VOICE, str(tmp_path / "first.mp3"))
+        requests = server.counts["ok"]
+        again = pipeline_utils.synthesize_stage(text, VOICE, str(tmp_path / "again.mp3"))
+    audio = open(first, "rb").read()
+    assert open(again, "rb").read() == audio
+    assert server.counts["ok"] == requests
+    # Chunk audio, cuts and the manifest; no second copy of the whole book
+    assert content_cache.stats()["bytes"] < 1.5 * len(audio)
@@ -0,0 +1,51 @@
+import threading
+import time
+import urllib.request
+
+from media_utils import MediaServer
+
+def _get(url, headers=None):
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=10) as response:
+        return response.status, response.headers, response.read()
+
+def test_servers_in_one_process_pick_their_own_ports(tmp_path):
+    path = tmp_path / "book.mp3"
+    path.write_bytes(bytes(range(256)) * 4)
+    first, second = MediaServer(base_url=None), MediaServer(base_url="http://example.test:{port}/")
+    try:
+        assert first.port != second.port
+        assert second.base_url == f"http://example.test:{second.port}"
+        status, headers, body = _get(first.url(path), {"Range": "bytes=10-19"})
+        assert status == 206
+        assert headers["Content-Range"] == "bytes 10-19/1024"
+        assert body == bytes(range(10, 20))
+    finally:
+        first.close()
+        second.close()
+
+def test_live_file_is_followed_until_it_is_complete(tmp_path):
+    path = tmp_path / "book.mp3"
+    parts = [bytes([i]) * 1000 for i in range(5)]
+    server = MediaServer(base_url=None)
+    try:
+        with server.live(path):
+            with open(path, "wb") as f:
+                f.write(parts[0])
+                f.flush()
+                result = {}
+                reader = threading.Thread(target=lambda: result.update(response=_get(server.url(path))))
+                reader.start()
+                for part in parts[1:]:
+                    time.sleep(0.1)
+                    f.write(part)
+                    f.flush()
+        reader.join(10)
+        status, headers, body = result["response"]
+        assert status == 200
+        assert "Content-Length" not in headers
+        assert body == b"".join(parts)
+        # Once complete, the file is served with a length and ranges again
+        status, headers, _ = _get(server.url(path), {"Range": "bytes=0-0"})
+        assert status == 206
+    finally:
+        server.close()
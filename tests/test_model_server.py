@@ -0,0 +1,171 @@
+import threading
+import time
+
+import pytest
+
+import granite_utils
+from model_server import ModelServer, RemoteGranite
+
+class _FakeModel:
+    name_or_path = "fake-granite"
+
+class _FakePipe:
+    model = _FakeModel()
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """
+    A model server whose generations are fakes that record how many run at once
+    """
+    state = {"running": 0, "most_running": 0, "streams": 0, "batches": []}
+    lock = threading.Lock()
+
+    def generating():
+        with lock:
+            state["running"] += 1
+            state["most_running"] = max(state["most_running"], state["running"])
+
+    def finished():
+        with lock:
+            state["running"] -= 1
+
+    def stream_generation(granite_pipe, prompt, max_new_tokens):
+        generating()
+        state["streams"] += 1
+        try:
+            for i in range(5):
+                time.sleep(0.02)
+                yield f"{prompt}-{i} "
+        finally:
+            finished()
+
+    def generate_rewrite(granite_pipe, prompt, max_new_tokens):
+        generating()
+        time.sleep(0.05)
+        finished()
+        return prompt.upper()
+
+    def generate_batch(granite_pipe, prompts, max_new_tokens, batch_size):
+        generating()
+        time.sleep(0.05)
+        finished()
+        return [prompt.upper() for prompt in prompts]
+
+    def generate_batch_streaming(granite_pipe, prompts, max_new_tokens, on_piece):
+        generating()
+        state["batches"].append(len(prompts))
+        try:
+            for i in range(5):
+                time.sleep(0.02)
+                for row, prompt in enumerate(prompts):
+                    on_piece(row, f"{prompt}-{i} ")
+            return ["".join(f"{prompt}-{i} " for i in range(5)).strip() for prompt in prompts]
+        finally:
+            finished()
+
+    monkeypatch.setattr(granite_utils, "stream_generation", stream_generation)
+    monkeypatch.setattr(granite_utils, "generate_batch_streaming", generate_batch_streaming)
+    monkeypatch.setattr(granite_utils, "_generate_rewrite", generate_rewrite)
+    monkeypatch.setattr(granite_utils, "generate_batch", generate_batch)
+    monkeypatch.setattr(RemoteGranite, "_load_tokenizer", lambda self: None)
+    socket_path = str(tmp_path / "model.sock")
+    model_server = ModelServer(_FakePipe(), socket_path, batch_wait=0.1)
+    threading.Thread(target=model_server.serve_forever, daemon=True).start()
+    for _ in range(100):
+        try:
+            RemoteGranite(socket_path)
+            break
+        except OSError:
+            time.sleep(0.01)
+    return socket_path, state
+
+def test_streams_and_batches_never_generate_at_the_same_time(server):
+    socket_path, state = server
+    results = {}
+
+    def stream(name, prompt):
+        results[name] = "".join(RemoteGranite(socket_path).stream(prompt, 16))
+
+    def generate(name, prompts):
+        results[name] = RemoteGranite(socket_path).generate(prompts, [16] * len(prompts))
+
+    threads = [
+        threading.Thread(target=stream, args=("a", "one")),
+        threading.Thread(target=generate, args=("b", ["x", "y", "z"])),
+        threading.Thread(target=stream, args=("c", "two")),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state["most_running"] == 1
+    assert results["a"] == "one-0 one-1 one-2 one-3 one-4 "
+    # Batched alone or together with the streams, each prompt gets its own text back in order
+    assert [text.split("-")[0].lower() for text in results["b"]] == ["x", "y", "z"]
+    assert results["c"] == "two-0 two-1 two-2 two-3 two-4 "
+
+def test_identical_streams_are_generated_once(server):
+    socket_path, state = server
+    results = []
+
+    def stream(delay):
+        time.sleep(delay)
+        results.append("".join(RemoteGranite(socket_path).stream("same", 16)))
+
+    # The later callers join while the stream is already producing pieces
+    threads = [threading.Thread(target=stream, args=(delay,)) for delay in (0.0, 0.03, 0.05)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state["streams"] == 1
+    assert results == ["same-0 same-1 same-2 same-3 same-4 "] * 3
+
+def test_concurrent_streams_share_one_batch_with_plain_requests(server):
+    socket_path, state = server
+    results = {}
+
+    def stream(prompt):
+        results[prompt] = "".join(RemoteGranite(socket_path).stream(prompt, 16))
+
+    def generate(prompt):
+        results[prompt] = RemoteGranite(socket_path).generate([prompt], [16])[0]
+
+    threads = [threading.Thread(target=stream, args=(prompt,)) for prompt in ("one", "two", "three")]
+    threads.append(threading.Thread(target=generate, args=("four",)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state["batches"] == [4]
+    assert state["streams"] == 0
+    for prompt in ("one", "two", "three"):
+        assert results[prompt] == "".join(f"{prompt}-{i} " for i in range(5))
+    assert results["four"] == "four-0 four-1 four-2 four-3 four-4"
+
+class _WordTokenizer:
+    eos_token_id = 0
+
+    def __init__(self, words):
+        self.words = words
+
+    def decode(self, tokens, skip_special_tokens=True):
+        return "".join(self.words[token] for token in tokens)
+
+def test_row_streamer_streams_each_row_to_its_own_end():
+    numpy = pytest.importorskip("numpy")
+    from granite_utils import _RowStreamer
+
+    tokenizer = _WordTokenizer(["<eos>", "Hello", " there", " friend", ".", " Bye"])
+    pieces = {0: [], 1: []}
+    streamer = _RowStreamer(tokenizer, [10, 2], lambda row, piece: pieces[row].append(piece))
+    streamer.put(numpy.array([[7, 7, 7], [7, 7, 7]]))
+    # Row 1 runs out of budget after two tokens; row 0 ends on its end-of-sequence token
+    for step in ([1, 1], [2, 5], [3, 2], [4, 0], [0, 0]):
+        streamer.put(numpy.array(step))
+    streamer.end()
+    assert "".join(pieces[0]) == "Hello there friend."
+    assert "".join(pieces[1]) == "Hello Bye"
+    # Whole words only until the row ends
+    assert pieces[0][:2] == ["Hello ", "there "]
+    assert streamer.texts() == ["Hello there friend.", "Hello Bye"]
@@ -0,0 +1,19 @@
+import os
+
+import pdf_utils
+from benchmark import _generate_pdf
+
+def test_worker_reader_is_not_reused_for_a_new_file_at_the_same_path(tmp_path):
+    path = str(tmp_path / "upload.pdf")
+    _generate_pdf(path, pages=1, lines_per_page=2)
+    first = pdf_utils._extract_range(path, 0, 1)
+    old_reader = pdf_utils._worker_reader
+
+    # A later upload spooled to the same temporary path
+    os.unlink(path)
+    _generate_pdf(path, pages=2, lines_per_page=3)
+    second = pdf_utils._extract_range(path, 1, 2)
+
+    assert "Page 1, line 2." in first[0] and "line 3." not in first[0]
+    assert "Page 2, line 3." in second[0]
+    assert old_reader.stream.closed
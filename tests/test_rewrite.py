@@ -0,0 +1,62 @@
+import pytest
+
+import granite_utils
+from benchmark import _synthetic_corpus
+from cache_utils import get_cache
+from granite_utils import _build_prompts, _rewrite_cache_key, rewrite_document
+
+class _FakePipe:
+    tokenizer = None
+    model_name = "fake-granite"
+
+def _rewrite(prompt):
+    return "Rewritten " + prompt[-40:]
+
+@pytest.fixture
+def failing_batch(monkeypatch):
+    """
+    Fake generation in which any batch holding the third window fails
+    """
+    text = _synthetic_corpus(20 * 1024)
+    windows, prompts = _build_prompts(text, "neutral", "English", "neutral", _FakePipe())
+    bad = prompts[2]
+
+    def generate(batch):
+        if bad in batch:
+            raise RuntimeError("out of memory")
+        return [_rewrite(prompt) for prompt in batch]
+
+    monkeypatch.setattr(granite_utils, "generate_batch", lambda pipe, batch, budgets, size: generate(batch))
+    monkeypatch.setattr(granite_utils, "_generate_rewrite", lambda pipe, prompt, budget: generate([prompt])[0])
+    monkeypatch.setattr(granite_utils.st, "warning", lambda message: None)
+    return text, windows, prompts
+
+def _cached(prompts):
+    return [get_cache().get_text(_rewrite_cache_key(_FakePipe(), "neutral", "neutral", "English", p)) for p in prompts]
+
+def test_a_failed_batch_only_loses_its_own_windows(failing_batch):
+    text, windows, prompts = failing_batch
+    enhanced, complete = rewrite_document(text, "neutral", "English", "neutral", _FakePipe(), batch_size=4)
+    assert not complete
+    cached = _cached(prompts)
+    assert cached[2] is None
+    # The windows batched together with the failed one fall back to their original text
+    failed = [i for i, chunk in enumerate(cached) if chunk is None]
+    assert len(failed) < len(prompts) // 2
+    for i, prompt in enumerate(prompts):
+        if i not in failed:
+            assert cached[i] == _rewrite(prompt)
+
+def test_remote_replies_are_kept_one_by_one(failing_batch, monkeypatch):
+    text, windows, prompts = failing_batch
+
+    class _RemotePipe(_FakePipe):
+        is_remote = True
+
+        def iter_generate(self, batch, budgets):
+            for prompt in batch:
+                yield (None, "RuntimeError: out of memory") if prompt == prompts[2] else (_rewrite(prompt), None)
+
+    enhanced, complete = rewrite_document(text, "neutral", "English", "neutral", _RemotePipe())
+    assert not complete
+    assert [chunk is None for chunk in _cached(prompts)] == [i == 2 for i in range(len(prompts))]
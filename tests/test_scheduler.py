@@ -0,0 +1,132 @@
+import threading
+import time
+
+import tts_utils
+from benchmark import FakeTTSServer, _SILENT_MP3_FRAME, _fake_watson_client, _synthetic_corpus
+from scheduler_utils import AdaptiveScheduler
+
+VOICE = "en-US_AllisonV3Voice"
+
+def _scheduler(**settings):
+    return AdaptiveScheduler("test", **{"concurrency": 2, "max_concurrency": 16, **settings})
+
+def test_slow_start_grows_concurrency_by_one_per_request():
+    scheduler = _scheduler()
+    for _ in range(4):
+        scheduler.record(100, 0.1)
+    assert scheduler.concurrency == 6
+
+def test_rate_limit_halves_concurrency_and_keeps_size():
+    scheduler = _scheduler(concurrency=8, size=1000, min_size=100, max_size=4000, size_step=100)
+    scheduler.record(100, 0.0, "rate_limited")
+    assert scheduler.concurrency == 4
+    assert scheduler.size == 1000
+
+def test_error_halves_concurrency_and_size():
+    scheduler = _scheduler(concurrency=8, size=1000, min_size=100, max_size=4000, size_step=100)
+    scheduler.record(100, 0.0, "error")
+    assert scheduler.concurrency == 4
+    assert scheduler.size == 500
+
+def test_decrease_waits_one_round_trip_and_ends_slow_start():
+    scheduler = _scheduler(concurrency=8)
+    scheduler.record(100, 0.2)
+    scheduler.record(100, 0.0, "rate_limited")
+    limit = scheduler.concurrency
+    # Requests already in flight when the limit dropped report within the hold
+    scheduler.record(100, 0.0, "rate_limited")
+    assert scheduler.concurrency == limit
+    # Past slow start, a whole round of successes adds one slot
+    time.sleep(0.25)
+    for _ in range(limit):
+        scheduler.record(100, 0.1)
+    assert scheduler.concurrency == limit + 1
+
+def test_rising_latency_per_unit_backs_off():
+    scheduler = _scheduler(concurrency=8, latency_tolerance=2.0)
+    scheduler.record(100, 0.1)
+    before = scheduler.concurrency
+    for _ in range(10):
+        scheduler.record(100, 2.0)
+    assert scheduler.concurrency < before
+
+def test_slots_go_to_the_lowest_priority_first():
+    scheduler = _scheduler(concurrency=1, max_concurrency=1)
+    order = []
+
+    def request(priority):
+        with scheduler.request(priority):
+            order.append(priority)
+
+    with scheduler.request(0):
+        threads = [threading.Thread(target=request, args=(priority,)) for priority in (5, 1, 3)]
+        for thread in threads:
+            thread.start()
+        while len(scheduler._waiting) < len(threads):
+            time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert order == [1, 3, 5]
+
+def test_adaptive_synthesis_completes_in_order_under_a_concurrency_limit(monkeypatch):
+    chunks = []
+    cut = tts_utils.iter_adaptive_chunks
+
+    def recorded_chunks(*args):
+        for chunk in cut(*args):
+            chunks.append(chunk)
+            yield chunk
+
+    monkeypatch.setattr(tts_utils, "iter_adaptive_chunks", recorded_chunks)
+    monkeypatch.setattr(tts_utils, "TTS_BACKOFF_BASE", 0.01)
+    scheduler = AdaptiveScheduler(
+        "watson", concurrency=2, max_concurrency=8, size=300, min_size=150, max_size=4000, size_step=150,
+        classify=tts_utils._classify_tts_error
+    )
+    text = _synthetic_corpus(20 * 1024)
+    with FakeTTSServer(latency=0.02, frames_per_char=0.1, max_concurrent=3) as server:
+        audio = list(tts_utils.iter_synthesized_text_watson(
+            _fake_watson_client(server.url), text, VOICE, scheduler=scheduler
+        ))
+    assert [len(a) // len(_SILENT_MP3_FRAME) for a in audio] == [max(1, int(len(c) * 0.1)) for c in chunks]
+    assert server.counts["ok"] == len(chunks)
+    # Slow start ran into the limit, the rejected requests were retried and the scheduler backed off
+    assert server.counts["rate_limited"] > 0
+    assert scheduler.concurrency < scheduler.max_concurrency
+
+def test_unchanged_text_is_cut_the_same_way_again_whatever_the_size():
+    text = _synthetic_corpus(20 * 1024)
+    with FakeTTSServer(latency=0.0) as server:
+        tts = _fake_watson_client(server.url)
+        first = list(tts_utils.iter_synthesized_text_watson(tts, text, VOICE, scheduler=AdaptiveScheduler(
+            "watson", size=300, min_size=150, max_size=4000, size_step=150
+        )))
+        requests = server.counts["ok"]
+        # The scheduler has since settled on a different size; nothing about the text changed
+        again = list(tts_utils.iter_synthesized_text_watson(tts, text, VOICE, scheduler=AdaptiveScheduler(
+            "watson", size=1200, min_size=150, max_size=4000, size_step=150
+        )))
+    assert again == first
+    assert server.counts["ok"] == requests
+
+def test_every_watson_path_shares_the_process_wide_limit(monkeypatch):
+    import pipeline_utils
+    from scheduler_utils import get_scheduler
+
+    get_scheduler("watson", concurrency=2, max_concurrency=2)
+    text = _synthetic_corpus(8 * 1024)
+    with FakeTTSServer(latency=0.02) as server:
+        tts = _fake_watson_client(server.url)
+        monkeypatch.setattr(pipeline_utils, "get_watson_client", lambda: tts)
+        runs = [
+            lambda: list(pipeline_utils.stream_audiobook(text, max_workers=6)),
+            lambda: tts_utils.synthesize_chunks_watson(tts, tts_utils.split_text_for_tts(text, 300), VOICE, 6),
+            lambda: list(tts_utils.iter_synthesized_text_watson(tts, text, VOICE)),
+        ]
+        threads = [threading.Thread(target=run) for run in runs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert server.counts["ok"] > 0
+    assert server.peak_in_flight <= 2
@@ -0,0 +1,12 @@
+from granite_utils import _pop_sentences
+
+def test_closing_quotes_and_brackets_stay_with_their_sentence():
+    assert _pop_sentences('He said "Hi." Then she left. And') == (['He said "Hi."', "Then she left."], "And")
+
+def test_sentences_split_the_same_however_the_stream_is_cut():
+    buffer, sentences = "", []
+    for piece in ['He said "Hi', ".", '"', " Then", " she left.", " (Quietly.)", " End"]:
+        complete, buffer = _pop_sentences(buffer + piece)
+        sentences.extend(complete)
+    assert sentences == ['He said "Hi."', "Then she left.", "(Quietly.)"]
+    assert buffer == "End"
@@ -0,0 +1,40 @@
+import pytest
+
+from benchmark import FakeTTSServer, _SILENT_MP3_FRAME, _fake_watson_client
+from tts_utils import iter_synthesized_chunks_watson
+
+VOICE = "en-US_AllisonV3Voice"
+
+def _frames(audio):
+    return len(audio) // len(_SILENT_MP3_FRAME)
+
+def _chunks(count, step=40):
+    # Earlier chunks are longer, so they finish last on a server whose latency grows with length
+    return [f"Chunk {i}. " + "x" * (step * (count - i)) for i in range(count)]
+
+def test_chunks_come_back_in_order():
+    chunks = _chunks(12)
+    with FakeTTSServer(latency=0.01, latency_per_char=0.0005, frames_per_char=0.1) as server:
+        audio = list(iter_synthesized_chunks_watson(_fake_watson_client(server.url), chunks, VOICE, max_workers=6))
+    assert [_frames(a) for a in audio] == [int(len(chunk) * 0.1) for chunk in chunks]
+    assert server.counts["ok"] == len(chunks)
+
+def test_chunk_failing_after_retries_fails_the_conversion():
+    chunks = _chunks(4)
+    with FakeTTSServer(latency=0.0, error_rate=1.0) as server:
+        with pytest.raises(RuntimeError, match=r"TTS chunk 1 of 4 failed after 1 retries"):
+            list(iter_synthesized_chunks_watson(
+                _fake_watson_client(server.url), chunks, VOICE, max_workers=2, max_retries=1
+            ))
+    # Every attempt reached the server; nothing was skipped silently
+    assert server.counts["error"] >= 2
+    assert server.counts["ok"] == 0
+
+def test_rate_limited_chunks_are_retried():
+    chunks = _chunks(16, step=5)
+    with FakeTTSServer(latency=0.02, max_concurrent=2) as server:
+        audio = list(iter_synthesized_chunks_watson(
+            _fake_watson_client(server.url), chunks, VOICE, max_workers=6, max_retries=20
+        ))
+    assert server.counts["rate_limited"] > 0
+    assert [_frames(a) for a in audio] == [int(len(chunk) * 0.1) for chunk in chunks]
@@ -0,0 +1,51 @@
+import re
+
+from benchmark import _synthetic_corpus
+from document_utils import Document, iter_paragraphs
+from granite_utils import _build_prompts, count_tokens, sentence_token_counts, split_text_into_windows
+
+class _CharTokenizer:
+    """
+    Counts one token per three characters, through both the single and the batch interface
+    """
+
+    def encode(self, text, add_special_tokens=True):
+        return list(range(len(text) // 3 + 1))
+
+    def __call__(self, texts, add_special_tokens=True):
+        return {"input_ids": [self.encode(text) for text in texts]}
+
+def _tail(text, tokenizer, max_tokens):
+    # Reference: the trailing sentences of the window text, measured one by one
+    sentences = [str(sentence) for sentence in Document(text).sentences()]
+    kept, used = [], 0
+    for sentence in reversed(sentences):
+        used += count_tokens(sentence, tokenizer)
+        if used > max_tokens:
+            break
+        kept.insert(0, sentence)
+    return " ".join(kept)
+
+def test_sentence_counts_match_counting_each_sentence():
+    document = Document(_synthetic_corpus(20 * 1024))
+    for tokenizer in (None, _CharTokenizer()):
+        assert list(sentence_token_counts(document, tokenizer)) == [
+            count_tokens(str(sentence), tokenizer) for sentence in document.sentences()
+        ]
+
+def test_windows_fit_the_budget_and_carry_their_tails():
+    text = _synthetic_corpus(40 * 1024) + "\n\n" + " ".join(["word"] * 900) + ". Short end."
+    for tokenizer in (None, _CharTokenizer()):
+        windows = split_text_into_windows(text, tokenizer, max_tokens=200, context_tokens=40)
+        assert all(window["tokens"] <= 200 for window in windows)
+        for window in windows:
+            assert window["tail"] == _tail(window["text"], tokenizer, 40)
+
+def test_prompts_take_context_from_the_previous_window():
+    windows, prompts = _build_prompts(_synthetic_corpus(20 * 1024), "neutral", "English", "neutral", None)
+    for previous, prompt in zip(windows, prompts[1:]):
+        assert previous["tail"] in prompt
+
+def test_iter_paragraphs_matches_re_split():
+    for text in ("", "one", "one\n\ntwo", "one\n \n\ntwo\n\n", "\n\none\n\t\ntwo"):
+        assert list(iter_paragraphs(text)) == re.split(r"\n\s*\n", text)
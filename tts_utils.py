@@ -1,109 +1,479 @@
+import os
+import random
 import threading
-from pydub import AudioSegment
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import requests
+from metrics_utils import span, count, set_gauge
+from mp3_utils import Mp3ConcatWriter
+from scheduler_utils import get_scheduler
+
+# Concurrency and retry policy for chunked Watson synthesis
+TTS_MAX_WORKERS = int(os.getenv("ECHOVERSE_TTS_WORKERS", "8"))
+TTS_MAX_RETRIES = 4
+TTS_BACKOFF_BASE = 0.5
+TTS_BACKOFF_MAX = 30.0
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Adaptive Watson scheduling: chunks start short, so the first audio arrives quickly,
+# and chunk size and concurrency grow while the service keeps up
+TTS_INITIAL_CHUNK_CHARS = 300
+TTS_MIN_CHUNK_CHARS = 150
+TTS_CHUNK_STEP_CHARS = 150
+TTS_INITIAL_WORKERS = 2
+TTS_TARGET_LATENCY = 5.0
 
-def text_to_mp3_watson_fast(text, voice="en-US_AllisonV3Voice", filename=None, chunk_size=300):
+def text_to_mp3_watson_fast(text, voice="en-US_AllisonV3Voice", filename=None, chunk_size=None,
+                            max_workers=None, max_retries=TTS_MAX_RETRIES):
     """
     Faster Watson TTS: Split text into chunks, synthesize in parallel, merge audio
     Args:
         text (str): Text to convert to speech
         voice (str): IBM Watson voice name
         filename (str): Output filename for the MP3 file
-        chunk_size (int): Number of characters per chunk
+        chunk_size (int): Number of characters per chunk (None lets the
+            adaptive scheduler size chunks and concurrency)
+        max_workers (int): Concurrent Watson requests with a fixed chunk_size (defaults to TTS_MAX_WORKERS)
+        max_retries (int): Retries per chunk before the conversion fails
     Returns:
         str: Path to the generated MP3 file
     """
     try:
-        api_key = os.getenv("IBM_WATSON_TTS_APIKEY")
-        url = os.getenv("IBM_WATSON_TTS_URL")
-        if not api_key or not url:
-            raise ValueError("IBM Watson TTS credentials not found in environment variables.")
-        authenticator = IAMAuthenticator(api_key)
-        tts = TextToSpeechV1(authenticator=authenticator)
-        tts.set_service_url(url)
-        cleaned_text = clean_text_for_tts(text)
-        if not cleaned_text.strip():
-            raise ValueError("No valid text provided for TTS conversion")
-        # Split text into chunks
-        sentences = cleaned_text.split('. ')
-        chunks = []
-        current = ''
-        for s in sentences:
-            if len(current) + len(s) + 2 > chunk_size:
-                chunks.append(current.strip())
-                current = s + '. '
-            else:
-                current += s + '. '
-        if current.strip():
-            chunks.append(current.strip())
-        audio_segments = [None] * len(chunks)
-        def synth_chunk(idx, chunk):
-            response = tts.synthesize(chunk, voice=voice, accept='audio/mp3').get_result()
-            audio_segments[idx] = AudioSegment.from_file(io.BytesIO(response.content), format="mp3")
-        threads = []
-        for i, chunk in enumerate(chunks):
-            t = threading.Thread(target=synth_chunk, args=(i, chunk))
-            t.start()
-            threads.append(t)
-        for t in threads:
-            t.join()
-        # Filter out None segments
-        valid_segments = [seg for seg in audio_segments if seg is not None]
-        if not valid_segments:
-            raise RuntimeError("All TTS chunks failed to synthesize. No audio output generated.")
-        final_audio = valid_segments[0]
-        for seg in valid_segments[1:]:
-            final_audio += seg
+        tts = get_watson_client()
+        if chunk_size is None:
+            audio_chunks = iter_synthesized_text_watson(tts, text, voice, max_retries=max_retries)
+        else:
+            chunks = split_text_for_tts(text, chunk_size)
+            if not chunks:
+                raise ValueError("No valid text provided for TTS conversion")
+            audio_chunks = iter_synthesized_chunks_watson(
+                tts, chunks, voice, max_workers=max_workers, max_retries=max_retries
+            )
         if filename is None:
             temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
             filename = temp_file.name
             temp_file.close()
-        final_audio.export(filename, format="mp3")
+        # Join chunks frame by frame as they arrive instead of decoding and re-encoding
+        with open(filename, 'wb') as audio_file, Mp3ConcatWriter(audio_file) as writer:
+            for audio_bytes in audio_chunks:
+                writer.append(audio_bytes)
         return filename
     except Exception as e:
         st.error(f"IBM Watson TTS fast conversion failed: {str(e)}")
         raise e
-import os
+import re
 from ibm_watson import TextToSpeechV1
+from ibm_cloud_sdk_core import ApiException
 from ibm_cloud_sdk_core.authenticators import IAMAuthenticator
+from cache_utils import get_cache, make_cache_key
+from document_utils import iter_paragraphs
+
+_watson_clients = {}
+_watson_clients_lock = threading.Lock()
+
+def get_watson_client(api_key=None, url=None, iam_url=None):
+    """
+    Return the process-wide Watson TTS client for a set of credentials
+
+    The client is shared by every Streamlit session in the process, so the
+    IAM token is exchanged once and refreshed only when it expires, and
+    requests reuse keep-alive connections from a pool sized for the TTS
+    worker pool.
+
+    Args:
+        api_key (str): IBM Cloud API key (defaults to IBM_WATSON_TTS_APIKEY)
+        url (str): Service URL (defaults to IBM_WATSON_TTS_URL)
+        iam_url (str): IAM token endpoint override (defaults to IBM Cloud IAM)
+
+    Returns:
+        TextToSpeechV1: Configured client
+    """
+    api_key = api_key or os.getenv("IBM_WATSON_TTS_APIKEY")
+    url = url or os.getenv("IBM_WATSON_TTS_URL")
+    if not api_key or not url:
+        raise ValueError("IBM Watson TTS credentials not found in environment variables.")
+    key = (api_key, url, iam_url)
+    with _watson_clients_lock:
+        tts = _watson_clients.get(key)
+        if tts is None:
+            authenticator = IAMAuthenticator(api_key, url=iam_url) if iam_url else IAMAuthenticator(api_key)
+            tts = TextToSpeechV1(authenticator=authenticator)
+            tts.set_service_url(url)
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=TTS_MAX_WORKERS)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            tts.set_http_client(session)
+            _watson_clients[key] = tts
+        return tts
+
+# Watson rejects requests over 5 KB of text
+WATSON_MAX_CHUNK_CHARS = 4000
 
-def text_to_mp3_watson(text, voice="en-US_AllisonV3Voice", filename=None):
+def text_to_mp3_watson(text, voice="en-US_AllisonV3Voice", filename=None, chunk_keys=None):
     """
     Convert text to MP3 using IBM Watson Text-to-Speech with voice selection
+
+    Chunk size and concurrency are tuned live by the shared Watson scheduler.
+
     Args:
         text (str): Text to convert to speech
         voice (str): IBM Watson voice name
         filename (str): Output filename for the MP3 file
+        chunk_keys (list): If given, the cache key of each chunk's audio is appended in order
     Returns:
         str: Path to the generated MP3 file
     """
     try:
-        api_key = os.getenv("IBM_WATSON_TTS_APIKEY")
-        url = os.getenv("IBM_WATSON_TTS_URL")
-        if not api_key or not url:
-            raise ValueError("IBM Watson TTS credentials not found in environment variables.")
-        authenticator = IAMAuthenticator(api_key)
-        tts = TextToSpeechV1(authenticator=authenticator)
-        tts.set_service_url(url)
-        cleaned_text = clean_text_for_tts(text)
-        if not cleaned_text.strip():
-            raise ValueError("No valid text provided for TTS conversion")
+        tts = get_watson_client()
         if filename is None:
             temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
             filename = temp_file.name
             temp_file.close()
-        response = tts.synthesize(
-            cleaned_text,
-            voice=voice,
-            accept='audio/mp3'
-        ).get_result()
-        with open(filename, 'wb') as audio_file:
-            audio_file.write(response.content)
+        with open(filename, 'wb') as audio_file, Mp3ConcatWriter(audio_file) as writer:
+            for audio_bytes in iter_synthesized_text_watson(tts, text, voice, chunk_keys=chunk_keys):
+                writer.append(audio_bytes)
         return filename
     except Exception as e:
         st.error(f"IBM Watson TTS conversion failed: {str(e)}")
         raise e
+
+def split_text_for_tts(text, chunk_size):
+    """
+    Split text into cleaned TTS chunks that never span a paragraph break
+
+    Keeping chunks inside paragraphs means editing one paragraph leaves the
+    chunks (and cached audio) of every other paragraph unchanged. Chunks are
+    packed from whole sentences; a single sentence longer than chunk_size is
+    split on the last space that fits.
+
+    Args:
+        text (str): Raw text input
+        chunk_size (int): Maximum number of characters per chunk
+
+    Returns:
+        list[str]: Cleaned chunks in reading order
+    """
+    chunks = []
+    for paragraph in iter_paragraphs(text or ""):
+        normalized, boundaries = normalize_for_tts(paragraph)
+        start = 0
+        end = 0
+        for boundary in boundaries:
+            if boundary - start > chunk_size and end > start:
+                chunks.append(normalized[start:end].strip())
+                start = end
+            while boundary - start > chunk_size:
+                cut = normalized.rfind(" ", start + 1, start + chunk_size)
+                cut = cut if cut > start else start + chunk_size
+                chunks.append(normalized[start:cut].strip())
+                start = cut
+            end = boundary
+        if end > start:
+            chunks.append(normalized[start:end].strip())
+    return [chunk for chunk in chunks if chunk.strip(' .')]
+
+def _audio_cache_key(voice, chunk):
+    return make_cache_key("watson", voice, "audio/mp3", chunk)
+
+def synthesize_chunk_watson(tts, chunk, voice, scheduler=None, priority=0):
+    """
+    Synthesize one chunk with Watson, reusing cached MP3 bytes when available
+
+    Args:
+        tts: Configured TextToSpeechV1 client
+        chunk (str): Cleaned text chunk
+        voice (str): IBM Watson voice name
+        scheduler (AdaptiveScheduler): Scheduler granting the request slot, if any
+        priority (int): Slot priority, lower first (the chunk's reading position)
+
+    Returns:
+        bytes: MP3 audio for the chunk
+    """
+    cache = get_cache()
+    key = _audio_cache_key(voice, chunk)
+    audio_bytes = cache.get(key)
+    if audio_bytes is None:
+        slot = scheduler.request(priority, len(chunk)) if scheduler else nullcontext()
+        with slot, span("tts.request", chars=len(chunk)) as s:
+            response = tts.synthesize(chunk, voice=voice, accept='audio/mp3').get_result()
+            audio_bytes = response.content
+            s["bytes"] = len(audio_bytes)
+        cache.put(key, audio_bytes)
+    else:
+        count("tts.cache_hits")
+    return audio_bytes
+
+class _RateLimitGate:
+    """
+    Shared pause honoured by every worker after the service signals a rate limit
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._resume_at = 0.0
+
+    def wait(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+def _retry_delay(attempt, error=None):
+    """
+    Exponential backoff with jitter, preferring the server's Retry-After header
+    """
+    response = getattr(error, "http_response", None)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), TTS_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return min(TTS_BACKOFF_BASE * (2 ** attempt), TTS_BACKOFF_MAX) * random.uniform(0.5, 1.0)
+
+def synthesize_chunk_with_retry(tts, chunk, voice, max_retries=TTS_MAX_RETRIES, gate=None, scheduler=None,
+                                priority=0):
+    """
+    Synthesize one chunk, retrying transient failures with exponential backoff
+
+    Args:
+        tts: Configured TextToSpeechV1 client
+        chunk (str): Cleaned text chunk
+        voice (str): IBM Watson voice name
+        max_retries (int): Retries after the first attempt
+        gate (_RateLimitGate): Pause shared with other workers after a 429
+        scheduler (AdaptiveScheduler): Scheduler granting each attempt its slot, if any
+        priority (int): Slot priority, lower first
+
+    Returns:
+        bytes: MP3 audio for the chunk
+    """
+    gate = gate or _RateLimitGate()
+    attempt = 0
+    while True:
+        gate.wait()
+        try:
+            return synthesize_chunk_watson(tts, chunk, voice, scheduler, priority)
+        except ApiException as e:
+            if e.code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+                raise
+            delay = _retry_delay(attempt, e)
+            if e.code == 429:
+                count("tts.rate_limited")
+                gate.pause(delay)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt >= max_retries:
+                raise
+            delay = _retry_delay(attempt)
+        count("tts.retries")
+        time.sleep(delay)
+        attempt += 1
+
+def iter_synthesized_chunks_watson(tts, chunks, voice, max_workers=None, max_retries=TTS_MAX_RETRIES, scheduler=None):
+    """
+    Synthesize chunks on a bounded worker pool, yielding MP3 bytes in chunk order
+
+    Transient failures (rate limits, 5xx, connection errors) are retried with
+    exponential backoff. A 429 pauses every worker, not just the one that hit it.
+    Only a bounded window of chunks is in flight or buffered at any time, so
+    memory does not grow with the length of the book. Every request takes a
+    slot from the scheduler, so max_workers only caps this conversion while
+    the scheduler bounds all Watson requests of the process together.
+
+    Args:
+        tts: Configured TextToSpeechV1 client
+        chunks (list[str]): Cleaned text chunks
+        voice (str): IBM Watson voice name
+        max_workers (int): Concurrent requests of this conversion at most (defaults to TTS_MAX_WORKERS)
+        max_retries (int): Retries per chunk after the first attempt
+        scheduler (AdaptiveScheduler): Defaults to the shared Watson scheduler
+
+    Yields:
+        bytes: MP3 audio per chunk, in chunk order
+
+    Raises:
+        RuntimeError: If any chunk still fails after its retries
+    """
+    scheduler = scheduler or get_tts_scheduler()
+    gate = _RateLimitGate()
+    workers = max(1, min(max_workers or TTS_MAX_WORKERS, len(chunks)))
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        in_flight = deque()
+        next_chunk = 0
+        for i in range(len(chunks)):
+            while next_chunk < len(chunks) and len(in_flight) < workers * 2:
+                in_flight.append(pool.submit(
+                    synthesize_chunk_with_retry, tts, chunks[next_chunk], voice, max_retries, gate, scheduler,
+                    next_chunk
+                ))
+                next_chunk += 1
+            set_gauge("tts.in_flight", len(in_flight))
+            try:
+                audio = in_flight.popleft().result()
+            except Exception as e:
+                raise RuntimeError(
+                    f"TTS chunk {i + 1} of {len(chunks)} failed after {max_retries} retries: {str(e)}"
+                ) from e
+            yield audio
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def _classify_tts_error(error):
+    """
+    Map a failed Watson request to a scheduler outcome
+    """
+    if isinstance(error, ApiException):
+        if error.code == 429:
+            return "rate_limited"
+        return "error" if error.code in RETRYABLE_STATUS_CODES else None
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return "error"
+    return None
+
+def get_tts_scheduler():
+    """
+    Return the process-wide adaptive scheduler for Watson requests
+    """
+    return get_scheduler(
+        "watson",
+        concurrency=TTS_INITIAL_WORKERS,
+        max_concurrency=TTS_MAX_WORKERS,
+        size=TTS_INITIAL_CHUNK_CHARS,
+        min_size=TTS_MIN_CHUNK_CHARS,
+        max_size=WATSON_MAX_CHUNK_CHARS,
+        size_step=TTS_CHUNK_STEP_CHARS,
+        target_latency=TTS_TARGET_LATENCY,
+        classify=_classify_tts_error
+    )
+
+def iter_adaptive_chunks(text, scheduler, voice=None):
+    """
+    Cut text into TTS chunks as long as the scheduler's size at the moment each is cut
+
+    Chunks are packed from the pieces split_text_for_tts makes at the
+    scheduler's minimum size, so they still end on sentence boundaries and
+    never span a paragraph break. With a voice, the way each paragraph was
+    cut is remembered in the cache, and an unchanged paragraph whose audio
+    is still cached is cut the same way again, whatever the scheduler's size
+    is now, so its chunks are cache hits instead of new requests.
+
+    Yields:
+        str: Cleaned chunks in reading order
+    """
+    cache = get_cache() if voice else None
+    for paragraph in iter_paragraphs(text or ""):
+        pieces = split_text_for_tts(paragraph, scheduler.min_size)
+        if not pieces:
+            continue
+        cut_key = make_cache_key("watson-cut", voice, scheduler.min_size, paragraph) if cache else None
+        runs = _cached_cut(cache, cut_key, pieces, voice) if cache else None
+        if runs is None:
+            runs = []
+            for piece in pieces:
+                if runs and runs[-1][1] + 1 + len(piece) <= scheduler.size:
+                    runs[-1] = (runs[-1][0] + 1, runs[-1][1] + 1 + len(piece))
+                else:
+                    runs.append((1, len(piece)))
+            runs = [pieces_in_chunk for pieces_in_chunk, _ in runs]
+            if cache:
+                cache.put_text(cut_key, ",".join(map(str, runs)))
+        start = 0
+        for pieces_in_chunk in runs:
+            yield " ".join(pieces[start:start + pieces_in_chunk])
+            start += pieces_in_chunk
+
+def _cached_cut(cache, cut_key, pieces, voice):
+    """
+    Return the piece count of each chunk a paragraph was last cut into, if any of that audio is still cached
+    """
+    stored = cache.get_text(cut_key)
+    if not stored:
+        return None
+    runs = [int(run) for run in stored.split(",")]
+    if sum(runs) != len(pieces):
+        return None
+    start = 0
+    for pieces_in_chunk in runs:
+        if cache.contains(_audio_cache_key(voice, " ".join(pieces[start:start + pieces_in_chunk]))):
+            return runs
+        start += pieces_in_chunk
+    return None
+
+def iter_synthesized_text_watson(tts, text, voice, scheduler=None, max_retries=TTS_MAX_RETRIES, chunk_keys=None):
+    """
+    Synthesize text with adaptively sized chunks and concurrency, yielding MP3 bytes in order
+
+    Chunks are cut just before they are submitted, at the size the scheduler
+    has learned so far, and only a short way ahead of the oldest unfinished
+    chunk. Request slots go to the earliest waiting chunk first, so the
+    opening of the book is ready before later chunks compete for the service.
+
+    Args:
+        tts: Configured TextToSpeechV1 client
+        text (str): Text to synthesize
+        voice (str): IBM Watson voice name
+        scheduler (AdaptiveScheduler): Defaults to the shared Watson scheduler
+        max_retries (int): Retries per chunk after the first attempt
+        chunk_keys (list): If given, the cache key of each chunk's audio is appended as it is cut
+
+    Yields:
+        bytes: MP3 audio per chunk, in reading order
+
+    Raises:
+        ValueError: If the text holds nothing to synthesize
+        RuntimeError: If any chunk still fails after its retries
+    """
+    scheduler = scheduler or get_tts_scheduler()
+    gate = _RateLimitGate()
+    chunks = iter_adaptive_chunks(text, scheduler, voice)
+    pool = ThreadPoolExecutor(max_workers=scheduler.max_concurrency)
+    try:
+        in_flight = deque()
+        submitted = 0
+        finished = 0
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < scheduler.concurrency * 2:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                if chunk_keys is not None:
+                    chunk_keys.append(_audio_cache_key(voice, chunk))
+                in_flight.append(pool.submit(
+                    synthesize_chunk_with_retry, tts, chunk, voice, max_retries, gate, scheduler, submitted
+                ))
+                submitted += 1
+            if not in_flight:
+                break
+            set_gauge("tts.in_flight", len(in_flight))
+            try:
+                audio = in_flight.popleft().result()
+            except Exception as e:
+                raise RuntimeError(f"TTS chunk {finished + 1} failed after {max_retries} retries: {str(e)}") from e
+            finished += 1
+            yield audio
+        if not submitted:
+            raise ValueError("No valid text provided for TTS conversion")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def synthesize_chunks_watson(tts, chunks, voice, max_workers=None, max_retries=TTS_MAX_RETRIES, scheduler=None):
+    """
+    Synthesize chunks on a bounded worker pool with per-chunk retries
+
+    Returns:
+        list[bytes]: MP3 audio per chunk, in chunk order
+    """
+    return list(iter_synthesized_chunks_watson(tts, chunks, voice, max_workers, max_retries, scheduler))
+
 from gtts import gTTS
-import io
 import tempfile
 import streamlit as st
 
@@ -141,7 +511,8 @@ def text_to_mp3_gtts(text, language="en", filename=None):
             temp_file.close()
         
         # Save to file
-        tts.save(filename)
+        with span("tts.gtts", chars=len(cleaned_text)):
+            tts.save(filename)
         
         return filename
     
@@ -149,12 +520,121 @@ def text_to_mp3_gtts(text, language="en", filename=None):
         st.error(f"TTS conversion failed: {str(e)}")
         raise e
 
-def clean_text_for_tts(text):
+# Typographic characters mapped to plain equivalents the TTS engines read well
+_TTS_TRANSLATION = {
+    "\u201c": '"',
+    "\u201d": '"',
+    "\u2018": "'",
+    "\u2019": "'",
+    "\u2014": "-",
+    "\u2013": "-",
+    "\u2026": "...",
+}
+# End of a sentence: terminal punctuation plus any closing quotes or brackets
+_SENTENCE_END = re.compile(r"[.!?][.!?\"')\]]*(?= )")
+_SENTENCE_TAIL_CHARS = ".!?\"')]"
+
+def _translate_for_tts(text):
+    """
+    Apply the translation table, touching only characters that occur in the text
+
+    str.translate is an order of magnitude slower than str.replace on
+    non-ASCII text in CPython, and most inputs contain few of these characters.
+    """
+    if text.isascii():
+        return text
+    for old, new in _TTS_TRANSLATION.items():
+        if old in text:
+            text = text.replace(old, new)
+    return text
+
+def _sentence_tail(text):
+    """
+    Return the terminal punctuation (with closers) at the very end of text, if any
+    """
+    stripped = text.rstrip(_SENTENCE_TAIL_CHARS)
+    tail = text[len(stripped):]
+    for i, char in enumerate(tail):
+        if char in ".!?":
+            return tail[i:]
+    return ""
+
+class TextNormalizer:
+    """
+    Streaming TTS text normalizer
+
+    Feed raw text in any number of chunks; each call returns the normalized
+    text for that chunk together with the absolute offsets (in the normalized
+    output) where sentences end. Whitespace runs that span chunk boundaries
+    collapse exactly as if the text had been fed in one piece, and nothing is
+    truncated.
+    """
+
+    def __init__(self):
+        self.length = 0
+        self._pending_space = False
+        # Terminal punctuation at the very end of the output so far, for sentence
+        # ends whose following space only arrives with the next chunk
+        self._tail = ""
+
+    def feed(self, chunk):
+        """
+        Normalize one chunk of raw text
+
+        Returns:
+            tuple[str, list[int]]: Normalized text and sentence-end offsets
+        """
+        if not chunk:
+            return "", []
+        text = " ".join(_translate_for_tts(chunk).split())
+        if chunk[0].isspace():
+            self._pending_space = True
+        if not text:
+            return "", []
+
+        if self.length and self._pending_space:
+            text = " " + text
+        scanned = self._tail + text
+        origin = self.length - len(self._tail)
+        boundaries = [origin + m.end() for m in _SENTENCE_END.finditer(scanned)]
+        self._tail = _sentence_tail(scanned)
+        self.length += len(text)
+        self._pending_space = chunk[-1].isspace()
+        return text, boundaries
+
+    def close(self):
+        """
+        Finish the stream, terminating the last sentence if needed
+
+        Returns:
+            tuple[str, list[int]]: Any closing punctuation and the final sentence end
+        """
+        if not self.length:
+            return "", []
+        suffix = "" if self._tail else "."
+        self.length += len(suffix)
+        self._tail = ""
+        return suffix, [self.length]
+
+def normalize_for_tts(text):
+    """
+    Normalize text for TTS in a single pass and locate its sentence ends
+
+    Returns:
+        tuple[str, list[int]]: Normalized text and sentence-end offsets
+    """
+    normalizer = TextNormalizer()
+    body, boundaries = normalizer.feed(text or "")
+    suffix, final = normalizer.close()
+    return body + suffix, boundaries + final
+
+def clean_text_for_tts(text, max_length=None):
     """
     Clean and prepare text for better TTS output
     
     Args:
         text (str): Raw text input
+        max_length (int): Optional cap, applied at the last sentence end that fits
     
     Returns:
         str: Cleaned text suitable for TTS
@@ -162,47 +642,13 @@ def clean_text_for_tts(text):
     if not text:
         return ""
     
-    # Remove excessive whitespace
-    text = " ".join(text.split())
-    
-    # Remove or replace problematic characters
-    replacements = {
-        """: '"',
-        """: '"',
-        "'": "'",
-        "'": "'",
-        "—": "-",
-        "–": "-",
-        "…": "...",
-        "\n\n": ". ",
-        "\n": " ",
-        "\t": " "
-    }
-    
-    for old, new in replacements.items():
-        text = text.replace(old, new)
-    
-    # Ensure sentences end properly
-    text = text.strip()
-    if text and not text.endswith(('.', '!', '?')):
-        text += '.'
-    
-    # Limit text length for TTS (gTTS has character limits)
-    max_length = 4500  # Conservative limit for gTTS
-    if len(text) > max_length:
-        # Try to cut at sentence boundary
-        sentences = text.split('. ')
-        truncated = ""
-        for sentence in sentences:
-            if len(truncated + sentence + '. ') > max_length:
-                break
-            truncated += sentence + '. '
-        text = truncated.strip()
-        
-        # If still too long, hard truncate
-        if len(text) > max_length:
-            text = text[:max_length-3] + "..."
-    
+    text, boundaries = normalize_for_tts(text)
+    if max_length is not None and len(text) > max_length:
+        fitting = [end for end in boundaries if end <= max_length]
+        if fitting:
+            text = text[:fitting[-1]]
+        else:
+            text = text[:max_length - 3] + "..."
     return text
 
 def get_supported_languages():